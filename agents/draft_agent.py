@@ -1,17 +1,25 @@
 import os
 import json
 import re
-import google.generativeai as genai
+import hashlib
 from dotenv import load_dotenv
+from core.llm_client import get_client
+from utils.cache import DiskCache, LRUCache, TieredCache
 from utils.observability import logger, log_trace
+from utils.query_normalizer import normalize_query
+from utils.singleflight import SingleFlight
 from tools.web_search_tool import web_search_tool
 
 load_dotenv()
 
-# Configure Gemini
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
+# Draft cache: identical tickets (same normalized text, KB articles, category,
+# severity and model) reuse the reply instead of calling the model again.
+# Drafts without KB hits aren't cached: their web-search fallback goes stale.
+# Memory LRU in front of an SQLite file that survives restarts ("" = memory only)
+DRAFT_CACHE_SIZE = int(os.getenv("DRAFT_CACHE_SIZE", "1024"))
+DRAFT_CACHE_TTL = float(os.getenv("DRAFT_CACHE_TTL", "86400"))  # seconds, 0 = no expiry
+DRAFT_CACHE_PATH = os.getenv("DRAFT_CACHE_PATH", "core/draft_cache.db")
+DRAFT_CACHE_DISK_SIZE = int(os.getenv("DRAFT_CACHE_DISK_SIZE", "10000"))
 
 
 # ---------- Helper Functions ---------- #
@@ -29,6 +37,93 @@ def extract_json(text):
     return None
 
 
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class JSONFieldStream:
+    """
+    Incrementally decodes one top-level string field (e.g. "body") of a JSON
+    object arriving in chunks: feed() returns the field's newly decoded text
+    as soon as it streams in, before the object is complete. Text before
+    the first "{" (like a ```json fence) is skipped, and an escape sequence
+    split across chunks is held back until it's whole.
+    """
+
+    def __init__(self, field: str = "body"):
+        self.field = field
+        self.done = False  # the field's closing quote has been seen
+        self._depth = 0
+        self._in_string = False
+        self._is_key = False
+        self._capturing = False
+        self._expect_key = False
+        self._field_next = False  # the last key was `field` and its ":" followed
+        self._key = []
+        self._last_key = None
+        self._escape = None  # None, "" (after a backslash) or the \u digits so far
+        self._high_surrogate = None
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        for ch in chunk:
+            if self._in_string:
+                self._string_char(ch, out)
+            elif ch == '"':
+                self._in_string = True
+                self._is_key = self._depth == 1 and self._expect_key
+                self._capturing = (not self._is_key and self._depth == 1 and self._field_next
+                                   and not self.done)
+                self._key = []
+            elif ch in "{[":
+                self._depth += 1
+                self._expect_key = ch == "{" and self._depth == 1
+            elif ch in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and ch == ":":
+                self._expect_key = False
+                self._field_next = self._last_key == self.field
+            elif self._depth == 1 and ch == ",":
+                self._expect_key = True
+                self._field_next = False
+        return "".join(out)
+
+    def _emit(self, text: str, out: list):
+        if self._capturing:
+            out.append(text)
+        elif self._is_key:
+            self._key.append(text)
+
+    def _string_char(self, ch: str, out: list):
+        if self._escape is None:
+            if ch == "\\":
+                self._escape = ""
+            elif ch == '"':
+                self._in_string = False
+                if self._is_key:
+                    self._last_key = "".join(self._key)
+                if self._capturing:
+                    self._capturing = False
+                    self.done = True
+                self._field_next = False
+            else:
+                self._emit(ch, out)
+        elif self._escape == "" and ch != "u":
+            self._escape = None
+            self._emit(_ESCAPES.get(ch, ch), out)
+        else:
+            self._escape += ch
+            if len(self._escape) == 5:  # "u" + 4 hex digits
+                code = int(self._escape[1:], 16)
+                self._escape = None
+                if 0xD800 <= code < 0xDC00:
+                    self._high_surrogate = code
+                    return
+                if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+                    code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+                self._high_surrogate = None
+                self._emit(chr(code), out)
+
+
 def sanitize(text):
     """
     Remove any hallucinated instructions or system prompts.
@@ -39,25 +134,66 @@ def sanitize(text):
     return text.strip()
 
 
+def kb_snippet(item):
+    """Text of a KB/web result used in the prompt, trying multiple fields."""
+    for key in ('snippet', 'content', 'summary', 'description'):
+        val = item.get(key)
+        if val:
+            # Truncate if too long
+            return val if len(val) <= 500 else val[:500] + "...<TRUNCATED>"
+    return item.get('title', 'KB Result')
+
+
+def draft_cache_key(ticket_content, kb_results, triage_info, model_name):
+    """
+    Hash of everything a cached draft depends on. KB articles count by id
+    and by the text the prompt shows, so an edited article misses. Customer
+    history is left out: it changes with every ticket.
+    """
+    triage_info = triage_info or {}
+    kb = [[item.get("id"), item.get("title"), kb_snippet(item)] for item in kb_results or []]
+    payload = json.dumps([normalize_query(ticket_content or ""), kb, triage_info.get("category"),
+                          triage_info.get("severity"), model_name], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_draft_cache():
+    disk = None
+    if DRAFT_CACHE_PATH:
+        try:
+            disk = DiskCache("draft_disk", DRAFT_CACHE_PATH, maxsize=DRAFT_CACHE_DISK_SIZE, ttl=DRAFT_CACHE_TTL)
+        except Exception as e:
+            logger.log_event("draft_agent.cache_error", {"path": DRAFT_CACHE_PATH, "error": str(e)}, level="ERROR")
+    return TieredCache(LRUCache("draft", maxsize=DRAFT_CACHE_SIZE, ttl=DRAFT_CACHE_TTL), disk)
+
+
 # ---------- Agent Class ---------- #
 
 class DraftReplyAgent:
-    def __init__(self, model_name=None):
-        self.model_name = model_name or os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite-preview-02-05")
-        self.model = genai.GenerativeModel(self.model_name)
+    def __init__(self, model_name=None, backend=None):
+        # Shared client for LLM_BACKEND (core/llm_client.py) unless a backend is passed in
+        self.llm = backend or get_client(model_name=model_name)
+        self.model_name = self.llm.model_name
+        self.cache = make_draft_cache()
+        # Concurrent identical tickets (same cache key) share one model call
+        self.flight = SingleFlight("draft")
 
     def generate_draft(self, ticket_content: str, kb_results: list, history: list = None, triage_info: dict = None):
         """
         Generate a structured and professional customer support reply.
         """
 
-        if not GOOGLE_API_KEY:
-            return json.dumps({
-                "subject": "Missing API Key",
-                "body": "GOOGLE_API_KEY not found. Cannot generate draft.",
-                "action": "error"
-            })
-        
+        if not self.llm.available:
+            return self._missing_key_reply()
+
+        key = draft_cache_key(ticket_content, kb_results, triage_info, self._model_id())
+        cached = self._cached(key) if kb_results else None
+        if cached is not None:
+            return cached
+        return self.flight.do(key, self._generate, key, ticket_content, kb_results, history, triage_info)
+
+    def _generate(self, key: str, ticket_content: str, kb_results: list, history: list = None, triage_info: dict = None):
+        cacheable = bool(kb_results)
         # Fallback to Web Search if KB is empty
         if not kb_results:
             logger.log_event("draft_agent.web_fallback", {"query": ticket_content})
@@ -65,17 +201,164 @@ class DraftReplyAgent:
             if web_results:
                 kb_results = web_results
 
+        prompt = self._build_prompt(ticket_content, kb_results, history, triage_info)
+
+        try:
+            return self._store(key, self._draft_text(self.llm.generate(prompt)), cacheable)
+        except Exception as e:
+            logger.log_event("draft_agent.error", {"error": str(e)})
+            return "Error generating draft reply. Please check logs."
+
+    async def agenerate_draft(self, ticket_content: str, kb_results: list, history: list = None, triage_info: dict = None):
+        """
+        Async generate_draft(): the model call uses the backend's async
+        client and the web-search fallback runs in a worker thread, so the
+        event loop keeps serving other tickets while this one waits.
+        """
+
+        if not self.llm.available:
+            return self._missing_key_reply()
+
+        key = draft_cache_key(ticket_content, kb_results, triage_info, self._model_id())
+        cached = self._cached(key) if kb_results else None
+        if cached is not None:
+            return cached
+        return await self.flight.ado(key, self._agenerate, key, ticket_content, kb_results, history, triage_info)
+
+    async def _agenerate(self, key: str, ticket_content: str, kb_results: list, history: list = None, triage_info: dict = None):
+        cacheable = bool(kb_results)
+        if not kb_results:
+            logger.log_event("draft_agent.web_fallback", {"query": ticket_content})
+            web_results = await web_search_tool.asearch(ticket_content)
+            if web_results:
+                kb_results = web_results
+
+        prompt = self._build_prompt(ticket_content, kb_results, history, triage_info)
+
+        try:
+            return self._store(key, self._draft_text(await self.llm.agenerate(prompt)), cacheable)
+        except Exception as e:
+            logger.log_event("draft_agent.error", {"error": str(e)})
+            return "Error generating draft reply. Please check logs."
+
+    def stream_draft(self, ticket_content: str, kb_results: list, history: list = None, triage_info: dict = None):
+        """
+        generate_draft() that streams: yields ("delta", text) as the reply's
+        "body" field streams in from the model, then ("draft", full_reply)
+        with exactly what generate_draft() would have returned.
+        """
+        if not self.llm.available:
+            yield from self._replay(self._missing_key_reply())
+            return
+
+        key = draft_cache_key(ticket_content, kb_results, triage_info, self._model_id())
+        cached = self._cached(key) if kb_results else None
+        if cached is not None:
+            yield from self._replay(cached)
+            return
+
+        cacheable = bool(kb_results)
+        if not kb_results:
+            logger.log_event("draft_agent.web_fallback", {"query": ticket_content})
+            web_results = web_search_tool.search(ticket_content)
+            if web_results:
+                kb_results = web_results
+
+        prompt = self._build_prompt(ticket_content, kb_results, history, triage_info)
+
+        body, parts = JSONFieldStream("body"), []
+        try:
+            for chunk in self.llm.stream(prompt):
+                parts.append(chunk)
+                delta = body.feed(chunk)
+                if delta:
+                    yield "delta", delta
+        except Exception as e:
+            logger.log_event("draft_agent.error", {"error": str(e)})
+            yield "draft", "Error generating draft reply. Please check logs."
+            return
+        yield "draft", self._store(key, self._streamed_text(parts), cacheable)
+
+    async def astream_draft(self, ticket_content: str, kb_results: list, history: list = None, triage_info: dict = None):
+        """Async stream_draft(), on the backend's async client like agenerate_draft()."""
+        if not self.llm.available:
+            for event in self._replay(self._missing_key_reply()):
+                yield event
+            return
+
+        key = draft_cache_key(ticket_content, kb_results, triage_info, self._model_id())
+        cached = self._cached(key) if kb_results else None
+        if cached is not None:
+            for event in self._replay(cached):
+                yield event
+            return
+
+        cacheable = bool(kb_results)
+        if not kb_results:
+            logger.log_event("draft_agent.web_fallback", {"query": ticket_content})
+            web_results = await web_search_tool.asearch(ticket_content)
+            if web_results:
+                kb_results = web_results
+
+        prompt = self._build_prompt(ticket_content, kb_results, history, triage_info)
+
+        body, parts = JSONFieldStream("body"), []
+        try:
+            async for chunk in self.llm.astream(prompt):
+                parts.append(chunk)
+                delta = body.feed(chunk)
+                if delta:
+                    yield "delta", delta
+        except Exception as e:
+            logger.log_event("draft_agent.error", {"error": str(e)})
+            yield "draft", "Error generating draft reply. Please check logs."
+            return
+        yield "draft", self._store(key, self._streamed_text(parts), cacheable)
+
+    def _model_id(self) -> str:
+        """Backend + model, so cached drafts from one never answer for another."""
+        return f"{self.llm.name}:{self.model_name}"
+
+    def _replay(self, draft: str):
+        """Stream events for a reply that's already complete (cache hit, missing key)."""
+        text = JSONFieldStream("body").feed(draft)
+        if text:
+            yield "delta", text
+        yield "draft", draft
+
+    def _streamed_text(self, parts: list) -> str:
+        draft = "".join(parts)
+        logger.log_event("draft_agent.success", {"draft_length": len(draft), "streamed": True})
+        return draft
+
+    def _cached(self, key: str):
+        try:
+            draft = self.cache.get(key)
+        except Exception as e:  # a broken disk tier shouldn't fail the draft
+            logger.log_event("draft_agent.cache_error", {"error": str(e)}, level="ERROR")
+            return None
+        if draft is not None:
+            logger.log_event("draft_agent.cache_hit", {"key": key[:16]})
+        return draft
+
+    def _store(self, key: str, draft: str, cacheable: bool = True) -> str:
+        if draft and cacheable:
+            try:
+                self.cache.set(key, draft)
+            except Exception as e:
+                logger.log_event("draft_agent.cache_error", {"error": str(e)}, level="ERROR")
+        return draft
+
+    def _missing_key_reply(self) -> str:
+        return json.dumps({
+            "subject": "Missing API Key",
+            "body": "GOOGLE_API_KEY not found. Cannot generate draft.",
+            "action": "error"
+        })
+
+    def _build_prompt(self, ticket_content: str, kb_results: list, history: list = None, triage_info: dict = None) -> str:
         # Format KB results (handle missing fields gracefully)
-        def get_kb_snippet(item):
-            """Extract snippet from KB item, trying multiple fields."""
-            for key in ('snippet', 'content', 'summary', 'description'):
-                val = item.get(key)
-                if val:
-                    # Truncate if too long
-                    return val if len(val) <= 500 else val[:500] + "...<TRUNCATED>"
-            return item.get('title', 'KB Result')
-        
-        kb_text = "\n".join([f"- {item.get('title', 'KB Result')}: {get_kb_snippet(item)}" for item in kb_results]) if kb_results else "No KB matches."
+        kb_text = "\n".join([f"- {item.get('title', 'KB Result')}: {kb_snippet(item)}" for item in kb_results]) if kb_results else "No KB matches."
 
         memory_text = history if history else "No previous conversations found."
 
@@ -83,7 +366,7 @@ class DraftReplyAgent:
         severity = triage_info.get("severity", "low") if triage_info else "low"
 
         # --- MAIN PROMPT --- #
-        prompt = f"""
+        return f"""
 You are an enterprise-grade Tier-1 Customer Support Agent.
 
 You must ALWAYS reply in **STRICT JSON** with:
@@ -116,19 +399,10 @@ Customer History:
 Write the JSON ONLY.
 """
 
-        try:
-            response = self.model.generate_content(prompt)
-            raw = response.text
-
-            parsed = extract_json(raw)
-
-            # fallback if JSON fails
-            draft = getattr(response, "text", "") or str(response)
-            logger.log_event("draft_agent.success", {"draft_length": len(draft)})
-            return draft
-        except Exception as e:
-            logger.log_event("draft_agent.error", {"error": str(e)})
-            return "Error generating draft reply. Please check logs."
+    def _draft_text(self, text: str) -> str:
+        draft = text or ""
+        logger.log_event("draft_agent.success", {"draft_length": len(draft)})
+        return draft
 
 
 # Global instance
@@ -1,27 +1,47 @@
+import asyncio
+import contextlib
 import os
 import json
-import google.generativeai as genai
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from utils.observability import logger, log_trace
 from agents.draft_agent import draft_agent
 from agents.escalation_agent import escalation_agent
+from agents.triage_rules import triage_rules
+from agents.triage_model import MIN_CONFIDENCE, get_triage_model
 from tools.kb_tool import kb_tool
+from core.llm_client import get_client
 from core.memory import memory_bank, session_manager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
+# Drafts generated in parallel by process_tickets()
+DRAFT_CONCURRENCY = int(os.getenv("DRAFT_CONCURRENCY", "8"))
+
+# "rules": keyword rules (agents/triage_rules.py, default)
+# "model": naive Bayes classifier (agents/triage_model.py), rules below TRIAGE_MIN_CONFIDENCE
+TRIAGE_CLASSIFIERS = ("rules", "model")
 
 class TriageAgent:
-    def __init__(self, model_name=None):
-        self.model_name = model_name or os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
-        self.model = genai.GenerativeModel(self.model_name)
+    def __init__(self, model_name=None, classifier=None):
+        self.llm = get_client(model_name=model_name)
+        self.model_name = self.llm.model_name
+        self.classifier = classifier or os.getenv("TRIAGE_CLASSIFIER", "rules")
+        if self.classifier not in TRIAGE_CLASSIFIERS:
+            raise ValueError(f"Unknown triage classifier '{self.classifier}', expected one of {TRIAGE_CLASSIFIERS}")
 
-    def process_ticket(self, ticket: dict) -> dict:
+    def classify(self, ticket: dict) -> dict:
+        """
+        Offline category/severity of a ticket. Cheap enough to run at
+        admission; pass the result back as `analysis` to process it.
         """
-        Main entry point for processing a ticket.
+        return self._classify_ticket(ticket.get("description"))
+
+    def process_ticket(self, ticket: dict, analysis: dict = None) -> dict:
+        """
+        Main entry point for processing a ticket. `analysis` is a
+        classify() result for the ticket, if it was already computed.
         """
         ticket_id = ticket.get("id")
         user_query = ticket.get("description")
@@ -29,7 +49,7 @@ class TriageAgent:
         logger.log_event("triage.start", {"ticket_id": ticket_id})
         
         # 1. Analyze Ticket (Intent, Severity, Category)
-        analysis = self._classify_ticket(user_query)
+        analysis = analysis or self._classify_ticket(user_query)
         logger.log_event("triage.analysis", analysis)
         
         # Save to memory
@@ -39,11 +59,9 @@ class TriageAgent:
         response = {}
         
         # 2. Decision Logic
-        if analysis.get("severity") == "high" or analysis.get("category") == "billing_dispute":
+        if self._should_escalate(analysis):
             # Escalate immediately
-            reason = f"High severity or billing dispute detected: {analysis.get('reasoning')}"
-            escalation_result = escalation_agent.handle_escalation(ticket_id, reason, ticket)
-            response = {"status": "escalated", "reply": escalation_result}
+            response = self._escalate(ticket, analysis)
             
         else:
             # Standard flow: KB Search -> Draft
@@ -54,33 +72,240 @@ class TriageAgent:
             history = memory_bank.get_similar_tickets(analysis.get("category"))
             
             # Draft Reply
-            draft = draft_agent.generate_draft(user_query, kb_results, history)
+            draft = draft_agent.generate_draft(user_query, kb_results, history, analysis)
             response = {"status": "drafted", "reply": draft, "kb_hits": len(kb_results)}
 
         logger.log_event("triage.finish", {"ticket_id": ticket_id, "status": response["status"]})
         return response
 
+    async def aprocess_ticket(self, ticket: dict, analysis: dict = None) -> dict:
+        """
+        Async process_ticket() for the API. Memory and escalation writes run
+        in worker threads and the draft uses the async Gemini client, so a
+        slow ticket doesn't block the event loop. Classification and KB
+        search are in-memory and stay inline.
+        """
+        ticket_id = ticket.get("id")
+        user_query = ticket.get("description")
+
+        logger.log_event("triage.start", {"ticket_id": ticket_id})
+
+        analysis = analysis or self._classify_ticket(user_query)
+        logger.log_event("triage.analysis", analysis)
+
+        await asyncio.to_thread(memory_bank.add_ticket, {**ticket, **analysis})
+
+        if self._should_escalate(analysis):
+            response = await asyncio.to_thread(self._escalate, ticket, analysis)
+        else:
+            kb_results = kb_tool.search(user_query)
+            history = memory_bank.get_similar_tickets(analysis.get("category"))
+            draft = await draft_agent.agenerate_draft(user_query, kb_results, history, analysis)
+            response = {"status": "drafted", "reply": draft, "kb_hits": len(kb_results)}
+
+        logger.log_event("triage.finish", {"ticket_id": ticket_id, "status": response["status"]})
+        return response
+
+    def process_tickets(self, tickets: list, max_workers: int = None) -> list:
+        """
+        Batch entry point: one response per ticket, in input order.
+        All tickets are classified in one pass, memory is written once, KB
+        lookups go through kb_tool.search_many and drafts are generated
+        concurrently by at most `max_workers` (DRAFT_CONCURRENCY) threads.
+        A ticket whose draft or escalation fails gets status "error" instead
+        of failing the batch.
+        """
+        if not tickets:
+            return []
+        logger.log_event("triage.batch_start", {"count": len(tickets)})
+        queries = [ticket.get("description") or "" for ticket in tickets]
+        analyses = self._classify_tickets(queries)
+
+        responses = [None] * len(tickets)
+        to_draft = []
+        with memory_bank.batch():
+            memory_bank.add_tickets([{**ticket, **analysis} for ticket, analysis in zip(tickets, analyses)])
+            for i, (ticket, analysis) in enumerate(zip(tickets, analyses)):
+                if not self._should_escalate(analysis):
+                    to_draft.append(i)
+                    continue
+                try:
+                    responses[i] = self._escalate(ticket, analysis)
+                except Exception as e:
+                    logger.log_event("triage.error", {"ticket_id": ticket.get("id"), "error": str(e)}, level="ERROR")
+                    responses[i] = {"status": "error", "reply": "", "error": str(e)}
+
+        if to_draft:
+            kb_batches = kb_tool.search_many([queries[i] for i in to_draft])
+            histories = {}
+            workers = min(max_workers or DRAFT_CONCURRENCY, len(to_draft))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="draft") as pool:
+                futures = []
+                for i, kb_results in zip(to_draft, kb_batches):
+                    category = analyses[i].get("category")
+                    if category not in histories:
+                        histories[category] = memory_bank.get_similar_tickets(category)
+                    futures.append(pool.submit(draft_agent.generate_draft, queries[i], kb_results,
+                                               histories[category], analyses[i]))
+                for i, kb_results, future in zip(to_draft, kb_batches, futures):
+                    try:
+                        responses[i] = {"status": "drafted", "reply": future.result(), "kb_hits": len(kb_results)}
+                    except Exception as e:
+                        logger.log_event("triage.error", {"ticket_id": tickets[i].get("id"), "error": str(e)}, level="ERROR")
+                        responses[i] = {"status": "error", "reply": "", "error": str(e)}
+
+        statuses = Counter(response["status"] for response in responses)
+        logger.log_event("triage.batch_finish", {"count": len(tickets), **statuses})
+        return responses
+
+    def process_ticket_stream(self, ticket: dict, analysis: dict = None):
+        """
+        process_ticket() that streams: yields ("analysis", analysis), then
+        ("delta", text) for each piece of the draft's body as the model
+        writes it, then ("done", response) with the usual response.
+        Escalations have no deltas.
+        """
+        user_query = ticket.get("description")
+        logger.log_event("triage.start", {"ticket_id": ticket.get("id"), "stream": True})
+        analysis = analysis or self._classify_ticket(user_query)
+        logger.log_event("triage.analysis", analysis)
+        yield "analysis", analysis
+
+        memory_bank.add_ticket({**ticket, **analysis})
+        if self._should_escalate(analysis):
+            response = self._escalate(ticket, analysis)
+        else:
+            kb_results = kb_tool.search(user_query)
+            history = memory_bank.get_similar_tickets(analysis.get("category"))
+            for event, data in draft_agent.stream_draft(user_query, kb_results, history, analysis):
+                if event == "delta":
+                    yield event, data
+                else:
+                    response = {"status": "drafted", "reply": data, "kb_hits": len(kb_results)}
+
+        logger.log_event("triage.finish", {"ticket_id": ticket.get("id"), "status": response["status"]})
+        yield "done", response
+
+    async def aprocess_ticket_stream(self, ticket: dict, analysis: dict = None):
+        """Async process_ticket_stream(), with aprocess_ticket()'s threading."""
+        user_query = ticket.get("description")
+        logger.log_event("triage.start", {"ticket_id": ticket.get("id"), "stream": True})
+        analysis = analysis or self._classify_ticket(user_query)
+        logger.log_event("triage.analysis", analysis)
+        yield "analysis", analysis
+
+        await asyncio.to_thread(memory_bank.add_ticket, {**ticket, **analysis})
+        if self._should_escalate(analysis):
+            response = await asyncio.to_thread(self._escalate, ticket, analysis)
+        else:
+            kb_results = kb_tool.search(user_query)
+            history = memory_bank.get_similar_tickets(analysis.get("category"))
+            async for event, data in draft_agent.astream_draft(user_query, kb_results, history, analysis):
+                if event == "delta":
+                    yield event, data
+                else:
+                    response = {"status": "drafted", "reply": data, "kb_hits": len(kb_results)}
+
+        logger.log_event("triage.finish", {"ticket_id": ticket.get("id"), "status": response["status"]})
+        yield "done", response
+
+    async def aprocess_tickets(self, tickets: list, max_concurrency: int = None, admit=None):
+        """
+        Async process_tickets(): yields (index, analysis, response) as each
+        ticket finishes rather than once the whole batch is done. Classification,
+        the memory write and KB lookups are batched as in process_tickets();
+        at most `max_concurrency` (DRAFT_CONCURRENCY) drafts/escalations run
+        at once. `admit(ticket, analysis)`, if given, returns an async context
+        manager each ticket's draft/escalation runs in (e.g. an admission
+        slot). Closing the generator early cancels the remaining tickets.
+        """
+        if not tickets:
+            return
+        logger.log_event("triage.batch_start", {"count": len(tickets)})
+        queries = [ticket.get("description") or "" for ticket in tickets]
+        analyses = self._classify_tickets(queries)
+        await asyncio.to_thread(memory_bank.add_tickets,
+                                [{**ticket, **analysis} for ticket, analysis in zip(tickets, analyses)])
+
+        to_draft = [i for i, analysis in enumerate(analyses) if not self._should_escalate(analysis)]
+        kb_results = dict(zip(to_draft, kb_tool.search_many([queries[i] for i in to_draft]))) if to_draft else {}
+        histories = {}
+        for i in to_draft:
+            category = analyses[i].get("category")
+            if category not in histories:
+                histories[category] = memory_bank.get_similar_tickets(category)
+
+        semaphore = asyncio.Semaphore(max_concurrency or DRAFT_CONCURRENCY)
+
+        async def run(i):
+            async with semaphore:
+                try:
+                    async with admit(tickets[i], analyses[i]) if admit else contextlib.nullcontext():
+                        if i not in kb_results:
+                            return i, await asyncio.to_thread(self._escalate, tickets[i], analyses[i])
+                        draft = await draft_agent.agenerate_draft(queries[i], kb_results[i],
+                                                                  histories[analyses[i].get("category")], analyses[i])
+                        return i, {"status": "drafted", "reply": draft, "kb_hits": len(kb_results[i])}
+                except Exception as e:
+                    logger.log_event("triage.error", {"ticket_id": tickets[i].get("id"), "error": str(e)}, level="ERROR")
+                    return i, {"status": "error", "reply": "", "error": str(e)}
+
+        tasks = [asyncio.ensure_future(run(i)) for i in range(len(tickets))]
+        statuses = Counter()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                i, response = await next_done
+                statuses[response["status"]] += 1
+                yield i, analyses[i], response
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.log_event("triage.batch_finish", {"count": len(tickets), **statuses})
+
+    def _should_escalate(self, analysis: dict) -> bool:
+        return analysis.get("severity") == "high" or analysis.get("category") == "billing_dispute"
+
+    def _escalate(self, ticket: dict, analysis: dict) -> dict:
+        reason = f"High severity or billing dispute detected: {analysis.get('reasoning')}"
+        escalation_result = escalation_agent.handle_escalation(ticket.get("id"), reason, ticket)
+        return {"status": "escalated", "reply": escalation_result}
+
     def _classify_ticket(self, description: str) -> dict:
-        """Simple rule-based classification for offline mode."""
-        desc_lower = description.lower()
-        
-        # Billing (high priority)
-        if any(word in desc_lower for word in ['charge', 'billing', 'refund', 'payment', 'double']):
-            return {"category": "billing", "severity": "high", "reasoning": "Billing issue detected"}
-        
-        # Account access (high priority)
-        if any(word in desc_lower for word in ['login', 'password', 'account', 'access']):
-            return {"category": "account_access", "severity": "high", "reasoning": "Account access issue"}
-        
-        # Technical issues (high priority) - expanded detection
-        if any(word in desc_lower for word in ['crash', 'error', 'not working', 'broken', 'bug', 'player', 'video']):
-            return {"category": "technical_issue", "severity": "high", "reasoning": "Technical issue detected"}
-        
-        # Feature requests (low priority)
-        if any(word in desc_lower for word in ['dark mode', 'feature', 'enable', 'how do i', 'how to']):
-            return {"category": "feature_request", "severity": "low", "reasoning": "Feature request or question"}
-        
-        return {"category": "other", "severity": "low", "reasoning": "General inquiry"}
+        """Offline classification with the configured classifier."""
+        return self._classify_tickets([description])[0]
+
+    def _classify_tickets(self, descriptions: list) -> list:
+        """
+        Classify many tickets at once (one matrix product with the model).
+        Model predictions below MIN_CONFIDENCE are re-routed to the keyword
+        rules, keeping the model's confidence and guess for reference.
+        """
+        if self.classifier != "model":
+            return [triage_rules.classify(d) for d in descriptions]
+        results = get_triage_model().classify_many(descriptions)
+        for i, (description, result) in enumerate(zip(descriptions, results)):
+            if result["confidence"] < MIN_CONFIDENCE:
+                results[i] = {**triage_rules.classify(description), "confidence": result["confidence"],
+                              "low_confidence": True, "model_category": result["category"]}
+        return results
 
 # Global instance
 triage_agent = TriageAgent()
+
+def process_ticket(ticket: dict, analysis: dict = None) -> dict:
+    """Module-level entry point (picklable, for executors)."""
+    return triage_agent.process_ticket(ticket, analysis)
+
+def process_ticket_detached(ticket: dict, analysis: dict = None):
+    """
+    Entry point for process-pool workers: runs the pipeline against this
+    process's detached memory bank and returns (result, memory changes)
+    for the parent to persist with memory_bank.apply(). The parent's
+    /kb/reload and KB watcher don't reach workers, so each ticket first
+    picks up a KB file that changed on disk.
+    """
+    memory_bank.detach()
+    kb_tool.reload_if_changed()
+    result = triage_agent.process_ticket(ticket, analysis)
+    return result, memory_bank.drain()
@@ -0,0 +1,190 @@
+"""
+Offline ML classifier for TriageAgent (TRIAGE_CLASSIFIER=model).
+
+A multinomial naive Bayes model over feature-hashed n-grams: words, word
+bigrams and the character trigrams of each word (which keeps "lgin" close
+to "login"). Tickets are hashed into one sparse matrix, so classifying a
+batch is a single sparse x dense product plus a softmax; no per-ticket
+Python loop runs besides tokenization.
+
+The model is trained on curated labeled tickets: demo_data/triage_training.json
+and the demo set in demo_data/test_tickets.json ("expected_category"/
+"expected_severity"). The memory bank is not used, since its labels were
+produced by the classifier itself. labeled_tickets() also reads memory
+bank files ("category"/"severity") when given one explicitly.
+Every prediction carries the posterior of each category; TriageAgent falls
+back to the keyword rules when the best one is below
+TRIAGE_MIN_CONFIDENCE.
+"""
+import json
+import os
+import threading
+import zlib
+from collections import Counter, defaultdict
+from functools import lru_cache
+from itertools import count
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional dependency, only needed for this classifier
+    np = None
+    sparse = None
+
+from utils.observability import logger
+from utils.query_normalizer import normalize_text
+
+TRAINING_FILES = ("demo_data/triage_training.json", "demo_data/test_tickets.json")
+HASH_FEATURES = 1 << 18
+CHAR_GRAM = 3
+NB_ALPHA = 0.1  # Laplace/Lidstone smoothing
+# Naive Bayes counts every overlapping n-gram as independent evidence, which
+# drives posteriors to 1.0; each ticket is scaled to this many observations
+EVIDENCE_WEIGHT = 5.0
+MIN_CONFIDENCE = float(os.getenv("TRIAGE_MIN_CONFIDENCE", "0.6"))
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_columns(token: str, n_features: int) -> Tuple[int, ...]:
+    """Hashed columns of a word (itself + char n-grams) or a "w1 w2" bigram."""
+    if " " in token:
+        feats = ["b:" + token]
+    else:
+        padded = f" {token} "
+        feats = ["w:" + token] + [padded[i:i + CHAR_GRAM] for i in range(len(padded) - CHAR_GRAM + 1)]
+    # crc32 rather than hash(): str hashes are salted per process
+    return tuple(zlib.crc32(f.encode("utf-8")) % n_features for f in feats)
+
+
+def hash_features(texts: List[str], n_features: int = HASH_FEATURES):
+    """
+    Sparse (len(texts), n_features) matrix of n-gram counts. Tokens are
+    first counted per text against a batch vocabulary, so each distinct
+    word/bigram is expanded into its hashed n-grams once:
+    counts = (texts x tokens) @ (tokens x features).
+    """
+    vocab: Dict[str, int] = defaultdict(count().__next__)  # token -> id, assigned on first sight
+    ids, lengths = [], []
+    for text in texts:
+        words = normalize_text(text or "").split()
+        tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        ids.extend(map(vocab.__getitem__, tokens))
+        lengths.append(len(tokens))
+    tokens_by_text = sparse.csr_matrix(
+        (np.ones(len(ids), dtype=np.float32), (np.repeat(np.arange(len(texts)), lengths), ids)),
+        shape=(len(texts), len(vocab)))
+
+    columns = [_token_columns(token, n_features) for token in vocab]
+    indptr = np.cumsum([0] + [len(c) for c in columns])
+    indices = np.fromiter((col for cols in columns for col in cols), dtype=np.int64, count=indptr[-1])
+    features_by_token = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                                          shape=(len(vocab), n_features))
+    return tokens_by_text @ features_by_token
+
+
+def labeled_tickets(paths: Iterable[str] = TRAINING_FILES) -> List[Tuple[str, str, Optional[str]]]:
+    """
+    (description, category, severity) of every labeled ticket in `paths`.
+    Repeats (the memory bank logs every run of the same ticket) count once.
+    """
+    examples, seen = [], set()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except ValueError as e:
+            logger.log_event("triage_model.error", {"path": path, "error": str(e)})
+            continue
+        tickets = data.get("tickets", []) if isinstance(data, dict) else data
+        for ticket in tickets:
+            category = ticket.get("category") or ticket.get("expected_category")
+            key = (ticket.get("description"), category)
+            if key[0] and category and key not in seen:
+                seen.add(key)
+                examples.append((ticket["description"], category,
+                                 ticket.get("severity") or ticket.get("expected_severity")))
+    return examples
+
+
+class TriageModel:
+    """Multinomial naive Bayes over hashed n-grams."""
+
+    def __init__(self, alpha: float = NB_ALPHA, n_features: int = HASH_FEATURES):
+        if np is None:
+            raise ImportError("The triage model requires numpy and scipy (pip install numpy scipy)")
+        self.alpha = alpha
+        self.n_features = n_features
+        self.categories: List[str] = []
+        self.severities: Dict[str, str] = {}
+        self.n_examples = 0
+
+    def fit(self, examples: List[Tuple[str, str, Optional[str]]]) -> "TriageModel":
+        if not examples:
+            raise ValueError("No labeled tickets to train the triage model on")
+        texts, labels, severities = zip(*examples)
+        self.categories = sorted(set(labels))
+        index = {c: i for i, c in enumerate(self.categories)}
+        y = np.array([index[c] for c in labels])
+
+        # One-hot labels x counts gives every class's feature totals in one product
+        onehot = sparse.csr_matrix((np.ones(len(y)), (y, np.arange(len(y)))),
+                                   shape=(len(self.categories), len(y)))
+        counts = np.asarray((onehot @ hash_features(list(texts), self.n_features)).todense()) + self.alpha
+        self.feature_log_prob = (np.log(counts) - np.log(counts.sum(axis=1, keepdims=True))).astype(np.float32)
+        self.class_log_prior = np.log(np.bincount(y, minlength=len(self.categories)) / len(y)).astype(np.float32)
+
+        # Severity follows category: the most common label seen with it
+        by_category: Dict[str, Counter] = {}
+        for category, severity in zip(labels, severities):
+            if severity:
+                by_category.setdefault(category, Counter())[severity] += 1
+        self.severities = {c: by_category[c].most_common(1)[0][0] if c in by_category else "low"
+                           for c in self.categories}
+        self.n_examples = len(y)
+        return self
+
+    def predict_proba(self, texts: List[str]):
+        """(len(texts), n_categories) posteriors, columns in self.categories order."""
+        counts = hash_features(texts, self.n_features)
+        totals = np.asarray(counts.sum(axis=1)).ravel()
+        counts = sparse.diags(EVIDENCE_WEIGHT / np.maximum(totals, 1.0)) @ counts
+        joint = counts @ self.feature_log_prob.T + self.class_log_prior
+        joint -= joint.max(axis=1, keepdims=True)
+        probs = np.exp(joint)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def classify_many(self, texts: List[str]) -> List[Dict]:
+        probs = self.predict_proba(texts)
+        best = probs.argmax(axis=1)
+        results = []
+        for row, i in zip(probs, best):
+            category = self.categories[i]
+            confidence = round(float(row[i]), 4)
+            results.append({
+                "category": category,
+                "severity": self.severities[category],
+                "reasoning": f"Classifier: {category} ({confidence:.2f})",
+                "confidence": confidence,
+                "probabilities": {c: round(float(p), 4) for c, p in zip(self.categories, row)},
+            })
+        return results
+
+    def classify(self, text: str) -> Dict:
+        return self.classify_many([text])[0]
+
+
+_model: Optional[TriageModel] = None
+_model_lock = threading.Lock()
+
+
+def get_triage_model() -> TriageModel:
+    """The shared model, trained on first use from TRAINING_FILES."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = TriageModel().fit(labeled_tickets())
+            logger.log_event("triage_model.trained", {"examples": _model.n_examples, "categories": _model.categories})
+        return _model
@@ -0,0 +1,285 @@
+"""
+Keyword rules for offline ticket classification.
+
+Rules are checked in priority order (first rule wins) and a rule fires when
+any of its keywords occurs anywhere in the lowercased ticket text.
+
+Instead of one substring scan per keyword, the whole table is compiled into
+a single regex: the keywords are merged into a trie ("c(?:harge|rash)|...")
+inside a lookahead, so each start position is tested once against the
+longest keyword starting there. A keyword that is a prefix of another one
+("do" / "double") can't be missed either: every keyword is pre-resolved to
+the highest-priority rule among itself and its prefixes. Cost is one pass
+over the text no matter how many rules or keywords there are.
+
+Rules default to DEFAULT_RULES and can be replaced with a JSON (or, with
+PyYAML installed, YAML) list of rule objects pointed to by TRIAGE_RULES_FILE:
+
+    [{"name": "billing", "category": "billing", "severity": "high",
+      "reasoning": "Billing issue detected", "keywords": ["refund", "charge"]}, ...]
+
+The file can be edited under load: reload() (POST /triage/rules/reload, or
+the TRIAGE_RULES_WATCH_INTERVAL poller) compiles the new table and swaps it
+in with one reference assignment. Per-rule hits and match latency are kept
+in stats() and mirrored into the observability counters as
+"triage.rule.<name>" and "triage.rules.match_seconds".
+"""
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from utils.observability import logger
+
+DEFAULT_RULES = [
+    {"name": "billing", "category": "billing", "severity": "high",
+     "reasoning": "Billing issue detected",
+     "keywords": ["charge", "billing", "refund", "payment", "double"]},
+    {"name": "account_access", "category": "account_access", "severity": "high",
+     "reasoning": "Account access issue",
+     "keywords": ["login", "password", "account", "access"]},
+    {"name": "technical_issue", "category": "technical_issue", "severity": "high",
+     "reasoning": "Technical issue detected",
+     "keywords": ["crash", "error", "not working", "broken", "bug", "player", "video"]},
+    {"name": "feature_request", "category": "feature_request", "severity": "low",
+     "reasoning": "Feature request or question",
+     "keywords": ["dark mode", "feature", "enable", "how do i", "how to"]},
+]
+
+FALLBACK = {"category": "other", "severity": "low", "reasoning": "General inquiry"}
+FALLBACK_RULE = "fallback"  # counter name for tickets no rule matched
+
+REQUIRED_FIELDS = ("name", "category", "severity", "keywords")
+
+
+def _trie_pattern(words) -> str:
+    """Regex matching any of `words`, shaped as a trie; greedy, so the longest wins."""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else f"(?:{'|'.join(alts)})"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def load_rules(path: str) -> List[Dict]:
+    with open(path, "r") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML triage rules require PyYAML (pip install pyyaml)")
+            try:
+                rules = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"{path}: invalid YAML: {e}")
+        else:
+            rules = json.load(f)
+    validate_rules(rules, path)
+    return rules
+
+
+def validate_rules(rules, source: str = "rules"):
+    if not isinstance(rules, list):
+        raise ValueError(f"{source} must contain a list of rule objects")
+    names = set()
+    for i, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            raise ValueError(f"{source}: rule {i} is not an object")
+        missing = [field for field in REQUIRED_FIELDS if field not in rule]
+        if missing:
+            raise ValueError(f"{source}: rule {i} is missing {', '.join(missing)}")
+        if not isinstance(rule["name"], str):
+            raise ValueError(f"{source}: rule {i} name must be a string")
+        if not isinstance(rule["keywords"], list):
+            raise ValueError(f"{source}: rule '{rule['name']}' keywords must be a list")
+        if not all(isinstance(keyword, str) for keyword in rule["keywords"]):
+            raise ValueError(f"{source}: rule '{rule['name']}' keywords must be strings")
+        if rule["name"] in names or rule["name"] == FALLBACK_RULE:
+            raise ValueError(f"{source}: duplicate or reserved rule name '{rule['name']}'")
+        names.add(rule["name"])
+
+
+class TriageRules:
+    """A compiled, immutable rule table."""
+
+    def __init__(self, rules: List[Dict] = DEFAULT_RULES):
+        validate_rules(rules)
+        self.rules = rules
+        owner: Dict[str, int] = {}  # keyword -> first rule listing it
+        for i, rule in enumerate(rules):
+            for keyword in rule["keywords"]:
+                if keyword:
+                    owner.setdefault(keyword.lower(), i)
+        # A match of "double" is also a match of "do": resolve each keyword to
+        # the best (rule, keyword) among itself and its keyword prefixes
+        self._fires: Dict[str, Tuple[int, str]] = {
+            keyword: min((owner[keyword[:n]], keyword[:n]) for n in range(1, len(keyword) + 1)
+                         if keyword[:n] in owner)
+            for keyword in owner
+        }
+        self._pattern = re.compile(f"(?=({_trie_pattern(owner)}))") if owner else None
+
+    def _scan(self, text: str) -> Iterator[Tuple[int, str, int]]:
+        if self._pattern is None:
+            return
+        for m in self._pattern.finditer(text.lower()):
+            rule, keyword = self._fires[m.group(1)]
+            yield rule, keyword, m.start()
+
+    def hits(self, text: str) -> List[Tuple[int, str, int]]:
+        """(rule index, keyword, position) of the best keyword at each hit position, in text order."""
+        return list(self._scan(text))
+
+    def match(self, text: str) -> Optional[Tuple[int, str]]:
+        """(rule index, keyword) of the highest-priority rule that fires, or None."""
+        best = None
+        for rule, keyword, _ in self._scan(text):
+            if best is None or rule < best[0]:
+                best = (rule, keyword)
+                if rule == 0:
+                    break
+        return best
+
+    def classify(self, text: str) -> Dict:
+        """Category, severity and reasoning, plus the rule and keyword that fired."""
+        best = self.match(text)
+        if best is None:
+            return {**FALLBACK, "rule": None, "keyword": None}
+        rule = self.rules[best[0]]
+        return {"category": rule["category"], "severity": rule["severity"],
+                "reasoning": rule.get("reasoning", f"Matched rule {rule['name']}"),
+                "rule": rule["name"], "keyword": best[1]}
+
+
+class TriageRuleEngine:
+    """
+    Classifies with the current TriageRules, hot-swappable via reload(),
+    counting hits per rule and match latency.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.version = 0
+        self._reload_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_stop = None
+        self._stamp = self._file_stamp()
+        self._rules = TriageRules(load_rules(path) if path else DEFAULT_RULES)
+        self._reset_stats()
+
+    def _reset_stats(self):
+        with self._stats_lock:
+            self._hits = {rule["name"]: 0 for rule in self._rules.rules}
+            self._hits[FALLBACK_RULE] = 0
+            self._matches = 0
+            self._match_seconds = 0.0
+            self._match_max = 0.0
+
+    @property
+    def rules(self) -> List[Dict]:
+        return self._rules.rules
+
+    def classify(self, text: str) -> Dict:
+        rules = self._rules  # one snapshot per call, see reload()
+        start = time.perf_counter()
+        result = rules.classify(text)
+        elapsed = time.perf_counter() - start
+
+        name = result["rule"] or FALLBACK_RULE
+        with self._stats_lock:
+            self._hits[name] = self._hits.get(name, 0) + 1
+            self._matches += 1
+            self._match_seconds += elapsed
+            self._match_max = max(self._match_max, elapsed)
+        logger.incr(f"triage.rule.{name}")
+        logger.incr("triage.rules.match_seconds", elapsed)
+        return result
+
+    def _file_stamp(self) -> Optional[Tuple[float, int]]:
+        if not self.path:
+            return None
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def reload(self) -> Dict:
+        """
+        Re-read the rules file and swap the compiled table in. Classifications
+        already running finish on the table they started with. On a missing
+        or invalid file the current rules stay in place. Hit counters restart
+        with the new table; the mirrored observability counters keep counting.
+        """
+        if not self.path:
+            return {"ok": False, "version": self.version, "error": "No TRIAGE_RULES_FILE configured"}
+        with self._reload_lock:
+            stamp = self._file_stamp()
+            try:
+                rules = TriageRules(load_rules(self.path))
+            except (OSError, ValueError, ImportError) as e:
+                # Remember the stamp anyway so the watcher doesn't retry a broken file in a loop
+                self._stamp = stamp
+                logger.log_event("triage_rules.reload.error", {"path": self.path, "error": str(e)}, level="ERROR")
+                return {"ok": False, "version": self.version, "error": str(e)}
+            self._rules = rules
+            self._stamp = stamp
+            self.version += 1
+            self._reset_stats()
+
+        logger.log_event("triage_rules.reload", {"path": self.path, "version": self.version, "rules": len(rules.rules)})
+        return {"ok": True, "version": self.version, "rules": len(rules.rules)}
+
+    def start_watcher(self, interval: float = 2.0):
+        """Poll the rules file's mtime/size in a daemon thread and reload() on change."""
+        if not self.path or (self._watcher and self._watcher.is_alive()):
+            return
+        stop = threading.Event()
+
+        def _watch():
+            while not stop.wait(interval):
+                stamp = self._file_stamp()
+                if stamp is not None and stamp != self._stamp:
+                    try:
+                        self.reload()
+                    except Exception as e:  # keep watching; the current rules stay in place
+                        logger.log_event("triage_rules.reload.error", {"path": self.path, "error": str(e)},
+                                         level="ERROR")
+
+        self._watcher_stop = stop
+        self._watcher = threading.Thread(target=_watch, name="triage-rules-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        if self._watcher_stop:
+            self._watcher_stop.set()
+        if self._watcher:
+            self._watcher.join()
+        self._watcher = self._watcher_stop = None
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            matches = self._matches
+            return {
+                "version": self.version,
+                "rules": len(self._rules.rules),
+                "hits": dict(self._hits),
+                "matches": matches,
+                "match_avg_ms": round(self._match_seconds / matches * 1000, 4) if matches else 0.0,
+                "match_max_ms": round(self._match_max * 1000, 4),
+            }
+
+
+triage_rules = TriageRuleEngine(os.getenv("TRIAGE_RULES_FILE") or None)
@@ -8,6 +8,7 @@ load_dotenv(".env.local")
 load_dotenv() # Fallback to .env
 
 from agents.triage_agent import triage_agent
+from core.llm import default_model
 from core.memory import memory_bank
 from utils.observability import logger
 
@@ -62,7 +63,7 @@ with st.sidebar:
     st.title("🎛️ Controls")
     
     # Model Selector
-    current_model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp")
+    current_model = default_model()
     model_choice = st.selectbox(
         "Gemini Model", 
         ["gemini-2.0-flash-lite-preview-02-05", "gemini-2.0-flash-exp", "gemini-1.5-flash"],
@@ -113,7 +114,14 @@ with col1:
             ticket = {"id": f"web_{int(start_time)}", "description": prompt, "user_id": "web_user"}
             
             try:
-                result = triage_agent.process_ticket(ticket)
+                # Stream the draft: render the reply body as the model writes it
+                streamed = ""
+                for event, data in triage_agent.process_ticket_stream(ticket):
+                    if event == "delta":
+                        streamed += data
+                        message_placeholder.markdown(streamed + "▌")
+                    elif event == "done":
+                        result = data
                 response_text = result.get("reply", "No response generated.")
                 status = result.get("status", "unknown")
                 
@@ -121,7 +129,8 @@ with col1:
                 if status == "escalated":
                     final_response = f"🚨 **ESCALATED**: {response_text}"
                 else:
-                    final_response = response_text
+                    # Keep the body that was streamed in rather than the raw JSON reply
+                    final_response = streamed or response_text
                 
                 message_placeholder.markdown(final_response)
                 st.session_state.messages.append({"role": "assistant", "content": final_response})
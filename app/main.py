@@ -4,9 +4,12 @@ Production-ready REST API with error handling, retries, and monitoring
 """
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from collections import Counter
+import asyncio
+import json
 import logging
 import time
 import os
@@ -15,8 +18,16 @@ import sys
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agents.triage_agent import triage_agent
+from agents.triage_agent import triage_agent, process_ticket as process_ticket_blocking, process_ticket_detached
+from agents.triage_rules import triage_rules
+from agents.draft_agent import draft_agent
+from tools.web_search_tool import web_search_tool
 from core.memory import memory_bank
+from core.llm_client import clients_stats as llm_clients_stats
+from tools.kb_tool import kb_tool
+from utils.observability import logger as event_logger
+from app.scheduler import AdmissionController, QueueFull
+from utils.rate_limit import RateLimiter
 
 # Configure logging
 logging.basicConfig(
@@ -56,6 +67,26 @@ class HealthResponse(BaseModel):
     version: str
     uptime_seconds: float
 
+# Optional: poll the KB file and hot-reload it on change (seconds, 0 = off)
+KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "0"))
+if KB_WATCH_INTERVAL > 0:
+    kb_tool.start_watcher(KB_WATCH_INTERVAL)
+
+# Optional: same for the triage rules file (TRIAGE_RULES_FILE)
+TRIAGE_RULES_WATCH_INTERVAL = float(os.getenv("TRIAGE_RULES_WATCH_INTERVAL", "0"))
+if TRIAGE_RULES_WATCH_INTERVAL > 0:
+    triage_rules.start_watcher(TRIAGE_RULES_WATCH_INTERVAL)
+
+# Admission control: bounded concurrency + bounded queue, 429 beyond that
+admission = AdmissionController()
+
+# Per-user token buckets (RATE_LIMIT_PER_MINUTE, off by default)
+rate_limiter = RateLimiter()
+
+# /process/batch: tickets per request, and drafts in flight per batch (default DRAFT_CONCURRENCY)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "0")) or None
+
 # Metrics
 start_time = time.time()
 request_count = 0
@@ -108,9 +139,40 @@ async def metrics():
         "errors_total": error_count,
         "uptime_seconds": time.time() - start_time,
         "tickets_processed": len(memory_bank.data.get("tickets", [])),
-        "tickets_escalated": sum(1 for t in memory_bank.data.get("tickets", []) if t.get("escalated", False))
+        "tickets_escalated": sum(1 for t in memory_bank.data.get("tickets", []) if t.get("escalated", False)),
+        "kb_version": kb_tool.version,
+        "kb_cache": kb_tool.cache.stats(),
+        "draft_cache": draft_agent.cache.stats(),
+        "singleflight": {"draft": draft_agent.flight.stats(), "web_search": web_search_tool.flight.stats()},
+        "triage_rules": triage_rules.stats(),
+        "admission": admission.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "llm": llm_clients_stats(),
+        "counters": event_logger.counters()
     }
 
+@app.post("/kb/reload")
+async def reload_kb():
+    """
+    Reload the knowledge base from disk, applying only what changed.
+    With ADMISSION_POOL=process the workers keep their own KB and reload
+    it from the file before their next ticket.
+    """
+    result = kb_tool.reload()
+    if not result.get("ok"):
+        raise HTTPException(status_code=500, detail=f"KB reload failed: {result.get('error')}")
+    logger.info(f"KB reloaded to version {result['version']}")
+    return result
+
+@app.post("/triage/rules/reload")
+async def reload_triage_rules():
+    """Recompile the triage rules from TRIAGE_RULES_FILE and swap them in"""
+    result = triage_rules.reload()
+    if not result.get("ok"):
+        raise HTTPException(status_code=500, detail=f"Triage rules reload failed: {result.get('error')}")
+    logger.info(f"Triage rules reloaded to version {result['version']}")
+    return result
+
 @app.post("/process", response_model=TicketResponse)
 async def process_ticket(ticket: TicketRequest):
     """
@@ -119,6 +181,16 @@ async def process_ticket(ticket: TicketRequest):
     Returns classification, KB search results, and AI-generated response or escalation
     """
     start = time.time()
+    user_id = ticket.user_id or "unknown"
+
+    allowed, retry_after = rate_limiter.acquire(user_id)
+    if not allowed:
+        logger.warning(f"Rate limited ticket {ticket.id} from user {user_id}")
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded for this user, retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
     
     try:
         logger.info(f"Processing ticket {ticket.id}")
@@ -127,11 +199,20 @@ async def process_ticket(ticket: TicketRequest):
         ticket_data = {
             "id": ticket.id,
             "description": ticket.description,
-            "user_id": ticket.user_id or "unknown"
+            "user_id": user_id
         }
         
-        # Process with triage agent
-        result = triage_agent.process_ticket(ticket_data)
+        # Classify at admission (offline, cheap) so high-severity tickets are
+        # dequeued first, then run the KB/draft stages once admitted
+        analysis = triage_agent.classify(ticket_data)
+        pipeline = {"async": triage_agent.aprocess_ticket, "thread": process_ticket_blocking,
+                    "process": process_ticket_detached}[admission.pool]
+        result = await admission.run(pipeline, ticket_data, analysis,
+                                     priority=analysis.get("severity"), user=user_id)
+        if admission.pool == "process":
+            # Workers don't write the memory file; their changes are persisted here only
+            result, changes = result
+            await asyncio.to_thread(memory_bank.apply, changes)
         
         processing_time = (time.time() - start) * 1000
         
@@ -144,11 +225,18 @@ async def process_ticket(ticket: TicketRequest):
             reply=result.get("reply", ""),
             processing_time_ms=processing_time,
             metadata={
-                "category": result.get("category"),
-                "severity": result.get("severity")
+                "category": analysis.get("category"),
+                "severity": analysis.get("severity")
             }
         )
         
+    except QueueFull as e:
+        logger.warning(f"Rejected ticket {ticket.id}: {str(e)}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many tickets in flight, retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         logger.error(f"Error processing ticket {ticket.id}: {str(e)}")
         raise HTTPException(
@@ -156,6 +244,171 @@ async def process_ticket(ticket: TicketRequest):
             detail=f"Failed to process ticket: {str(e)}"
         )
 
+def sse_event(event: str, data: Any) -> str:
+    """One Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/process/stream")
+async def process_ticket_stream(ticket: TicketRequest):
+    """
+    Process a ticket, streaming the reply as Server-Sent Events
+    
+    Events: "analysis" (category/severity), then "delta" ({"text": ...})
+    for each piece of the reply body as the model writes it, then "done"
+    with the TicketResponse ("error" with {"detail": ...} on failure).
+    """
+    start = time.time()
+    user_id = ticket.user_id or "unknown"
+
+    allowed, retry_after = rate_limiter.acquire(user_id)
+    if not allowed:
+        logger.warning(f"Rate limited ticket {ticket.id} from user {user_id}")
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded for this user, retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+    try:
+        admission.check()
+    except QueueFull as e:
+        logger.warning(f"Rejected ticket {ticket.id}: {str(e)}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many tickets in flight, retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    ticket_data = {"id": ticket.id, "description": ticket.description, "user_id": user_id}
+    analysis = triage_agent.classify(ticket_data)
+
+    async def stream():
+        try:
+            async with admission.slot(analysis.get("severity"), user=user_id):
+                async for event, data in triage_agent.aprocess_ticket_stream(ticket_data, analysis):
+                    if event == "delta":
+                        yield sse_event("delta", {"text": data})
+                    elif event == "analysis":
+                        yield sse_event("analysis", {"category": data.get("category"), "severity": data.get("severity")})
+                    else:
+                        processing_time = (time.time() - start) * 1000
+                        logger.info(f"Ticket {ticket.id} streamed: {data.get('status')} ({processing_time:.2f}ms)")
+                        yield sse_event("done", TicketResponse(
+                            ok=True,
+                            ticket_id=ticket.id,
+                            status=data.get("status", "unknown"),
+                            reply=data.get("reply", ""),
+                            processing_time_ms=processing_time,
+                            metadata={
+                                "category": analysis.get("category"),
+                                "severity": analysis.get("severity")
+                            }
+                        ).model_dump())
+        except Exception as e:
+            logger.error(f"Error streaming ticket {ticket.id}: {str(e)}")
+            yield sse_event("error", {"detail": f"Processing failed: {str(e)}"})
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def parse_batch(body: bytes) -> List[TicketRequest]:
+    """Tickets from a JSON array or NDJSON (one ticket object per line) body."""
+    text = body.decode("utf-8")
+    if text.lstrip().startswith("["):
+        items = json.loads(text)
+    else:
+        items = []
+        for n, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    items.append(json.loads(line))
+                except ValueError as e:
+                    raise ValueError(f"line {n}: {e}")
+    tickets = []
+    for i, item in enumerate(items):
+        try:
+            tickets.append(TicketRequest.model_validate(item))
+        except ValueError as e:
+            raise ValueError(f"ticket {i}: {e}")
+    return tickets
+
+@app.post("/process/batch")
+async def process_batch(request: Request):
+    """
+    Process many tickets in one request
+    
+    Accepts a JSON array or NDJSON of tickets and streams one TicketResponse
+    per line (application/x-ndjson) as each ticket finishes, so the order
+    follows completion, not input; match lines on ticket_id.
+
+    Batches always run on the asyncio pipeline in the API process, whatever
+    ADMISSION_POOL is: classification, the memory write and KB lookups are
+    shared by the whole batch. Each ticket still holds an admission slot.
+    """
+    try:
+        tickets = parse_batch(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {e}")
+    if len(tickets) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch of {len(tickets)} tickets exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}")
+
+    ticket_data = [
+        {"id": t.id, "description": t.description, "user_id": t.user_id or "unknown"}
+        for t in tickets
+    ]
+
+    # Each ticket costs its user one rate-limit token, as on /process. The
+    # batch is all or nothing: users charged before a refusal get refunded.
+    per_user = Counter(t["user_id"] for t in ticket_data)
+    for user_id, count in per_user.items():
+        if rate_limiter.enabled and count > rate_limiter.burst:
+            raise HTTPException(status_code=413, detail=f"Batch has {count} tickets from user {user_id}, over the rate limit burst of {rate_limiter.burst}")
+    charged = []
+    for user_id, count in per_user.items():
+        allowed, retry_after = rate_limiter.acquire(user_id, cost=count)
+        if not allowed:
+            for charged_user, charged_count in charged:
+                rate_limiter.refund(charged_user, cost=charged_count)
+            logger.warning(f"Rate limited batch of {count} tickets from user {user_id}")
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded for this user, retry later",
+                headers={"Retry-After": str(retry_after)}
+            )
+        charged.append((user_id, count))
+    try:
+        admission.check()
+    except QueueFull as e:
+        logger.warning(f"Rejected batch of {len(tickets)} tickets: {str(e)}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many tickets in flight, retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    def admit(ticket, analysis):
+        return admission.slot(analysis.get("severity"), user=ticket["user_id"])
+
+    logger.info(f"Processing batch of {len(tickets)} tickets")
+
+    async def stream():
+        start = time.time()
+        async for i, analysis, result in triage_agent.aprocess_tickets(ticket_data, BATCH_CONCURRENCY, admit):
+            response = TicketResponse(
+                ok=result.get("status") != "error",
+                ticket_id=tickets[i].id,
+                status=result.get("status", "unknown"),
+                reply=result.get("reply", ""),
+                processing_time_ms=(time.time() - start) * 1000,
+                metadata={
+                    "category": analysis.get("category"),
+                    "severity": analysis.get("severity")
+                }
+            )
+            yield response.model_dump_json() + "\n"
+        logger.info(f"Batch of {len(tickets)} tickets processed ({(time.time() - start) * 1000:.2f}ms)")
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.get("/tickets/{ticket_id}")
 async def get_ticket(ticket_id: str):
     """Retrieve a processed ticket by ID"""
@@ -0,0 +1,250 @@
+"""
+Admission control in front of the ticket pipeline.
+
+At most `workers` tickets are processed at once; up to `queue_size` more
+wait for a slot and anything beyond that is rejected right away with
+QueueFull (HTTP 429 + Retry-After) instead of piling up and dragging every
+request's latency down together.
+
+Waiting tickets are dequeued by priority (the severity the cheap offline
+classifier gives them at admission), with aging so low-priority tickets
+can't starve: a ticket's key is its arrival time plus
+rank * ADMISSION_AGING_SECONDS, i.e. a "low" ticket that has waited
+2 * ADMISSION_AGING_SECONDS goes ahead of a "high" one arriving now. The
+key never changes after enqueueing, so the wait queue is a plain heap.
+
+Tickets carrying a user are also fair-queued (weighted fair queueing with a
+virtual clock): each user's arrival time is replaced by a virtual start
+time, max(now, finish of that user's previous ticket), and every ticket
+pushes the user's finish forward by its expected cost (average service
+time / workers) divided by the user's weight. A user submitting faster than
+their share gets start times further and further in the future, so their
+backlog queues behind everybody else's tickets instead of in front of them.
+Hard per-user rate limits are in utils/rate_limit.py.
+
+Tickets run on one of three pools (ADMISSION_POOL):
+- "async":   the asyncio pipeline (TriageAgent.aprocess_ticket), default
+- "thread":  the blocking pipeline on a ThreadPoolExecutor
+- "process": the blocking pipeline on a ProcessPoolExecutor. Workers are
+             started with "spawn" (never forked from a process running
+             watcher threads) and load their own agents and KB index;
+             their memory banks are detached, and the API persists the
+             changes each ticket returns (process_ticket_detached). A
+             worker reloads its KB before a ticket if the file changed,
+             since /kb/reload and KB_WATCH_INTERVAL act on the API only
+
+Queue depth, wait time (admission -> start) and service time are reported
+by stats() for /metrics, overall and per priority, and mirrored into the
+"admission.*" counters.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import multiprocessing
+import os
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from utils.observability import logger
+
+ADMISSION_WORKERS = int(os.getenv("ADMISSION_WORKERS", "16"))
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "64"))
+ADMISSION_POOL = os.getenv("ADMISSION_POOL", "async")
+ADMISSION_POOLS = ("async", "thread", "process")
+ADMISSION_AGING_SECONDS = float(os.getenv("ADMISSION_AGING_SECONDS", "5"))
+MAX_RETRY_AFTER = 60  # seconds
+
+# Ticket severity -> rank (lower runs first); unknown severities rank last
+PRIORITIES = {"high": 0, "medium": 1, "low": 2}
+DEFAULT_PRIORITY = "low"
+MAX_TRACKED_USERS = 10000  # virtual finish times kept before stale ones are dropped
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Admission queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded slots + bounded priority wait queue. Must be used from a single
+    event loop; all bookkeeping happens on the loop thread, so no locks are
+    needed.
+    """
+
+    def __init__(self, workers: int = ADMISSION_WORKERS, queue_size: int = ADMISSION_QUEUE,
+                 pool: str = ADMISSION_POOL, aging_seconds: float = ADMISSION_AGING_SECONDS):
+        if pool not in ADMISSION_POOLS:
+            raise ValueError(f"Unknown admission pool '{pool}', expected one of {ADMISSION_POOLS}")
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.pool = pool
+        self.aging_seconds = aging_seconds
+        self._executor = None
+        if pool == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ticket")
+        elif pool == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        self._running = 0
+        # (key, seq, priority, future); seq keeps equal keys FIFO
+        self._waiters: List[Tuple[float, int, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._finish: Dict[str, float] = {}  # user -> virtual finish time of their last ticket
+        self._stats = {"admitted": 0, "rejected": 0, "started": 0, "completed": 0, "failed": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._service_total = 0.0
+        self._by_priority = {p: {"admitted": 0, "started": 0, "wait_total": 0.0, "wait_max": 0.0}
+                             for p in PRIORITIES}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _count(self, event: str):
+        self._stats[event] += 1
+        logger.incr(f"admission.{event}")
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely free: queued work / worker throughput."""
+        service = self._service_estimate()
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(service * (self.queued + 1) / self.workers)))
+
+    def _service_estimate(self) -> float:
+        done = self._stats["completed"] + self._stats["failed"]
+        return self._service_total / done if done else 1.0
+
+    def _virtual_start(self, user: Optional[str], weight: float, arrived: float) -> float:
+        """Fair-queueing start time of a ticket from `user` (its arrival time if no user)."""
+        if user is None:
+            return arrived
+        start = max(arrived, self._finish.get(user, arrived))
+        self._finish[user] = start + self._service_estimate() / self.workers / max(weight, 1e-6)
+        if len(self._finish) > MAX_TRACKED_USERS:
+            # A finish time in the past is the same as no history
+            self._finish = {u: f for u, f in self._finish.items() if f > arrived}
+        return start
+
+    async def _acquire(self, priority: str, start: float):
+        if self._running < self.workers and not self._waiters:
+            self._running += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (start + PRIORITIES[priority] * self.aging_seconds, next(self._seq), priority, waiter)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done():
+                self._release()  # a slot was handed over just before the cancel
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+
+    def _release(self):
+        # Hand the slot straight to the next waiter; _running stays the same
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)[3]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._running -= 1
+
+    def check(self):
+        """Raise QueueFull (counted as rejected) if a ticket arriving now can't be queued."""
+        if self._running >= self.workers and self.queued >= self.queue_size:
+            self._count("rejected")
+            raise QueueFull(self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, priority: str = DEFAULT_PRIORITY, user: Optional[str] = None, weight: float = 1.0):
+        """
+        Hold a worker slot for the body of the `async with` block, e.g. for
+        a streamed response. Same queueing, rejection and stats as run().
+        """
+        if priority not in PRIORITIES:
+            priority = DEFAULT_PRIORITY
+        self.check()
+
+        self._count("admitted")
+        by_priority = self._by_priority[priority]
+        by_priority["admitted"] += 1
+        admitted = time.monotonic()
+        await self._acquire(priority, self._virtual_start(user, weight, admitted))
+        started = time.monotonic()
+        wait = started - admitted
+        self._stats["started"] += 1
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+        by_priority["started"] += 1
+        by_priority["wait_total"] += wait
+        by_priority["wait_max"] = max(by_priority["wait_max"], wait)
+        logger.incr("admission.wait_seconds", wait)
+        logger.incr(f"admission.wait_seconds.{priority}", wait)
+
+        try:
+            yield
+        except Exception:
+            self._count("failed")
+            raise
+        else:
+            self._count("completed")
+        finally:
+            self._service_total += time.monotonic() - started
+            self._release()
+
+    async def run(self, fn: Callable, *args, priority: str = DEFAULT_PRIORITY,
+                  user: Optional[str] = None, weight: float = 1.0) -> Any:
+        """
+        Run fn(*args) once a slot is free: awaited if it's a coroutine
+        function on the "async" pool, otherwise on the executor. `priority`
+        is a ticket severity ("high", "medium", "low"); `user` and `weight`
+        give the ticket's fair share of the queue.
+        Raises QueueFull when every slot and queue place is taken.
+        """
+        async with self.slot(priority, user, weight):
+            if self._executor is None:
+                result = fn(*args)
+                if asyncio.iscoroutine(result):
+                    result = await result
+                return result
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        started = self._stats["started"]
+        done = self._stats["completed"] + self._stats["failed"]
+        queued = {p: 0 for p in PRIORITIES}
+        for _, _, priority, waiter in self._waiters:
+            if not waiter.done():
+                queued[priority] += 1
+        return {
+            "pool": self.pool,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "running": self._running,
+            "queued": self.queued,
+            "users": len(self._finish),
+            **self._stats,
+            "wait_avg_ms": round(self._wait_total / started * 1000, 2) if started else 0.0,
+            "wait_max_ms": round(self._wait_max * 1000, 2),
+            "service_avg_ms": round(self._service_total / done * 1000, 2) if done else 0.0,
+            "priorities": {
+                p: {
+                    "admitted": s["admitted"],
+                    "started": s["started"],
+                    "queued": queued[p],
+                    "wait_avg_ms": round(s["wait_total"] / s["started"] * 1000, 2) if s["started"] else 0.0,
+                    "wait_max_ms": round(s["wait_max"] * 1000, 2),
+                }
+                for p, s in self._by_priority.items()
+            },
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,259 @@
+"""
+LLM backends behind one interface, selected with LLM_BACKEND.
+
+- "gemini": Google Gemini via google.generativeai (default)
+- "stub":   local and deterministic, no network or quota: replies are built
+            from the prompt, with a configurable latency distribution and
+            error rate, for load tests and benchmarks of everything around
+            the model
+
+Every backend offers generate(), stream() (reply text in chunks) and
+generate_many() (a batch, exceptions returned in place), plus async
+variants, all taking an optional per-call `timeout` in seconds (raising
+TimeoutError). Subclasses only need generate(); the rest have generic
+fallbacks that a backend can override with native calls. Callers normally
+go through core/llm_client.py, which adds concurrency limits, rate limits,
+retries and hedging on top.
+
+Stub settings:
+    LLM_STUB_LATENCY     "fixed:S", "uniform:A,B", "exp:MEAN" or
+                         "lognormal:MEDIAN,SIGMA" seconds (default lognormal:0.5,0.5)
+    LLM_STUB_ERROR_RATE  share of calls raising StubLLMError (default 0)
+    LLM_STUB_SEED        seed for latencies and errors (default 0)
+"""
+import abc
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+from dotenv import load_dotenv
+from utils.observability import logger
+
+load_dotenv()
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+DEFAULT_MODEL = "gemini-2.0-flash-lite-preview-02-05"  # when GEMINI_MODEL is unset
+BATCH_WORKERS = 8  # generate_many() threads
+
+LLM_STUB_LATENCY = os.getenv("LLM_STUB_LATENCY", "lognormal:0.5,0.5")
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+LLM_STUB_SEED = int(os.getenv("LLM_STUB_SEED", "0"))
+STUB_CHUNK_CHARS = 24  # stream() chunk size
+STUB_FIRST_CHUNK = 0.3  # share of the latency spent before the first chunk
+
+
+def default_model() -> str:
+    """The model every agent uses unless given one: GEMINI_MODEL or DEFAULT_MODEL."""
+    return os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+
+
+class LLMBackend(abc.ABC):
+    name = "base"
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or default_model()
+
+    @property
+    def available(self) -> bool:
+        """False if the backend can't be called at all (e.g. no API key)."""
+        return True
+
+    @abc.abstractmethod
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """The model's reply to `prompt`."""
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        return await asyncio.wait_for(asyncio.to_thread(self.generate, prompt, timeout), timeout)
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        yield self.generate(prompt, timeout)
+
+    async def astream(self, prompt: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        yield await self.agenerate(prompt, timeout)
+
+    def generate_many(self, prompts: List[str], max_workers: int = BATCH_WORKERS) -> List:
+        """One reply per prompt, in order; a failed prompt gets its exception instead."""
+        def call(prompt):
+            try:
+                return self.generate(prompt)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(prompts) or 1))) as pool:
+            return list(pool.map(call, prompts))
+
+    async def agenerate_many(self, prompts: List[str]) -> List:
+        return await asyncio.gather(*(self.agenerate(p) for p in prompts), return_exceptions=True)
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model_name: Optional[str] = None):
+        import google.generativeai as genai
+        if GOOGLE_API_KEY:
+            genai.configure(api_key=GOOGLE_API_KEY)
+        super().__init__(model_name)
+        self.model = genai.GenerativeModel(self.model_name)
+
+    @property
+    def available(self) -> bool:
+        return bool(GOOGLE_API_KEY)
+
+    @staticmethod
+    def _options(timeout: Optional[float]) -> Dict:
+        return {"request_options": {"timeout": timeout}} if timeout else {}
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        return self.model.generate_content(prompt, **self._options(timeout)).text
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        return (await self.model.generate_content_async(prompt, **self._options(timeout))).text
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        for chunk in self.model.generate_content(prompt, stream=True, **self._options(timeout)):
+            yield chunk.text
+
+    async def astream(self, prompt: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True, **self._options(timeout))
+        async for chunk in response:
+            yield chunk.text
+
+
+class StubLLMError(RuntimeError):
+    pass
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Sampler for a latency spec like "lognormal:0.5,0.5" (see module docstring)."""
+    kind, _, args = spec.partition(":")
+    try:
+        params = [float(a) for a in args.split(",")] if args else []
+        if kind == "fixed" and len(params) == 1:
+            return lambda rng: params[0]
+        if kind == "uniform" and len(params) == 2:
+            return lambda rng: rng.uniform(params[0], params[1])
+        if kind == "exp" and len(params) == 1:
+            return lambda rng: rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+        if kind == "lognormal" and len(params) == 2:
+            return lambda rng: rng.lognormvariate(math.log(params[0]), params[1]) if params[0] > 0 else 0.0
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency spec '{spec}', expected fixed:S, uniform:A,B, exp:MEAN or lognormal:MEDIAN,SIGMA")
+
+
+def stub_reply(prompt: str) -> str:
+    """
+    Deterministic reply to a prompt: the draft JSON for prompts asking for
+    JSON, otherwise a "score - rationale" line (the evaluation judge).
+    """
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    if "JSON" not in prompt:
+        return f"{3 + int(digest, 16) % 3} - Stub judgement {digest[:8]}."
+    ticket = re.search(r'Ticket: "(.*?)"\n', prompt, re.S)
+    category = re.search(r"Category: (\S+)", prompt)
+    category = category.group(1) if category else "unknown"
+    return json.dumps({
+        "subject": f"Re: {category.replace('_', ' ')}",
+        "body": f"Thanks for reaching out about \"{(ticket.group(1) if ticket else '')[:80]}\". "
+                f"Here is what to do next (reference {digest[:8]}).",
+        "action": "reply",
+        "explain": "stub backend",
+    })
+
+
+class StubBackend(LLMBackend):
+    """
+    Local backend for benchmarks. Replies depend only on the prompt;
+    latencies and errors are drawn from one seeded generator, so a
+    sequential run is reproducible call for call.
+    """
+    name = "stub"
+
+    def __init__(self, model_name: Optional[str] = None, latency: str = LLM_STUB_LATENCY,
+                 error_rate: float = LLM_STUB_ERROR_RATE, seed: int = LLM_STUB_SEED):
+        super().__init__(model_name or "stub")
+        self.latency = latency
+        self.error_rate = error_rate
+        self._sample = parse_latency(latency)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, timeout: Optional[float] = None):
+        """(latency seconds, fails?, times out?) of the next call."""
+        with self._lock:
+            latency, fails = max(0.0, self._sample(self._rng)), self._rng.random() < self.error_rate
+        if timeout is not None and latency > timeout:
+            return timeout, False, True
+        return latency, fails, False
+
+    def _fail(self, timed_out: bool):
+        if timed_out:
+            raise TimeoutError("Stub backend: timed out")
+        logger.incr("llm.stub.errors")
+        raise StubLLMError("Stub backend: injected error")
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        latency, fails, timed_out = self._draw(timeout)
+        time.sleep(latency)
+        if fails or timed_out:
+            self._fail(timed_out)
+        return stub_reply(prompt)
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        latency, fails, timed_out = self._draw(timeout)
+        await asyncio.sleep(latency)
+        if fails or timed_out:
+            self._fail(timed_out)
+        return stub_reply(prompt)
+
+    def _chunks(self, prompt: str, latency: float):
+        reply = stub_reply(prompt)
+        chunks = [reply[i:i + STUB_CHUNK_CHARS] for i in range(0, len(reply), STUB_CHUNK_CHARS)]
+        rest = latency * (1 - STUB_FIRST_CHUNK) / max(1, len(chunks) - 1)
+        return chunks, latency * STUB_FIRST_CHUNK, rest
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        latency, fails, timed_out = self._draw(timeout)
+        chunks, first, rest = self._chunks(prompt, latency)
+        time.sleep(first)
+        if fails or timed_out:
+            self._fail(timed_out)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(rest)
+            yield chunk
+
+    async def astream(self, prompt: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        latency, fails, timed_out = self._draw(timeout)
+        chunks, first, rest = self._chunks(prompt, latency)
+        await asyncio.sleep(first)
+        if fails or timed_out:
+            self._fail(timed_out)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(rest)
+            yield chunk
+
+
+LLM_BACKENDS: Dict[str, Callable[..., LLMBackend]] = {"gemini": GeminiBackend, "stub": StubBackend}
+
+
+def register_backend(name: str, factory: Callable[..., LLMBackend]):
+    """Make a backend selectable as LLM_BACKEND=<name>; factory(model_name=...) -> LLMBackend."""
+    LLM_BACKENDS[name] = factory
+
+
+def get_backend(name: Optional[str] = None, model_name: Optional[str] = None) -> LLMBackend:
+    name = name or LLM_BACKEND
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}', expected one of {tuple(LLM_BACKENDS)}")
+    return LLM_BACKENDS[name](model_name=model_name)
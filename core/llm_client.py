@@ -0,0 +1,590 @@
+"""
+Shared LLM client: one per (backend, model), wrapping the backend with
+
+- a concurrency cap (calls in flight at once, for threads and asyncio alike)
+- requests-per-minute and tokens-per-minute token buckets, so bursts wait
+  for quota here instead of failing upstream with 429s
+- a deadline per call (timeout of each attempt and budget for all of them)
+- retries of transient errors (timeouts, connection errors, 408/429/5xx)
+  with full-jitter exponential backoff, skipped when the next attempt
+  couldn't finish before the deadline
+- optional hedging: when an attempt is slower than LLM_HEDGE_AFTER (seconds,
+  or "p95" for the model's own 95th percentile) a second one is started if a
+  slot and quota are free right away, and the first reply wins
+- a latency histogram per model, with p50/p95/p99 estimates
+
+    client = get_client(model_name="gemini-2.0-flash")
+    text = client.generate(prompt)               # LLMBackend interface
+    text = await client.agenerate(prompt, timeout=10)
+
+Streams are retried only until their first chunk arrives and hold their
+slot until they finish. A losing hedge in a thread can't be interrupted:
+it runs to its own timeout but its reply is dropped.
+
+Settings (defaults for every model; LLM_MODEL_LIMITS overrides them per model,
+e.g. '{"gemini-2.0-flash": {"rpm": 15, "max_concurrency": 2}}'):
+    LLM_MAX_CONCURRENCY   calls in flight (default 8)
+    LLM_RPM, LLM_TPM      requests / tokens per minute (default 0 = unlimited)
+    LLM_TIMEOUT           seconds per attempt (default 30)
+    LLM_DEADLINE          seconds per call, retries included (default 60)
+    LLM_MAX_RETRIES       retries after the first attempt (default 3)
+    LLM_BACKOFF_BASE/MAX  backoff bounds in seconds (default 0.5 / 8)
+    LLM_HEDGE_AFTER       "" (off), seconds, or "p95"
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+from core.llm import LLM_BACKEND, LLMBackend, StubLLMError, default_model, get_backend
+from utils.observability import logger
+from utils.rate_limit import MemoryBucketStore
+
+load_dotenv()
+
+LLM_CLIENT_DEFAULTS = {
+    "max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    "rpm": float(os.getenv("LLM_RPM", "0")),
+    "tpm": float(os.getenv("LLM_TPM", "0")),
+    "timeout": float(os.getenv("LLM_TIMEOUT", "30")),
+    "deadline": float(os.getenv("LLM_DEADLINE", "60")),
+    "max_retries": int(os.getenv("LLM_MAX_RETRIES", "3")),
+    "backoff_base": float(os.getenv("LLM_BACKOFF_BASE", "0.5")),
+    "backoff_max": float(os.getenv("LLM_BACKOFF_MAX", "8")),
+    "hedge_after": os.getenv("LLM_HEDGE_AFTER", ""),
+}
+LLM_MODEL_LIMITS = os.getenv("LLM_MODEL_LIMITS", "")
+RATE_BURST_SECONDS = 10  # a bucket holds this many seconds of quota
+EXPECTED_OUTPUT_TOKENS = 256  # added to the prompt estimate for the TPM bucket
+CHARS_PER_TOKEN = 4
+HEDGE_MIN_SAMPLES = 20  # "p95" hedging starts once a model has this many latencies
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+HISTOGRAM_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, math.inf)
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """The call's deadline passed before an attempt could be made."""
+
+
+def estimate_tokens(prompt: str) -> int:
+    """Rough token count of a call (prompt + expected reply) for the TPM bucket."""
+    return len(prompt) // CHARS_PER_TOKEN + EXPECTED_OUTPUT_TOKENS
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError, StubLLMError)):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    try:
+        return int(code() if callable(code) else code) in RETRYABLE_STATUS
+    except (TypeError, ValueError):
+        return False
+
+
+def model_settings(model_name: str, overrides: Optional[str] = None) -> Dict[str, Any]:
+    """LLM_CLIENT_DEFAULTS with the model's entry of LLM_MODEL_LIMITS applied."""
+    settings = dict(LLM_CLIENT_DEFAULTS)
+    raw = LLM_MODEL_LIMITS if overrides is None else overrides
+    if raw:
+        try:
+            per_model = json.loads(raw)
+        except ValueError as e:
+            raise ValueError(f"Invalid LLM_MODEL_LIMITS, expected a JSON object: {e}")
+        unknown = set(per_model.get(model_name, {})) - set(settings)
+        if unknown:
+            raise ValueError(f"Unknown LLM_MODEL_LIMITS settings {sorted(unknown)} for '{model_name}'")
+        settings.update(per_model.get(model_name, {}))
+    return settings
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; quantiles are bucket upper bounds."""
+
+    def __init__(self, buckets_ms=HISTOGRAM_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * len(buckets_ms)
+        self.count = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        with self._lock:
+            self.counts[next(i for i, b in enumerate(self.buckets_ms) if ms <= b)] += 1
+            self.count += 1
+            self.total_ms += ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound in ms of the bucket holding the q-quantile (None if empty)."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank, seen = q * self.count, 0
+            for bound, n in zip(self.buckets_ms, self.counts):
+                seen += n
+                if seen >= rank:
+                    return bound
+        return self.buckets_ms[-1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = {("inf" if math.isinf(b) else str(b)): n for b, n in zip(self.buckets_ms, self.counts)}
+            count, total = self.count, self.total_ms
+        quantiles = {f"p{int(q * 100)}_ms": self.quantile(q) for q in (0.5, 0.95, 0.99)}
+        return {"count": count, "avg_ms": round(total / count, 1) if count else 0.0,
+                **{k: ("inf" if v is not None and math.isinf(v) else v) for k, v in quantiles.items()},
+                "buckets_ms": buckets}
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+
+class ConcurrencyLimiter:
+    """
+    Counting semaphore shared by threads (acquire) and event loops
+    (aacquire). Freed slots go to waiters first come, first served.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+        return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        waiter.event.wait(timeout)
+        return self._settle(waiter)
+
+    async def aacquire(self, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+            waiter = _Waiter(asyncio.get_running_loop())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._settle(waiter):
+                self.release()
+            raise
+        return self._settle(waiter)
+
+    def _settle(self, waiter: _Waiter) -> bool:
+        """True if the waiter got a slot; otherwise it gives up its place."""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+            return waiter.granted
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True  # the slot passes on, `active` is unchanged
+        if waiter.event is not None:
+            waiter.event.set()
+            return
+        try:
+            waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+        except RuntimeError:  # its loop is closed, nobody will take the slot
+            self.release()
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class LLMClient(LLMBackend):
+    """An LLMBackend wrapping another one with limits, retries and hedging."""
+
+    def __init__(self, backend: LLMBackend, **settings):
+        self.backend = backend
+        self.model_name = backend.model_name
+        self.name = backend.name
+        self.settings = {**model_settings(self.model_name), **settings}
+        s = self.settings
+        self.limiter = ConcurrencyLimiter(int(s["max_concurrency"]))
+        self.buckets = MemoryBucketStore()
+        self.histogram = LatencyHistogram()
+        self._hedge_pool = None
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "successes": 0, "failures": 0, "retries": 0, "timeouts": 0,
+                       "throttled": 0, "hedged": 0, "hedge_wins": 0}
+
+    @property
+    def available(self) -> bool:
+        return self.backend.available
+
+    def _count(self, event: str):
+        with self._lock:
+            self._stats[event] += 1
+        logger.incr(f"llm.{self.model_name}.{event}")
+
+    # ---------- Deadlines, quota and backoff ---------- #
+
+    def _deadline(self, timeout: Optional[float]) -> float:
+        return time.monotonic() + (timeout if timeout is not None else self.settings["deadline"])
+
+    def _attempt_timeout(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded(f"LLM deadline exceeded for {self.model_name}")
+        return min(self.settings["timeout"], remaining)
+
+    def _quotas(self, tokens: int) -> Iterator[Tuple[str, float, float, float]]:
+        """(bucket, rate, burst, cost) for each limit a call of `tokens` tokens is under."""
+        for key, per_minute, cost in (("rpm", self.settings["rpm"], 1), ("tpm", self.settings["tpm"], tokens)):
+            if per_minute <= 0:
+                continue
+            rate = per_minute / 60.0
+            burst = max(1.0, rate * RATE_BURST_SECONDS)
+            yield key, rate, burst, min(cost, burst)
+
+    def _rate_waits(self, tokens: int) -> Iterator[float]:
+        """Takes one request and `tokens` tokens, yielding each wait needed first."""
+        for key, rate, burst, cost in self._quotas(tokens):
+            while True:
+                wait_s = self.buckets.take(key, rate, burst, cost)
+                if wait_s <= 0:
+                    break
+                yield wait_s
+
+    def _throttle(self, wait_s: float, deadline: float):
+        if time.monotonic() + wait_s > deadline:
+            raise LLMDeadlineExceeded(f"LLM quota for {self.model_name} not available before the deadline")
+        self._count("throttled")
+
+    def _admit(self, tokens: int, deadline: float):
+        for wait_s in self._rate_waits(tokens):
+            self._throttle(wait_s, deadline)
+            time.sleep(wait_s)
+        if not self.limiter.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise LLMDeadlineExceeded(f"No LLM slot for {self.model_name} before the deadline")
+
+    async def _aadmit(self, tokens: int, deadline: float):
+        for wait_s in self._rate_waits(tokens):
+            self._throttle(wait_s, deadline)
+            await asyncio.sleep(wait_s)
+        if not await self.limiter.aacquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise LLMDeadlineExceeded(f"No LLM slot for {self.model_name} before the deadline")
+
+    def _try_admit(self, tokens: int) -> bool:
+        """Slot and quota if free right now (for hedges, which never queue)."""
+        if not self.limiter.try_acquire():
+            return False
+        taken = []
+        for key, rate, burst, cost in self._quotas(tokens):
+            if self.buckets.take(key, rate, burst, cost) > 0:
+                for key, burst, cost in taken:  # all or nothing
+                    self.buckets.refund(key, burst, cost)
+                self.limiter.release()
+                return False
+            taken.append((key, burst, cost))
+        return True
+
+    def _backoff(self, error: BaseException, attempt: int, deadline: float) -> Optional[float]:
+        """Seconds to sleep before retrying, or None if the call should fail now."""
+        if attempt >= self.settings["max_retries"] or not is_retryable(error):
+            return None
+        delay = random.uniform(0, min(self.settings["backoff_max"], self.settings["backoff_base"] * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            return None
+        self._count("retries")
+        logger.log_event("llm.retry", {"model": self.model_name, "attempt": attempt + 1,
+                                       "error": str(error)[:200], "delay_s": round(delay, 3)}, level="WARNING")
+        return delay
+
+    def _hedge_delay(self) -> Optional[float]:
+        hedge_after = str(self.settings["hedge_after"] or "")
+        if not hedge_after:
+            return None
+        if hedge_after.startswith("p"):
+            if self.histogram.count < HEDGE_MIN_SAMPLES:
+                return None
+            bound = self.histogram.quantile(int(hedge_after[1:]) / 100)
+            return None if bound is None or math.isinf(bound) else bound / 1000
+        return float(hedge_after) or None
+
+    def _hedge_plan(self, deadline: float) -> Optional[float]:
+        """
+        The hedge delay for an admitted attempt, or None if a hedge couldn't
+        fire: hedging is off, the deadline comes first or no slot is spare.
+        """
+        delay = self._hedge_delay()
+        if delay is None or time.monotonic() + delay >= deadline or self.limiter.active >= self.limiter.limit:
+            return None
+        return delay
+
+    def _finished(self, start: float, error: Optional[BaseException] = None):
+        if error is None:
+            self.histogram.observe(time.perf_counter() - start)
+            self._count("successes")
+        elif isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+            self._count("timeouts")
+
+    # ---------- Attempts ---------- #
+
+    def _attempt(self, prompt: str, tokens: int, deadline: float, admitted: bool = False) -> str:
+        if not admitted:
+            self._admit(tokens, deadline)
+        start = time.perf_counter()
+        try:
+            text = self.backend.generate(prompt, timeout=self._attempt_timeout(deadline))
+        except Exception as e:
+            self._finished(start, e)
+            raise
+        finally:
+            self.limiter.release()
+        self._finished(start)
+        return text
+
+    async def _aattempt(self, prompt: str, tokens: int, deadline: float, admitted: bool = False) -> str:
+        if not admitted:
+            await self._aadmit(tokens, deadline)
+        start = time.perf_counter()
+        try:
+            timeout = self._attempt_timeout(deadline)
+            text = await asyncio.wait_for(self.backend.agenerate(prompt, timeout=timeout), timeout)
+        except Exception as e:
+            self._finished(start, e)
+            raise
+        finally:
+            self.limiter.release()
+        self._finished(start)
+        return text
+
+    def _hedged(self, prompt: str, tokens: int, deadline: float) -> str:
+        # Queue for quota and a slot here, so only a call that may be hedged
+        # goes to the pool, and it starts there right away
+        self._admit(tokens, deadline)
+        delay = self._hedge_plan(deadline)
+        if delay is None:
+            return self._attempt(prompt, tokens, deadline, True)
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=2 * self.limiter.limit,
+                                                      thread_name_prefix=f"llm-hedge-{self.model_name}")
+        primary = self._hedge_pool.submit(self._attempt, prompt, tokens, deadline, True)
+        done, _ = wait([primary], timeout=delay)
+        if done or time.monotonic() >= deadline or not self._try_admit(tokens):
+            return primary.result()
+        self._count("hedged")
+        hedge = self._hedge_pool.submit(self._attempt, prompt, tokens, deadline, True)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _ahedged(self, prompt: str, tokens: int, deadline: float) -> str:
+        await self._aadmit(tokens, deadline)
+        delay = self._hedge_plan(deadline)
+        if delay is None:
+            return await self._aattempt(prompt, tokens, deadline, True)
+        primary = asyncio.ensure_future(self._aattempt(prompt, tokens, deadline, True))
+        tasks, error = {primary}, None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or time.monotonic() >= deadline or not self._try_admit(tokens):
+                return await primary
+            self._count("hedged")
+            hedge = asyncio.ensure_future(self._aattempt(prompt, tokens, deadline, True))
+            tasks.add(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # ---------- LLMBackend interface ---------- #
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Reply text; `timeout` is the whole call's deadline (default LLM_DEADLINE)."""
+        deadline, tokens = self._deadline(timeout), estimate_tokens(prompt)
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                return self._hedged(prompt, tokens, deadline)
+            except Exception as e:
+                delay = self._backoff(e, attempt, deadline)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    async def agenerate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        deadline, tokens = self._deadline(timeout), estimate_tokens(prompt)
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                return await self._ahedged(prompt, tokens, deadline)
+            except Exception as e:
+                delay = self._backoff(e, attempt, deadline)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def stream(self, prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+        deadline, tokens = self._deadline(timeout), estimate_tokens(prompt)
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                self._admit(tokens, deadline)
+            except Exception:
+                self._count("failures")
+                raise
+            start = time.perf_counter()
+            try:
+                chunks = iter(self.backend.stream(prompt, timeout=self._attempt_timeout(deadline)))
+                first = next(chunks, None)
+            except Exception as e:
+                self.limiter.release()
+                self._finished(start, e)
+                delay = self._backoff(e, attempt, deadline)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            break
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        except Exception as e:
+            self._finished(start, e)
+            self._count("failures")
+            raise
+        else:
+            self._finished(start)
+        finally:
+            self.limiter.release()
+
+    async def astream(self, prompt: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        deadline, tokens = self._deadline(timeout), estimate_tokens(prompt)
+        self._count("calls")
+        attempt = 0
+        while True:
+            try:
+                await self._aadmit(tokens, deadline)
+            except Exception:
+                self._count("failures")
+                raise
+            start = time.perf_counter()
+            chunks = None
+            try:
+                timeout_s = self._attempt_timeout(deadline)
+                chunks = self.backend.astream(prompt, timeout=timeout_s).__aiter__()
+                first = await asyncio.wait_for(anext(chunks, None), timeout_s)
+            except Exception as e:
+                self.limiter.release()
+                self._finished(start, e)
+                if chunks is not None and hasattr(chunks, "aclose"):
+                    await chunks.aclose()
+                delay = self._backoff(e, attempt, deadline)
+                if delay is None:
+                    self._count("failures")
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            break
+        try:
+            if first is not None:
+                yield first
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            self._finished(start, e)
+            self._count("failures")
+            raise
+        else:
+            self._finished(start)
+        finally:
+            self.limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        s = self.settings
+        return {"backend": self.name, "model": self.model_name, **stats,
+                "in_flight": self.limiter.active, "waiting": self.limiter.waiting,
+                "limits": {k: s[k] for k in ("max_concurrency", "rpm", "tpm", "timeout", "deadline",
+                                             "max_retries", "hedge_after")},
+                "latency": self.histogram.stats()}
+
+
+_clients: Dict[Tuple[str, str], LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name: Optional[str] = None, model_name: Optional[str] = None) -> LLMClient:
+    """The shared client for a backend (LLM_BACKEND by default) and model."""
+    key = (name or LLM_BACKEND, model_name or default_model())
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = LLMClient(get_backend(*key))
+        return _clients[key]
+
+
+def clients_stats() -> Dict[str, Any]:
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {f"{c.name}:{c.model_name}": c.stats() for c in clients}
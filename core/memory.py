@@ -1,6 +1,8 @@
 import json
 import os
-from typing import List, Dict, Any
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple
 from utils.observability import logger
 
 MEMORY_FILE = "core/memory_bank.json"
@@ -8,6 +10,10 @@ MEMORY_FILE = "core/memory_bank.json"
 class MemoryBank:
     def __init__(self, filepath=MEMORY_FILE):
         self.filepath = filepath
+        self._lock = threading.RLock()
+        self._deferred = 0  # open batch() blocks
+        self._dirty = False
+        self._journal = None  # detached: changes kept for drain() instead of saved
         self._load_memory()
 
     def _load_memory(self):
@@ -22,15 +28,74 @@ class MemoryBank:
             self._save_memory()
 
     def _save_memory(self):
-        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
-        with open(self.filepath, 'w') as f:
-            json.dump(self.data, f, indent=2)
+        with self._lock:
+            if self._journal is not None:
+                return
+            if self._deferred:
+                self._dirty = True
+                return
+            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            with open(self.filepath, 'w') as f:
+                json.dump(self.data, f, indent=2)
+            self._dirty = False
+
+    @contextmanager
+    def batch(self):
+        """Defer file writes made inside the block to a single save at the end."""
+        with self._lock:
+            self._deferred += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._deferred -= 1
+                if not self._deferred and self._dirty:
+                    self._save_memory()
+
+    def detach(self):
+        """
+        Stop writing the file (in process-pool workers, where every process
+        has its own bank): changes stay visible here and are handed to the
+        parent by drain(), which persists them with apply().
+        """
+        with self._lock:
+            if self._journal is None:
+                self._journal = []
+
+    def drain(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """(section, record) changes made since the last drain() of a detached bank."""
+        with self._lock:
+            changes = self._journal or []
+            if self._journal is not None:
+                self._journal = []
+        return changes
+
+    def apply(self, changes: List[Tuple[str, Dict[str, Any]]]):
+        """Persist changes drained from a detached bank, with one file write."""
+        with self._lock:
+            for section, record in changes:
+                self._append(section, record)
+            self._save_memory()
+
+    def _append(self, section: str, record: Dict[str, Any]):
+        self.data[section].append(record)
+        if self._journal is not None:
+            self._journal.append((section, record))
 
     def add_ticket(self, ticket_data: Dict[str, Any]):
         """Saves a processed ticket to history."""
-        self.data["tickets"].append(ticket_data)
-        self._save_memory()
+        with self._lock:
+            self._append("tickets", ticket_data)
+            self._save_memory()
         logger.log_event("memory.add_ticket", {" ticket_id": ticket_data.get("id")})
+
+    def add_tickets(self, tickets: List[Dict[str, Any]]):
+        """Saves many processed tickets with one file write."""
+        with self._lock:
+            for ticket in tickets:
+                self._append("tickets", ticket)
+            self._save_memory()
+        logger.log_event("memory.add_tickets", {"count": len(tickets)})
     
     def get_ticket(self, ticket_id: str) -> Dict[str, Any]:
         """Retrieves a ticket from memory by ID. Returns None if not found."""
@@ -44,8 +109,9 @@ class MemoryBank:
         return [t for t in self.data["tickets"] if t.get("category") == category][-3:] # Return last 3
 
     def log_escalation(self, ticket_id: str, reason: str):
-        self.data["escalations"].append({"ticket_id": ticket_id, "reason": reason, "timestamp": str(datetime.now())})
-        self._save_memory()
+        with self._lock:
+            self._append("escalations", {"ticket_id": ticket_id, "reason": reason, "timestamp": str(datetime.now())})
+            self._save_memory()
 
 class SessionManager:
     def __init__(self):
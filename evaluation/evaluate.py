@@ -2,16 +2,12 @@ import os
 import csv
 import time
 import re
-import google.generativeai as genai
 from agents.triage_agent import triage_agent
+from core.llm_client import get_client
 from dotenv import load_dotenv
 
 load_dotenv()
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-
 EVAL_PROMPTS_FILE = "docs/evaluation_prompts.txt"
 EVAL_RESULTS_FILE = "docs/evaluation.csv"
 
@@ -53,17 +49,17 @@ def _parse_score_from_text(text: str) -> int:
     
     return -1
 
-def evaluate_response(query, response, expected_category=None, max_retries=2, backoff=1.0):
+def evaluate_response(query, response, expected_category=None):
     """
     Uses an LLM to judge the quality of the response.
     Returns: (score:int 1..5, reason:str)
+    Retries, timeouts and quota waits are handled by the shared LLM client
+    (LLM_MAX_RETRIES, LLM_DEADLINE, LLM_RPM, ...).
     """
-    if not GOOGLE_API_KEY:
+    judge = get_client()  # LLM_BACKEND, e.g. "stub" for offline runs
+    if not judge.available:
         return 0, "No API Key"
 
-    model_name = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite-preview-02-05")
-    model = genai.GenerativeModel(model_name)
-
     prompt = f"""
 You are an expert customer support quality assurance judge.
 Evaluate the following response to a customer ticket.
@@ -80,39 +76,29 @@ Return a short reply that starts with the numeric score (1-5) followed by a brie
 Return ONLY the score and a one-line rationale.
 """
 
-    last_exc = None
-    for attempt in range(max_retries + 1):
-        try:
-            result = model.generate_content(prompt)
-            raw = (result.text or "").strip()
-            score = _parse_score_from_text(raw)
-            
-            if score == -1:
-                # Fallback: try heuristic keyword matching
-                txt = raw.lower()
-                if re.search(r'\b(excellent|very good|5)\b', txt):
-                    score = 5
-                elif re.search(r'\b(good|helpful|4)\b', txt):
-                    score = 4
-                elif re.search(r'\b(average|ok|3)\b', txt):
-                    score = 3
-                elif re.search(r'\b(poor|2)\b', txt):
-                    score = 2
-                else:
-                    score = 3  # neutral fallback
-            
-            score = max(1, min(5, int(score)))
-            return score, f"Evaluated by Gemini (raw: {raw[:200]})"
-            
-        except Exception as e:
-            last_exc = e
-            time.sleep(backoff * (2 ** attempt))
-            continue
-
-    # Fallback after all retries
-    fallback_score = 3
-    reason = f"Fallback scoring used after errors: {str(last_exc)}"
-    return fallback_score, reason
+    try:
+        raw = (judge.generate(prompt) or "").strip()
+    except Exception as e:
+        # Fallback after the client's retries
+        return 3, f"Fallback scoring used after errors: {str(e)}"
+
+    score = _parse_score_from_text(raw)
+    if score == -1:
+        # Fallback: try heuristic keyword matching
+        txt = raw.lower()
+        if re.search(r'\b(excellent|very good|5)\b', txt):
+            score = 5
+        elif re.search(r'\b(good|helpful|4)\b', txt):
+            score = 4
+        elif re.search(r'\b(average|ok|3)\b', txt):
+            score = 3
+        elif re.search(r'\b(poor|2)\b', txt):
+            score = 2
+        else:
+            score = 3  # neutral fallback
+
+    score = max(1, min(5, int(score)))
+    return score, f"Evaluated by {judge.name} (raw: {raw[:200]})"
 
 def run_evaluation():
     print("Starting Evaluation...")
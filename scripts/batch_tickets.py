@@ -49,8 +49,8 @@ TEST_TICKETS = [
     {"description": "I have been trying to access my account for the past 3 days but every time I enter my password it says incorrect even though I know it's right. I tried resetting it multiple times but the email never arrives. This is very frustrating and I need access urgently for work. Please help!", "expected": "escalated"},
 ]
 
-def run_batch(count=30, delay=0.1):
-    """Run batch processing of tickets."""
+def run_batch(count=30, delay=0.1, batch_size=10):
+    """Run batch processing of tickets through TriageAgent.process_tickets."""
     print(f"{Fore.BLUE}{'='*60}{Style.RESET_ALL}")
     print(f"{Fore.BLUE}Batch Ticket Processing - {count} tickets{Style.RESET_ALL}")
     print(f"{Fore.BLUE}{'='*60}{Style.RESET_ALL}\n")
@@ -76,13 +76,29 @@ def run_batch(count=30, delay=0.1):
     
     start_time = time.time()
     
-    for i, ticket in enumerate(tickets_to_process, 1):
-        print(f"{Fore.CYAN}[{i}/{count}]{Style.RESET_ALL} Processing: {ticket['description'][:50]}...")
+    for start in range(0, count, batch_size):
+        batch = tickets_to_process[start:start + batch_size]
+        print(f"{Fore.CYAN}[{start + 1}-{start + len(batch)}/{count}]{Style.RESET_ALL} Processing batch of {len(batch)}...")
         
         try:
-            result = triage_agent.process_ticket(ticket)
+            batch_results = triage_agent.process_tickets(batch)
+        except Exception as e:
+            batch_results = [{"status": "error", "error": str(e)}] * len(batch)
+        
+        for ticket, result in zip(batch, batch_results):
             status = result.get("status", "unknown")
             
+            if status == "error":
+                results["errors"] += 1
+                results["tickets"].append({
+                    "id": ticket["id"],
+                    "description": ticket["description"][:50],
+                    "status": "error",
+                    "error": result.get("error")
+                })
+                print(f"  {Fore.RED}✗ {ticket['description'][:50]}: Error: {result.get('error')}{Style.RESET_ALL}")
+                continue
+            
             results["total"] += 1
             if status == "drafted":
                 results["drafted"] += 1
@@ -102,17 +118,7 @@ def run_batch(count=30, delay=0.1):
                 "match": status == ticket["expected"]
             })
             
-            print(f"  {icon} Status: {status}")
-            
-        except Exception as e:
-            results["errors"] += 1
-            results["tickets"].append({
-                "id": ticket["id"],
-                "description": ticket["description"][:50],
-                "status": "error",
-                "error": str(e)
-            })
-            print(f"  {Fore.RED}✗ Error: {e}{Style.RESET_ALL}")
+            print(f"  {icon} {ticket['description'][:50]} -> {status}")
         
         time.sleep(delay)
     
@@ -144,8 +150,9 @@ def run_batch(count=30, delay=0.1):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Batch ticket processing stress test")
     parser.add_argument("--count", type=int, default=30, help="Number of tickets to process")
-    parser.add_argument("--delay", type=float, default=0.1, help="Delay between tickets (seconds)")
+    parser.add_argument("--delay", type=float, default=0.1, help="Delay between batches (seconds)")
+    parser.add_argument("--batch-size", type=int, default=10, help="Tickets per process_tickets() call")
     
     args = parser.parse_args()
     
-    run_batch(count=args.count, delay=args.delay)
+    run_batch(count=args.count, delay=args.delay, batch_size=args.batch_size)
@@ -0,0 +1,96 @@
+"""
+Throughput/tail-latency benchmark of the ticket pipeline on the stub LLM.
+
+    python scripts/bench_pipeline.py [--tickets 500] [--concurrency 32]
+                                     [--latency lognormal:0.5,0.5] [--error-rate 0.0]
+                                     [--seed 0] [--cache] [--duplicates]
+
+Everything but the model runs for real (classification, KB search, memory
+writes, escalations, draft prompt building) against the deterministic stub
+backend from core/llm.py, behind the shared client from core/llm_client.py
+(LLM_MAX_CONCURRENCY, LLM_RPM, retries, LLM_HEDGE_AFTER, ...), so runs are
+repeatable offline. The web-search
+fallback is replaced by an empty result for the same reason, and memory is
+written to a temporary file. Tickets are the demo tickets, numbered so
+each one is distinct unless --duplicates lets identical tickets share
+drafts through the single-flight layer; --cache keeps the draft cache on.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from colorama import Fore, Style
+from agents.draft_agent import draft_agent
+from agents.triage_agent import triage_agent
+from core.llm import StubBackend
+from core.llm_client import LLMClient
+from core.memory import memory_bank
+from tools.web_search_tool import web_search_tool
+from utils.cache import LRUCache, TieredCache
+
+TICKETS_FILE = "demo_data/test_tickets.json"
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else 0.0
+
+def make_tickets(n, duplicates):
+    with open(TICKETS_FILE, "r") as f:
+        descriptions = [t["description"] for t in json.load(f)]
+    return [{"id": f"bench_{i}", "user_id": f"bench_user_{i % 50}",
+             "description": descriptions[i % len(descriptions)] + ("" if duplicates else f" #{i}")}
+            for i in range(n)]
+
+async def run(tickets, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], Counter()
+
+    async def one(ticket):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await triage_agent.aprocess_ticket(ticket)
+            latencies.append(time.perf_counter() - start)
+            error = result["status"] == "drafted" and result["reply"].startswith("Error generating")
+            statuses["error" if error else result["status"]] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(t) for t in tickets))
+    return time.perf_counter() - start, latencies, statuses
+
+def main():
+    parser = argparse.ArgumentParser(description="Ticket pipeline benchmark on the stub LLM backend")
+    parser.add_argument("--tickets", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", default="lognormal:0.5,0.5", help="Stub latency spec, see core/llm.py")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="Keep the draft cache enabled")
+    parser.add_argument("--duplicates", action="store_true", help="Don't number tickets apart")
+    args = parser.parse_args()
+
+    draft_agent.llm = LLMClient(StubBackend(latency=args.latency, error_rate=args.error_rate, seed=args.seed))
+    if not args.cache:
+        draft_agent.cache = TieredCache(LRUCache("draft_bench", maxsize=0))
+    web_search_tool._search = lambda query, max_results: []  # offline
+    memory_bank.filepath = os.path.join(tempfile.mkdtemp(prefix="bench_"), "memory_bank.json")
+
+    tickets = make_tickets(args.tickets, args.duplicates)
+    elapsed, latencies, statuses = asyncio.run(run(tickets, args.concurrency))
+
+    print(f"{Fore.CYAN}{len(tickets)} tickets, concurrency {args.concurrency}, "
+          f"stub latency {args.latency}, error rate {args.error_rate}{Style.RESET_ALL}")
+    print(f"throughput  {len(tickets) / elapsed:8.1f} tickets/s ({elapsed:.2f}s)")
+    for q in (50, 95, 99):
+        print(f"p{q:<10} {percentile(latencies, q) * 1000:8.1f} ms")
+    print(f"max         {max(latencies) * 1000:8.1f} ms")
+    print("statuses    " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items())))
+    print(f"collapsed   {draft_agent.flight.stats()['collapsed']:8d} draft calls")
+    llm = draft_agent.llm.stats()
+    print(f"llm         {llm['calls']} calls, {llm['retries']} retries, {llm['timeouts']} timeouts, "
+          f"{llm['hedged']} hedged ({llm['hedge_wins']} won), model p95 {llm['latency']['p95_ms']} ms")
+
+if __name__ == "__main__":
+    main()
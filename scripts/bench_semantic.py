@@ -0,0 +1,79 @@
+"""
+Recall/latency benchmark for the semantic KB backend's IVF index.
+
+    python scripts/bench_semantic.py [--input tools/kb_data.json] [--synthetic 20000]
+                                     [--queries 500] [--nprobe 1 2 4 8 16] [--top-k 3]
+
+Every nprobe setting is compared against an exact (brute-force) search over
+the same vectors: recall@k is the share of the exact top-k articles the IVF
+search also returns. The bundled KB is tiny, so --synthetic adds generated
+articles (sentences drawn from random topics over a made-up vocabulary) to
+get a corpus where probing fewer lists actually matters. Queries are short
+word windows taken from random articles.
+"""
+import argparse
+import random
+import time
+from colorama import Fore, Style
+from tools.kb_ingest import chunk_article, iter_articles
+from tools.kb_semantic import SemanticIndex
+from tools.kb_tool import KB_FILE
+
+def synthetic_articles(n, rng, n_topics=200, vocab_size=5000, topic_words=40):
+    """Articles drawn mostly (80%) from one of n_topics word sets over a generated vocabulary."""
+    syllables = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+    vocab = sorted({"".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(vocab_size)})
+    topics = [rng.sample(vocab, topic_words) for _ in range(n_topics)]
+    for i in range(n):
+        topic = rng.choice(topics)
+        words = lambda k: " ".join(rng.choice(topic) if rng.random() < 0.8 else rng.choice(vocab) for _ in range(k))
+        sentences = [words(rng.randint(6, 14)) + "." for _ in range(rng.randint(2, 6))]
+        yield {"id": f"synthetic_{i}", "title": words(4), "content": " ".join(sentences)}
+
+def sample_queries(kb, n, rng):
+    queries = []
+    for _ in range(n):
+        words = rng.choice(kb)["content"].split()
+        start = rng.randint(0, max(0, len(words) - 6))
+        queries.append(" ".join(words[start:start + rng.randint(3, 6)]))
+    return queries
+
+def run(index, queries, top_k, nprobe):
+    index.nprobe = nprobe
+    start = time.perf_counter()
+    results = [[doc_id for doc_id, _ in index.search(q, top_k)[0]] for q in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic KB index recall vs brute force")
+    parser.add_argument("--input", default=KB_FILE, help=".json/.jsonl KB or docs directory")
+    parser.add_argument("--synthetic", type=int, default=20000, help="Generated articles to add")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    kb = [passage for item in iter_articles(args.input) for passage in chunk_article(item)]
+    kb += list(synthetic_articles(args.synthetic, rng))
+    queries = sample_queries(kb, args.queries, rng)
+
+    start = time.time()
+    # min_score=-1: compare rankings, not what the threshold lets through
+    index = SemanticIndex(kb, min_score=-1.0)
+    print(f"{Fore.CYAN}Indexed {len(kb)} articles as {len(index.passage_doc)} passages in "
+          f"{index.ivf.n_lists} lists ({time.time() - start:.1f}s){Style.RESET_ALL}")
+
+    exact, exact_ms = run(index, queries, args.top_k, index.ivf.n_lists)
+    print(f"{'nprobe':>8} {'recall@' + str(args.top_k):>10} {'ms/query':>10} {'speedup':>8}")
+    for nprobe in sorted(args.nprobe):
+        approx, ms = run(index, queries, args.top_k, nprobe)
+        found = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+        recall = found / max(1, sum(len(e) for e in exact))
+        color = Fore.GREEN if recall >= 0.9 else Fore.YELLOW
+        print(f"{color}{nprobe:>8} {recall:>10.3f} {ms:>10.2f} {exact_ms / ms:>7.1f}x{Style.RESET_ALL}")
+    print(f"{'exact':>8} {1.0:>10.3f} {exact_ms:>10.2f} {1.0:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+KB maintenance commands.
+
+    python scripts/kb.py compile [--input tools/kb_data.json] [--output tools/kb_data.kbidx]
+    python scripts/kb.py ingest SOURCE [SOURCE ...] --output help_center.kbidx [--workers N]
+
+`compile` writes the memory-mappable index that KBSearchTool loads when
+KB_PATH points at a .kbidx file. `ingest` builds the same index by
+streaming JSONL files and Markdown/HTML directories (see tools/kb_ingest.py).
+"""
+import argparse
+import json
+import os
+import time
+from colorama import Fore, Style
+from tools.kb_tool import KB_FILE, INDEX_SUFFIX
+from tools.kb_index import compile_kb
+from tools.kb_ingest import CHUNK_CHARS, ingest
+
+def cmd_compile(args):
+    output = args.output or os.path.splitext(args.input)[0] + INDEX_SUFFIX
+    start = time.time()
+    with open(args.input, "r") as f:
+        kb = json.load(f)
+    n_docs = compile_kb(kb, output)
+    elapsed = time.time() - start
+    print(f"{Fore.GREEN}Compiled {n_docs} articles -> {output} "
+          f"({os.path.getsize(output) / 1024:.1f} KiB, {elapsed:.2f}s){Style.RESET_ALL}")
+
+def cmd_ingest(args):
+    start = time.time()
+    stats = ingest(args.sources, args.output, workers=args.workers, chunk_chars=args.chunk_chars)
+    elapsed = time.time() - start
+    print(f"{Fore.GREEN}Ingested {stats['articles']} articles as {stats['passages']} passages -> {args.output} "
+          f"({os.path.getsize(args.output) / 1024:.1f} KiB, {elapsed:.2f}s){Style.RESET_ALL}")
+
+def main():
+    parser = argparse.ArgumentParser(description="KB maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_compile = sub.add_parser("compile", help="Compile a JSON KB into a memory-mapped index")
+    p_compile.add_argument("--input", default=KB_FILE, help="KB JSON array to compile")
+    p_compile.add_argument("--output", default=None, help=f"Output path (default: input with {INDEX_SUFFIX})")
+    p_compile.set_defaults(func=cmd_compile)
+
+    p_ingest = sub.add_parser("ingest", help="Stream JSONL files / Markdown+HTML directories into an index")
+    p_ingest.add_argument("sources", nargs="+", help=".jsonl/.json files or documentation directories")
+    p_ingest.add_argument("--output", required=True, help=f"Index path (ends with {INDEX_SUFFIX})")
+    p_ingest.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count, 1 = in-process)")
+    p_ingest.add_argument("--chunk-chars", type=int, default=CHUNK_CHARS, help="Max characters per passage")
+    p_ingest.set_defaults(func=cmd_ingest)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
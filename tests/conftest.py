@@ -0,0 +1,11 @@
+"""
+Shared fixtures: keep tests off the persistent draft cache.
+"""
+import pytest
+from agents.draft_agent import draft_agent
+from utils.cache import LRUCache, TieredCache
+
+@pytest.fixture(autouse=True)
+def fresh_draft_cache(monkeypatch):
+    """Each test starts with an empty, memory-only draft cache"""
+    monkeypatch.setattr(draft_agent, "cache", TieredCache(LRUCache("draft_test", maxsize=1024)))
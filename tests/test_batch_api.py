@@ -0,0 +1,104 @@
+"""
+Tests for the streaming endpoints: POST /process/batch (NDJSON) and POST /process/stream (SSE)
+"""
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+from app.main import parse_batch, process_batch
+
+class FakeRequest:
+    def __init__(self, body: bytes):
+        self._body = body
+
+    async def body(self):
+        return self._body
+
+def test_parse_batch_accepts_array_and_ndjson():
+    array = json.dumps([{"id": "t1", "description": "a"}, {"id": "t2", "description": "b", "user_id": "u"}])
+    ndjson = '{"id": "t1", "description": "a"}\n\n{"id": "t2", "description": "b", "user_id": "u"}\n'
+    for body in (array, ndjson):
+        tickets = parse_batch(body.encode())
+        assert [(t.id, t.user_id) for t in tickets] == [("t1", None), ("t2", "u")]
+    with pytest.raises(ValueError, match="line 2"):
+        parse_batch(b'{"id": "t1", "description": "a"}\n{oops\n')
+    with pytest.raises(ValueError, match="ticket 0"):
+        parse_batch(b'[{"id": "t1"}]')
+
+def test_process_batch_streams_ndjson(monkeypatch, tmp_path):
+    from core.memory import memory_bank
+    monkeypatch.setattr(memory_bank, "filepath", str(tmp_path / "memory.json"))
+    body = "\n".join(json.dumps({"id": f"n{i}", "description": d}) for i, d in
+                     enumerate(["How do I enable dark mode?", "My payment was charged twice"]))
+
+    async def run():
+        response = await process_batch(FakeRequest(body.encode()))
+        assert response.media_type == "application/x-ndjson"
+        return [json.loads(line) async for line in response.body_iterator]
+
+    lines = asyncio.run(run())
+    by_id = {line["ticket_id"]: line for line in lines}
+    assert set(by_id) == {"n0", "n1"}
+    assert by_id["n1"]["status"] == "escalated"
+    assert by_id["n1"]["metadata"] == {"category": "billing", "severity": "high"}
+
+    with pytest.raises(HTTPException) as bad:
+        asyncio.run(process_batch(FakeRequest(b"not json")))
+    assert bad.value.status_code == 400
+
+def test_process_batch_charges_rate_limit_and_takes_admission_slots(monkeypatch, tmp_path):
+    import app.main as api
+    from core.memory import memory_bank
+    from utils.rate_limit import MemoryBucketStore, RateLimiter
+    monkeypatch.setattr(memory_bank, "filepath", str(tmp_path / "memory.json"))
+    monkeypatch.setattr(api, "rate_limiter", RateLimiter(per_minute=1, burst=3, store=MemoryBucketStore()))
+    batch = lambda n, user: "\n".join(json.dumps({"id": f"r{i}", "description": "I was charged twice", "user_id": user})
+                                      for i in range(n)).encode()
+
+    async def run(body):
+        response = await process_batch(FakeRequest(body))
+        return [json.loads(line) async for line in response.body_iterator]
+
+    admitted = api.admission.stats()["admitted"]
+    assert len(asyncio.run(run(batch(2, "u1")))) == 2
+    assert api.admission.stats()["admitted"] == admitted + 2
+    with pytest.raises(HTTPException) as limited:  # 1 of 3 tokens left
+        asyncio.run(run(batch(2, "u1")))
+    assert limited.value.status_code == 429 and "Retry-After" in limited.value.headers
+    with pytest.raises(HTTPException) as too_big:
+        asyncio.run(run(batch(4, "u2")))
+    assert too_big.value.status_code == 413
+
+def test_rejected_mixed_user_batch_charges_nobody(monkeypatch):
+    import app.main as api
+    from utils.rate_limit import MemoryBucketStore, RateLimiter
+    limiter = RateLimiter(per_minute=1, burst=3, store=MemoryBucketStore())
+    monkeypatch.setattr(api, "rate_limiter", limiter)
+    batch = lambda *users: "\n".join(json.dumps({"id": f"m{i}", "description": "help", "user_id": user})
+                                      for i, user in enumerate(users)).encode()
+
+    with pytest.raises(HTTPException) as too_big:
+        asyncio.run(process_batch(FakeRequest(batch(*["ok"] * 3, *["big"] * 5))))
+    assert too_big.value.status_code == 413
+
+    assert limiter.acquire("busy", cost=3) == (True, 0)
+    with pytest.raises(HTTPException) as limited:
+        asyncio.run(process_batch(FakeRequest(batch(*["ok"] * 3, "busy"))))
+    assert limited.value.status_code == 429
+    assert limiter.acquire("ok", cost=3) == (True, 0)  # refunded after the 429
+
+def test_process_stream_emits_sse_events(monkeypatch, tmp_path):
+    from core.memory import memory_bank
+    from app.main import TicketRequest, process_ticket_stream
+    monkeypatch.setattr(memory_bank, "filepath", str(tmp_path / "memory.json"))
+
+    async def run():
+        response = await process_ticket_stream(TicketRequest(id="s1", description="I was charged twice"))
+        assert response.media_type == "text/event-stream"
+        return "".join([chunk async for chunk in response.body_iterator])
+
+    messages = [m for m in asyncio.run(run()).split("\n\n") if m]
+    events = [m.split("\n")[0] for m in messages]
+    assert events == ["event: analysis", "event: done"]  # escalated: no draft deltas
+    done = json.loads(messages[-1].split("data: ", 1)[1])
+    assert (done["ticket_id"], done["status"]) == ("s1", "escalated")
@@ -0,0 +1,59 @@
+"""
+Unit tests for the LRU/TTL caches
+"""
+import time
+from utils.cache import DiskCache, LRUCache, TieredCache
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache("test_lru", maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recent
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3 and stats["misses"] == 1
+
+def test_ttl_expires_entries():
+    cache = LRUCache("test_ttl", maxsize=10, ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a", "gone") == "gone"
+    assert cache.stats()["expired"] == 1
+
+def test_zero_size_disables_caching():
+    cache = LRUCache("test_off", maxsize=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_disk_cache_persists_and_evicts(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = DiskCache("test_disk", path, maxsize=2)
+    cache.set("a", {"reply": "one"})
+    cache.set("b", "two")
+    writes = cache._db.total_changes
+    assert cache.get("a") == {"reply": "one"}  # "a" is now most recent
+    assert cache._db.total_changes == writes  # ...in memory until the next set()
+    time.sleep(0.01)
+    cache.set("c", "three")
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+    reopened = DiskCache("test_disk", path, maxsize=2)
+    assert reopened.get("a") == {"reply": "one"} and reopened.get("c") == "three"
+
+def test_tiered_cache_promotes_disk_hits(tmp_path):
+    disk = DiskCache("test_tier_disk", str(tmp_path / "cache.db"), ttl=60)
+    TieredCache(LRUCache("test_tier_old"), disk).set("k", "v")
+
+    cache = TieredCache(LRUCache("test_tier"), disk)  # e.g. after a restart
+    assert cache.get("k") == "v"
+    assert cache.get("k") == "v"
+    stats = cache.stats()
+    assert (stats["memory"]["hits"], stats["disk"]["hits"]) == (1, 1)
+    assert stats["hit_rate"] == 1.0
+    assert cache.get("missing", "default") == "default"
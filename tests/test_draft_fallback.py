@@ -3,6 +3,8 @@ Tests for draft agent fallback behavior and edge cases.
 """
 import pytest
 from agents.draft_agent import DraftReplyAgent
+from core.llm import LLMBackend, StubBackend
+from utils.cache import LRUCache, TieredCache
 
 class TestDraftAgentFallback:
     
@@ -98,3 +100,103 @@ class TestDraftAgentFallback:
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
+
+def test_identical_tickets_reuse_cached_draft(monkeypatch):
+    """The second identical ticket is answered from the draft cache, not the model"""
+    calls = []
+    reply = '{"subject": "Re", "body": "Enable it in Settings", "action": "reply"}'
+
+    class FakeBackend(LLMBackend):
+        def generate(self, prompt):
+            calls.append(prompt)
+            return reply
+
+    agent = DraftReplyAgent(backend=FakeBackend())
+    agent.cache = TieredCache(LRUCache("draft_fallback_test"))
+    kb = [{"id": "kb_001", "title": "Dark mode", "content": "Settings > Appearance"}]
+    triage = {"category": "feature_request", "severity": "low"}
+
+    first = agent.generate_draft("How do I enable dark mode?", kb, None, triage)
+    again = agent.generate_draft("how do i enable  DARK MODE?", kb, ["other history"], triage)
+    assert again == first == reply
+    assert len(calls) == 1
+
+    edited = [{**kb[0], "content": "Settings > Display"}]
+    agent.generate_draft("How do I enable dark mode?", edited, None, triage)
+    assert len(calls) == 2  # a changed KB article misses
+    assert agent.cache.stats()["memory"]["hits"] == 1
+
+def test_web_fallback_drafts_are_not_cached(monkeypatch):
+    """Without KB hits the draft depends on live web results, so every ticket calls the model"""
+    from tools.web_search_tool import web_search_tool
+    calls, searches = [], []
+
+    class FakeBackend(LLMBackend):
+        def generate(self, prompt):
+            calls.append(prompt)
+            return '{"subject": "Re", "body": "See the docs", "action": "reply"}'
+
+    monkeypatch.setattr(web_search_tool, "_search", lambda query, max_results: searches.append(query) or [])
+    agent = DraftReplyAgent(backend=FakeBackend())
+    agent.cache = TieredCache(LRUCache("draft_web_test"))
+    for _ in range(2):
+        agent.generate_draft("How do I export my data?", [], None, {"category": "other"})
+    assert len(calls) == 2 and searches
+    assert agent.cache.stats()["memory"]["size"] == 0
+
+def test_concurrent_identical_drafts_share_one_model_call(monkeypatch):
+    """Identical tickets drafted at the same time collapse into one model call"""
+    import asyncio
+    calls = []
+
+    class CountingStub(StubBackend):
+        async def agenerate(self, prompt):
+            calls.append(prompt)
+            return await super().agenerate(prompt)
+
+    agent = DraftReplyAgent(backend=CountingStub(latency="fixed:0.1"))
+    agent.cache = TieredCache(LRUCache("draft_flight_test"))
+    kb = [{"id": "kb_002", "title": "Outage", "content": "We are investigating"}]
+
+    async def run():
+        return await asyncio.gather(*(agent.agenerate_draft("Site is down", kb, None, {"category": "technical_issue"})
+                                      for _ in range(20)))
+
+    replies = asyncio.run(run())
+    assert len(set(replies)) == 1 and '"body"' in replies[0]
+    assert len(calls) == 1
+    assert agent.flight.stats()["collapsed"] == 19
+
+def test_json_field_stream_decodes_body_across_chunks():
+    """The body field is decoded incrementally, whatever the chunk boundaries"""
+    import json
+    from agents.draft_agent import JSONFieldStream
+    reply = {"subject": 'Re: "body"', "body": 'Hi "there"\nTry Settings \\ Display 😀', "action": "reply"}
+    text = "```json\n" + json.dumps(reply) + "\n```"
+    for size in (1, 2, 3, 7, len(text)):
+        stream = JSONFieldStream("body")
+        pieces = [stream.feed(text[i:i + size]) for i in range(0, len(text), size)]
+        assert "".join(pieces) == reply["body"] and stream.done
+    stream = JSONFieldStream("body")
+    assert stream.feed('{"subject": "x", "body": "Hel') == "Hel"
+    assert stream.feed('lo \\u00') == "lo "
+    assert stream.feed('e9!", "action"') == "é!"
+
+def test_stream_draft_yields_body_deltas_then_full_reply():
+    class FakeBackend(LLMBackend):
+        def generate(self, prompt):
+            return "".join(self.stream(prompt))
+
+        def stream(self, prompt):
+            yield from ['{"subject": "Re", "bo', 'dy": "Enable it', ' in Settings", "action": "reply"}']
+
+    agent = DraftReplyAgent(backend=FakeBackend())
+    agent.cache = TieredCache(LRUCache("draft_stream_test"))
+    kb = [{"id": "kb_001", "title": "Dark mode", "content": "Settings > Appearance"}]
+
+    events = list(agent.stream_draft("How do I enable dark mode?", kb, None, {"category": "feature_request"}))
+    assert events[:-1] == [("delta", "Enable it"), ("delta", " in Settings")]
+    assert events[-1] == ("draft", '{"subject": "Re", "body": "Enable it in Settings", "action": "reply"}')
+    # Now cached: replayed as one delta, same final reply
+    assert list(agent.stream_draft("How do I enable dark mode?", kb, None, {"category": "feature_request"})) == \
+        [("delta", "Enable it in Settings"), events[-1]]
@@ -0,0 +1,86 @@
+"""
+Unit tests for streaming KB ingestion
+"""
+import json
+from tools.kb_index import KBIndexWriter, compile_kb
+from tools.kb_ingest import chunk_article, ingest
+from tools.kb_tool import KBSearchTool
+
+ARTICLES = [
+    {"id": f"a{i}", "title": f"Article {i}", "content": f"Topic {i % 7} covers invoices, refunds and sync (ref{i:03d})."}
+    for i in range(60)
+]
+
+def test_chunk_article_splits_on_paragraphs():
+    content = "\n\n".join(["alpha " * 50, "beta " * 50, "gamma " * 50])
+    passages = chunk_article({"id": "kb_1", "title": "Long", "content": content}, chunk_chars=700)
+    assert [p["id"] for p in passages] == ["kb_1#1", "kb_1#2"]
+    assert all(p["article_id"] == "kb_1" and len(p["content"]) <= 700 for p in passages)
+    assert chunk_article({"id": "kb_2", "title": "Short", "content": "tiny"}) == [
+        {"id": "kb_2", "title": "Short", "content": "tiny"}
+    ]
+
+def test_ingest_jsonl_and_docs_dir(tmp_path):
+    jsonl = tmp_path / "articles.jsonl"
+    jsonl.write_text("\n".join(json.dumps(a) for a in [
+        {"id": "j1", "title": "Invoice History", "content": "Download invoices from Billing."},
+        {"id": "j2", "title": "Dark Mode", "content": "Settings > Display."},
+    ]))
+    docs = tmp_path / "docs"
+    (docs / "account").mkdir(parents=True)
+    (docs / "account" / "login.md").write_text("# Login Help\n\nReset your **password** from the sign-in page.")
+    (docs / "vpn.html").write_text("<html><title>VPN</title><body><h1>VPN Setup</h1><p>Disable the VPN.</p></body></html>")
+
+    output = str(tmp_path / "kb.kbidx")
+    stats = ingest([str(jsonl), str(docs)], output, workers=1)
+    assert stats == {"articles": 4, "passages": 4}
+
+    tool = KBSearchTool(output)
+    assert [r["id"] for r in tool.search("invoices")] == ["j1"]
+    assert tool.search("password reset")[0]["id"] == "account/login.md"
+    assert tool.search("vpn")[0]["title"] == "VPN Setup"
+
+def test_spilled_runs_and_process_pool_give_identical_index(tmp_path):
+    """Merged sorted runs and worker processes produce byte-identical files"""
+    in_memory = tmp_path / "memory.kbidx"
+    compile_kb(ARTICLES, str(in_memory))
+    spilled = tmp_path / "spilled.kbidx"
+    writer = KBIndexWriter(str(spilled), spill_postings=25)
+    for item in ARTICLES:
+        writer.add(item)
+    writer.close()
+    assert spilled.read_bytes() == in_memory.read_bytes()
+
+    jsonl = tmp_path / "articles.jsonl"
+    jsonl.write_text("\n".join(json.dumps(a) for a in ARTICLES))
+    one, two = tmp_path / "one.kbidx", tmp_path / "two.kbidx"
+    ingest([str(jsonl)], str(one), workers=1, batch_size=16)
+    ingest([str(jsonl)], str(two), workers=2, batch_size=16)
+    assert two.read_bytes() == one.read_bytes()
+    assert [r["id"] for r in KBSearchTool(str(two)).search("refunds ref042")] == ["a42"]
+
+def test_chunks_of_one_article_take_one_result_slot(tmp_path):
+    jsonl = tmp_path / "articles.jsonl"
+    jsonl.write_text("\n".join(json.dumps(a) for a in [
+        {"id": "long", "title": "Sync Guide", "content": "\n\n".join(["sync settings " * 40] * 4)},
+        {"id": "short1", "title": "Sync FAQ", "content": "Sync runs hourly."},
+        {"id": "short2", "title": "Sync Errors", "content": "Sync errors are logged."},
+    ]))
+    output = str(tmp_path / "kb.kbidx")
+    assert ingest([str(jsonl)], output, workers=1, chunk_chars=600)["passages"] > 3
+
+    ids = [r.get("article_id", r["id"]) for r in KBSearchTool(output).search("sync")]
+    assert sorted(ids) == ["long", "short1", "short2"]
+
+def test_integer_article_ids_dont_group_with_unrelated_docs(tmp_path):
+    kb = [{"id": "a", "title": "Router firmware", "content": "Update the router firmware."},
+          {"id": "b", "title": "Router firmware FAQ", "content": "Router firmware questions."}]
+    kb += chunk_article({"id": 1, "title": "Router firmware guide",
+                         "content": "\n\n".join(["router firmware steps " * 30] * 3)}, chunk_chars=600)
+    kb_path = tmp_path / "kb.json"
+    kb_path.write_text(json.dumps(kb))
+    compile_kb(kb, str(tmp_path / "kb.kbidx"))
+
+    for path, backend in [(kb_path, "keyword"), (kb_path, "tfidf"), (tmp_path / "kb.kbidx", "keyword")]:
+        results = KBSearchTool(str(path), backend=backend).search("router firmware")
+        assert sorted(str(r.get("article_id", r["id"])) for r in results) == ["1", "a", "b"], backend
@@ -2,13 +2,14 @@
 Unit tests for KB Search Tool
 """
 
+import json
 import pytest
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from tools.kb_tool import kb_tool, normalize_query
+from tools.kb_tool import kb_tool, normalize_query, KBSearchTool, KB_FILE
 
 def test_normalize_query():
     """Test query normalization"""
@@ -35,3 +36,198 @@ def test_kb_search_returns_max_3():
     """Test KB search returns max 3 results"""
     results = kb_tool.search("the")
     assert len(results) <= 3
+
+def _write_kb(tmp_path, articles):
+    path = tmp_path / "kb.json"
+    path.write_text(json.dumps(articles))
+    return str(path)
+
+def test_kb_index_substring_and_semantics(tmp_path):
+    """Tokens match inside words and all tokens must appear"""
+    kb_path = _write_kb(tmp_path, [
+        {"id": "a", "title": "Dark Modes", "content": "Switch themes in settings."},
+        {"id": "b", "title": "Dark Web", "content": "Unrelated."},
+    ])
+    tool = KBSearchTool(kb_path)
+    assert [r["id"] for r in tool.search("dark mode")] == ["a"]
+    assert sorted(r["id"] for r in tool.search("ark")) == ["a", "b"]
+    assert tool.search("dark invoice") == []
+
+def test_kb_index_phrase_fallback_for_short_words(tmp_path):
+    """Queries without usable tokens fall back to a phrase match"""
+    kb_path = _write_kb(tmp_path, [
+        {"id": "a", "title": "Go to v2", "content": ""},
+        {"id": "b", "title": "v2 go", "content": ""},
+    ])
+    tool = KBSearchTool(kb_path)
+    assert [r["id"] for r in tool.search("to v2")] == ["a"]
+
+def test_kb_search_ranks_by_bm25_with_title_boost(tmp_path):
+    """Best-scoring articles come first, not file order"""
+    kb_path = _write_kb(tmp_path, [
+        {"id": "mention", "title": "Display settings", "content": "Invoice layout follows your display."},
+        {"id": "filler", "title": "Misc", "content": "Nothing relevant here."},
+        {"id": "title", "title": "Invoice History", "content": "Download any invoice from Billing."},
+    ])
+    tool = KBSearchTool(kb_path)
+    scored = tool.search_scored("invoice", top_k=1)
+    assert len(scored) == 1
+    assert scored[0][0]["id"] == "title"
+    assert scored[0][1] > 0
+    assert [r["id"] for r in tool.search("invoice")] == ["title", "mention"]
+
+def test_tfidf_backend_search_many(tmp_path):
+    """The tfidf backend ranks by cosine and answers batches in input order"""
+    pytest.importorskip("scipy")
+    kb_path = _write_kb(tmp_path, [
+        {"id": "a", "title": "Dark Mode", "content": "Enable dark mode in Display settings."},
+        {"id": "b", "title": "Invoices", "content": "Download invoices from Billing."},
+    ])
+    tool = KBSearchTool(kb_path, backend="tfidf")
+    assert [r["id"] for r in tool.search("How do I enable dark mode?")] == ["a"]
+    batches = tool.search_many(["where is my invoice", "dark", "xyzabc123nonexistent"])
+    assert [[r["id"] for r in batch] for batch in batches] == [[], ["a"], []]
+    assert [[r["id"] for r in batch] for batch in tool.search_many(["invoices"])] == [["b"]]
+
+def test_semantic_backend_matches_paraphrases():
+    """The semantic backend finds articles that share word pieces, not whole keywords"""
+    pytest.importorskip("scipy")
+    tool = KBSearchTool(KB_FILE, backend="semantic")
+    assert [r["id"] for r in tool.search("app keeps crashing on my phone")][:1] == ["kb_001"]
+    assert [r["id"] for r in tool.search("video won't play")][:1] == ["kb_006"]
+    assert tool.search("What is the capital of France?") == []
+    batches = tool.search_many(["dark mode", "password reset email missing"])
+    assert [[r["id"] for r in batch][:1] for batch in batches] == [["kb_004"], ["kb_002"]]
+
+def test_ivf_search_matches_brute_force_when_probing_every_list():
+    """nprobe >= the list count is an exact search; fewer lists only narrow the candidates"""
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("scipy")
+    from tools.kb_semantic import IVFIndex, _l2_normalize
+    vectors = _l2_normalize(np.random.default_rng(0).standard_normal((500, 16)).astype(np.float32))
+    ivf = IVFIndex(vectors, n_lists=10)
+    assert sorted(np.concatenate(ivf.lists).tolist()) == list(range(500))
+    query = vectors[7]
+    ids, scores = ivf.scored(query, nprobe=10)
+    assert int(ids[np.argmax(scores)]) == 7
+    assert len(ivf.candidates(query, nprobe=2)) < 500
+    assert 7 in ivf.candidates(query, nprobe=1)  # a vector's own list is the closest
+
+def test_kb_reload_applies_incremental_changes(tmp_path):
+    """reload() picks up added, changed and removed articles"""
+    articles = [
+        {"id": "a", "title": "Dark Mode", "content": "Enable it in Display."},
+        {"id": "b", "title": "Invoices", "content": "Download from Billing."},
+        {"id": "c", "title": "Refunds", "content": "Takes 5 days."},
+    ]
+    kb_path = _write_kb(tmp_path, articles)
+    tool = KBSearchTool(kb_path)
+    before = tool._index
+
+    articles[1] = {"id": "b", "title": "Receipts", "content": "Download from Billing."}
+    articles.append({"id": "d", "title": "Dark Web Monitoring", "content": "Alerts."})
+    del articles[2]
+    _write_kb(tmp_path, articles)
+
+    result = tool.reload()
+    assert result["ok"] and result["version"] == 1
+    assert (result["added"], result["changed"], result["removed"]) == (1, 1, 1)
+    assert tool.search("invoices") == []
+    assert [r["id"] for r in tool.search("receipts")] == ["b"]
+    assert tool.search("refunds") == []
+    assert sorted(r["id"] for r in tool.search("dark")) == ["a", "d"]
+
+    # The previous snapshot is untouched for searches that were in flight
+    ranked, _ = before.search("invoices", 3)
+    assert [before.kb[doc_id]["id"] for doc_id, _ in ranked] == ["b"]
+
+def test_kb_reload_if_changed_only_reloads_a_changed_file(tmp_path):
+    """What process-pool workers run before each ticket, since /kb/reload can't reach them"""
+    import os
+    kb_path = _write_kb(tmp_path, [{"id": "a", "title": "Dark Mode", "content": ""}])
+    tool = KBSearchTool(kb_path)
+    assert tool.reload_if_changed() is None and tool.version == 0
+
+    _write_kb(tmp_path, [{"id": "a", "title": "Dark Mode", "content": ""}, {"id": "b", "title": "Invoices", "content": ""}])
+    os.utime(kb_path, (1, 1))  # a new stamp even within the filesystem's mtime resolution
+    assert tool.reload_if_changed()["ok"] and tool.version == 1
+    assert [r["id"] for r in tool.search("invoices")] == ["b"]
+    assert tool.reload_if_changed() is None
+
+def test_kb_reload_keeps_index_on_invalid_file(tmp_path):
+    """A broken KB file doesn't replace the loaded index"""
+    kb_path = _write_kb(tmp_path, [{"id": "a", "title": "Dark Mode", "content": ""}])
+    tool = KBSearchTool(kb_path)
+    (tmp_path / "kb.json").write_text("[{not json")
+    result = tool.reload()
+    assert not result["ok"]
+    assert [r["id"] for r in tool.search("dark")] == ["a"]
+
+def test_compiled_index_matches_json_kb(tmp_path):
+    """A compiled .kbidx file serves the same results as the JSON KB"""
+    from tools.kb_index import compile_kb
+    with open(KB_FILE) as f:
+        kb = json.load(f)
+    index_path = str(tmp_path / "kb.kbidx")
+    assert compile_kb(kb, index_path) == len(kb)
+
+    compiled = KBSearchTool(index_path)
+    for query in ["dark mode", "billing duplicate charge", "password reset", "xyzabc123nonexistent", "to"]:
+        assert compiled.search_scored(query) == kb_tool.search_scored(query)
+    assert compiled.reload()["ok"]
+
+def test_kb_search_tolerates_typos():
+    """Misspelled queries resolve locally instead of returning nothing"""
+    assert [r["id"] for r in kb_tool.search("video player not wrking")] == ["kb_006"]
+    assert kb_tool.search("pasword resett")[0]["id"] == "kb_002"
+    assert "kb_008" in [r["id"] for r in kb_tool.search("hEy I CnNt lgIn 2 MY AccOunt plz fixxx ???!!")]
+
+def test_kb_search_typo_pass_needs_a_correction():
+    """Unrelated questions don't get matched through common words"""
+    assert kb_tool.search("What is the capital of France?") == []
+
+def test_kb_search_cache_hits_and_reload_invalidation(tmp_path):
+    """Repeated queries hit the cache until the KB is reloaded"""
+    articles = [{"id": "a", "title": "Dark Mode", "content": "Enable it in Display."}]
+    kb_path = _write_kb(tmp_path, articles)
+    tool = KBSearchTool(kb_path)
+
+    assert [r["id"] for r in tool.search("dark mode")] == ["a"]
+    assert [r["id"] for r in tool.search("  DARK mode!")] == ["a"]  # same normalized query
+    assert tool.cache.stats()["hits"] == 1
+
+    articles.append({"id": "b", "title": "Dark Mode Brightness", "content": "Too dim."})
+    _write_kb(tmp_path, articles)
+    tool.reload()
+    assert sorted(r["id"] for r in tool.search("dark mode")) == ["a", "b"]
+    assert [[r["id"] for r in batch] for batch in tool.search_many(["brightness", "dark mode"])][0] == ["b"]
+    assert tool.cache.stats()["hits"] == 2
+
+def test_kb_search_returns_best_passage(tmp_path):
+    """Long articles come back with the passage that matches the query as snippet"""
+    intro = "Our billing system supports many payment methods and currencies. " * 6
+    refunds = "Refunds for duplicate charges are issued within five business days."
+    kb_path = _write_kb(tmp_path, [
+        {"id": "a", "title": "Billing FAQ", "content": intro + refunds},
+        {"id": "b", "title": "Short", "content": "Duplicate charges happen rarely."},
+    ])
+    tool = KBSearchTool(kb_path)
+    results = {r["id"]: r for r in tool.search("duplicate charges")}
+
+    start, end = results["a"]["passage"]
+    assert start > 0 and results["a"]["snippet"] == results["a"]["content"][start:end]
+    assert results["a"]["snippet"].endswith(refunds)
+    assert "snippet" not in results["b"]  # single-passage articles are returned as is
+
+def test_compiled_index_stores_passage_offsets(tmp_path):
+    """Passage spans are read back from the .kbidx file, not recomputed"""
+    from tools.kb_index import MmapKBIndex, compile_kb
+    from tools.kb_tool import passage_spans
+    intro = "Our billing system supports many payment methods and currencies. " * 6
+    kb = [{"id": "a", "title": "Billing FAQ", "content": intro + "Refunds take five days."},
+          {"id": "b", "title": "Empty", "content": ""}]
+    index_path = str(tmp_path / "kb.kbidx")
+    compile_kb(kb, index_path)
+    index = MmapKBIndex(index_path)
+    assert [index.passages(i) for i in range(2)] == [passage_spans(item["content"]) for item in kb]
+    assert len(index.passages(0)) > 1
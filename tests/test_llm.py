@@ -0,0 +1,64 @@
+"""
+Tests for the LLM backend interface and the local stub backend
+"""
+import asyncio
+import json
+import random
+import pytest
+from core import llm
+from core.llm import StubBackend, StubLLMError, get_backend, parse_latency, register_backend
+
+PROMPT = 'Write the JSON ONLY.\nTicket: "How do I enable dark mode?"\nCategory: feature_request\n'
+
+def test_stub_replies_are_deterministic_json():
+    a, b = StubBackend(latency="fixed:0"), StubBackend(latency="fixed:0", seed=7)
+    reply = a.generate(PROMPT)
+    assert reply == b.generate(PROMPT)
+    assert json.loads(reply)["subject"] == "Re: feature request"
+    assert "".join(a.stream(PROMPT)) == reply
+    assert asyncio.run(a.agenerate(PROMPT)) == reply
+
+    async def collect():
+        return "".join([chunk async for chunk in a.astream(PROMPT)])
+
+    assert asyncio.run(collect()) == reply
+    assert a.generate("Rate this response 1-5")[0] in "345"  # judge prompts get a score line
+
+def test_stub_error_rate_and_batch():
+    backend = StubBackend(latency="fixed:0", error_rate=0.5, seed=1)
+    results = backend.generate_many([PROMPT] * 40, max_workers=4)
+    errors = [r for r in results if isinstance(r, StubLLMError)]
+    assert 5 < len(errors) < 35
+    assert all(isinstance(r, str) for r in results if r not in errors)
+    assert StubBackend(latency="fixed:0", error_rate=1.0).generate_many([]) == []
+    with pytest.raises(StubLLMError):
+        StubBackend(latency="fixed:0", error_rate=1.0).generate(PROMPT)
+
+def test_latency_specs_and_registry(monkeypatch):
+    rng = random.Random(0)
+    assert parse_latency("fixed:0.25")(rng) == 0.25
+    assert 0.1 <= parse_latency("uniform:0.1,0.2")(rng) <= 0.2
+    assert parse_latency("lognormal:0.5,0.5")(rng) > 0
+    with pytest.raises(ValueError):
+        parse_latency("normal:1")
+    with pytest.raises(ValueError):
+        get_backend("nope")
+
+    monkeypatch.setattr(llm, "LLM_BACKENDS", dict(llm.LLM_BACKENDS))
+    register_backend("fast_stub", lambda model_name=None: StubBackend(model_name, latency="fixed:0"))
+    backend = get_backend("fast_stub")
+    assert (backend.name, backend.model_name) == ("stub", "stub")
+
+def test_backends_must_implement_generate_and_share_one_default_model(monkeypatch):
+    class NoGenerate(llm.LLMBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        NoGenerate()
+    monkeypatch.delenv("GEMINI_MODEL", raising=False)
+    assert llm.default_model() == llm.DEFAULT_MODEL
+    monkeypatch.setenv("GEMINI_MODEL", "gemini-x")
+
+    from agents.draft_agent import DraftReplyAgent
+    from agents.triage_agent import TriageAgent
+    assert TriageAgent().model_name == DraftReplyAgent().model_name == "gemini-x"
@@ -0,0 +1,172 @@
+"""
+Tests for the shared LLM client: limits, retries, deadlines and hedging
+"""
+import asyncio
+import threading
+import time
+import pytest
+from core.llm import LLMBackend, StubBackend
+from core.llm_client import (LatencyHistogram, LLMClient, LLMDeadlineExceeded, is_retryable,
+                             model_settings)
+
+class ScriptedBackend(LLMBackend):
+    """Call i sleeps script[i][0] seconds, then raises script[i][1] if set"""
+    name = "scripted"
+
+    def __init__(self, script, default=(0, None)):
+        super().__init__("scripted")
+        self.script, self.default = list(script), default
+        self.calls = self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            step = self.script[self.calls] if self.calls < len(self.script) else self.default
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            return self.calls, step
+
+    def _done(self, n, error):
+        with self._lock:
+            self.active -= 1
+        if error:
+            raise error
+        return f"reply {n}"
+
+    def generate(self, prompt, timeout=None):
+        n, (delay, error) = self._next()
+        time.sleep(delay)
+        return self._done(n, error)
+
+    async def agenerate(self, prompt, timeout=None):
+        n, (delay, error) = self._next()
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self._done(n, None)
+            raise
+        return self._done(n, error)
+
+class Unavailable(Exception):
+    code = 503
+
+def client(backend, **settings):
+    defaults = {"backoff_base": 0.01, "backoff_max": 0.02, "hedge_after": "", "rpm": 0, "tpm": 0}
+    return LLMClient(backend, **{**defaults, **settings})
+
+def test_retries_transient_errors_only():
+    backend = ScriptedBackend([(0, Unavailable("busy")), (0, ConnectionError("reset"))])
+    llm = client(backend, max_retries=3)
+    assert llm.generate("hi") == "reply 3"
+    stats = llm.stats()
+    assert (stats["calls"], stats["retries"], stats["successes"], stats["failures"]) == (1, 2, 1, 0)
+    assert stats["latency"]["count"] == 1
+
+    backend = ScriptedBackend([(0, ValueError("bad request"))])
+    llm = client(backend, max_retries=3)
+    with pytest.raises(ValueError):
+        llm.generate("hi")
+    assert backend.calls == 1 and llm.stats()["failures"] == 1
+    assert is_retryable(TimeoutError()) and not is_retryable(KeyError())
+
+def test_attempt_timeout_and_deadline():
+    """Slow attempts time out, are retried, and the call gives up at its deadline"""
+    llm = client(StubBackend(latency="fixed:1"), timeout=0.05, max_retries=10)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        llm.generate("hi", timeout=0.3)
+    assert time.perf_counter() - start < 0.6
+    stats = llm.stats()
+    assert stats["timeouts"] >= 2 and stats["failures"] == 1
+
+    llm = client(StubBackend(latency="fixed:1"), timeout=0.05, max_retries=1)
+    with pytest.raises(TimeoutError):
+        asyncio.run(llm.agenerate("hi"))
+    assert llm.stats()["retries"] == 1
+
+def test_concurrency_cap_across_threads_and_asyncio():
+    backend = ScriptedBackend([], default=(0.03, None))
+    llm = client(backend, max_concurrency=2)
+
+    async def burst():
+        return await asyncio.gather(*(llm.agenerate(f"p{i}") for i in range(6)))
+
+    threads = [threading.Thread(target=llm.generate, args=(f"t{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    assert len(asyncio.run(burst())) == 6
+    for t in threads:
+        t.join()
+    assert backend.peak == 2 and backend.calls == 10
+    assert (llm.stats()["in_flight"], llm.stats()["waiting"]) == (0, 0)
+
+def test_rpm_bucket_waits_within_deadline():
+    """With 6 requests/minute the second call needs 10s of quota: past a 0.2s deadline"""
+    llm = client(ScriptedBackend([]), rpm=6)
+    assert llm.generate("hi") == "reply 1"
+    with pytest.raises(LLMDeadlineExceeded):
+        llm.generate("hi", timeout=0.2)
+
+    llm = client(ScriptedBackend([]), rpm=600, max_retries=0)  # burst of 100, then 10/s
+    for _ in range(100):
+        llm.generate("hi")
+    start = time.perf_counter()
+    llm.generate("hi")
+    assert time.perf_counter() - start >= 0.05 and llm.stats()["throttled"] >= 1
+
+def test_hedged_request_wins_over_slow_attempt():
+    llm = client(ScriptedBackend([(1.0, None)]), hedge_after=0.05)
+    start = time.perf_counter()
+    assert llm.generate("hi") == "reply 2"
+    assert time.perf_counter() - start < 0.5
+
+    backend = ScriptedBackend([(1.0, None)])
+    llm = client(backend, hedge_after=0.05)
+    start = time.perf_counter()
+    assert asyncio.run(llm.agenerate("hi")) == "reply 2"
+    assert time.perf_counter() - start < 0.5
+    stats = llm.stats()
+    assert (stats["hedged"], stats["hedge_wins"], stats["in_flight"]) == (1, 1, 0)
+    assert backend.active == 0  # the losing attempt was cancelled
+
+def test_hedge_admission_is_all_or_nothing_and_pool_only_when_it_can_fire():
+    llm = client(ScriptedBackend([]), rpm=60, tpm=60)  # bursts of 10 requests, 10 tokens
+    assert llm._try_admit(tokens=10)
+    llm.limiter.release()
+    assert not llm._try_admit(tokens=5)  # rpm is free but tpm isn't
+    assert llm.buckets._buckets["rpm"][0] == pytest.approx(9, abs=0.1)  # the refused hedge's request came back
+
+    llm = client(ScriptedBackend([(0.1, None)]), hedge_after=0.01, max_concurrency=1)
+    assert llm.generate("hi") == "reply 1"
+    assert llm._hedge_pool is None and llm.stats()["hedged"] == 0  # no spare slot: ran inline
+    llm = client(ScriptedBackend([]), hedge_after=5)
+    assert llm.generate("hi", timeout=1) == "reply 1"
+    assert llm._hedge_pool is None  # the deadline comes before the hedge would
+
+def test_stream_retries_before_first_chunk():
+    class FlakyStream(StubBackend):
+        failures = 1
+
+        def stream(self, prompt, timeout=None):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("reset")
+            yield from super().stream(prompt, timeout)
+
+    llm = client(FlakyStream(latency="fixed:0"))
+    assert "".join(llm.stream("Rate this")) == StubBackend(latency="fixed:0").generate("Rate this")
+    stats = llm.stats()
+    assert (stats["retries"], stats["successes"], stats["in_flight"]) == (1, 1, 0)
+
+def test_histogram_and_model_settings():
+    histogram = LatencyHistogram()
+    for ms in [40] * 90 + [400] * 9 + [40000]:
+        histogram.observe(ms / 1000)
+    assert (histogram.quantile(0.5), histogram.quantile(0.95), histogram.quantile(0.999)) == (50, 500, float("inf"))
+    assert histogram.stats()["p99_ms"] == 500 and histogram.stats()["buckets_ms"]["inf"] == 1
+
+    settings = model_settings("gemini-x", '{"gemini-x": {"rpm": 15, "max_concurrency": 2}}')
+    assert (settings["rpm"], settings["max_concurrency"]) == (15, 2)
+    with pytest.raises(ValueError):
+        model_settings("gemini-x", '{"gemini-x": {"rps": 1}}')
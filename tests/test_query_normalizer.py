@@ -0,0 +1,23 @@
+"""
+Unit tests for the shared query normalizer
+"""
+import json
+from utils.query_normalizer import QueryNormalizer, load_synonyms, normalize_query
+
+def test_default_rules():
+    assert normalize_query("How do I enable dark mode?") == "enable dark mode"
+    assert normalize_query("Switch THEME, please!!") == "switch mode please"
+    assert normalize_query("how can i   reset my password") == "reset my password"
+    assert normalize_query("  ") == ""
+
+def test_longest_phrase_wins_in_single_pass():
+    normalizer = QueryNormalizer({"log in": "login", "log": "journal", "sign-in": "login"})
+    assert normalizer.normalize("Can't log in; check the log") == "can t login check the journal"
+    assert normalizer.normalize("Sign-in fails") == "login fails"
+
+def test_synonyms_from_file(tmp_path):
+    path = tmp_path / "synonyms.json"
+    path.write_text(json.dumps({"invoice": "receipt"}))
+    normalizer = QueryNormalizer(load_synonyms(str(path)))
+    assert normalizer.normalize("Where is my Invoice?") == "where is my receipt"
+    assert normalizer.normalize_text("Theme") == "theme"  # defaults replaced
@@ -0,0 +1,40 @@
+"""
+Unit tests for per-user token-bucket rate limiting
+"""
+import time
+from utils.rate_limit import MemoryBucketStore, RateLimiter
+
+def test_bucket_allows_burst_then_limits_per_user():
+    limiter = RateLimiter(per_minute=60, burst=3, store=MemoryBucketStore())
+    assert [limiter.acquire("heavy")[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.acquire("heavy")
+    assert not allowed and retry_after == 1
+    assert limiter.acquire("other") == (True, 0)  # other users keep their own bucket
+    stats = limiter.stats()
+    assert (stats["allowed"], stats["limited"]) == (4, 1)
+
+def test_refund_returns_tokens_up_to_burst():
+    limiter = RateLimiter(per_minute=1, burst=3, store=MemoryBucketStore())
+    assert limiter.acquire("u", cost=3) == (True, 0)
+    limiter.refund("u", cost=2)
+    assert limiter.acquire("u", cost=2) == (True, 0)
+    limiter.refund("u", cost=10)
+    assert limiter.acquire("u", cost=3) == (True, 0) and not limiter.acquire("u")[0]
+
+def test_bucket_refills_over_time():
+    store = MemoryBucketStore()
+    assert store.take("u", rate=100.0, burst=1) == 0.0
+    assert 0 < store.take("u", rate=100.0, burst=1) <= 0.01
+    time.sleep(0.02)
+    assert store.take("u", rate=100.0, burst=1) == 0.0
+
+def test_limiter_disabled_and_fails_open():
+    assert RateLimiter(per_minute=0).acquire("anyone") == (True, 0)
+
+    class BrokenStore:
+        def take(self, *args):
+            raise ConnectionError("store down")
+
+    limiter = RateLimiter(per_minute=60, burst=1, store=BrokenStore())
+    assert limiter.acquire("u") == (True, 0)
+    assert limiter.stats()["errors"] == 1
@@ -0,0 +1,137 @@
+"""
+Tests for admission control in front of the ticket pipeline
+"""
+import asyncio
+import json
+import pytest
+from app.scheduler import AdmissionController, QueueFull
+from core.memory import MemoryBank
+
+def test_admission_sheds_load_beyond_queue():
+    """One slot + one queue place: the third concurrent ticket is rejected with a Retry-After"""
+    admission = AdmissionController(workers=1, queue_size=1, pool="async")
+    order = []
+
+    async def work(name):
+        order.append(name)
+        await asyncio.sleep(0.05)
+        return name
+
+    async def run():
+        first = asyncio.ensure_future(admission.run(work, "a"))
+        second = asyncio.ensure_future(admission.run(work, "b"))
+        await asyncio.sleep(0)
+        assert (admission.stats()["running"], admission.queued) == (1, 1)
+        with pytest.raises(QueueFull) as rejected:
+            await admission.run(work, "c")
+        assert rejected.value.retry_after >= 1
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == ["a", "b"]
+    assert order == ["a", "b"]
+    stats = admission.stats()
+    assert (stats["admitted"], stats["rejected"], stats["completed"]) == (2, 1, 2)
+    assert (stats["running"], stats["queued"]) == (0, 0)
+    assert stats["wait_max_ms"] > 0
+
+def test_admission_releases_slot_on_failure():
+    """A failing ticket frees its slot and is counted as failed"""
+    admission = AdmissionController(workers=1, queue_size=0, pool="thread")
+
+    def boom(_):
+        raise RuntimeError("draft failed")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await admission.run(boom, None)
+        return await admission.run(str.upper, "ok")
+
+    assert asyncio.run(run()) == "OK"
+    stats = admission.stats()
+    assert (stats["failed"], stats["completed"], stats["running"]) == (1, 1, 0)
+    admission.shutdown()
+
+def test_admission_dequeues_by_severity_with_aging():
+    """Queued high-severity tickets go first, but a long-waiting low one isn't starved"""
+    admission = AdmissionController(workers=1, queue_size=10, pool="async", aging_seconds=0.05)
+    order = []
+
+    async def work(name, gate=None):
+        order.append(name)
+        if gate:
+            await gate.wait()
+
+    async def run():
+        gate = asyncio.Event()
+        busy = asyncio.ensure_future(admission.run(work, "busy", gate))
+        await asyncio.sleep(0)
+        old_low = asyncio.ensure_future(admission.run(work, "old-low", priority="low"))
+        await asyncio.sleep(0.2)  # waits past 2 * aging_seconds
+        tasks = [asyncio.ensure_future(admission.run(work, name, priority=priority))
+                 for name, priority in [("low", "low"), ("medium", "medium"), ("high", "high"), ("odd", "urgent")]]
+        await asyncio.sleep(0)
+        assert admission.stats()["priorities"]["low"]["queued"] == 3
+        gate.set()
+        await asyncio.gather(busy, old_low, *tasks)
+
+    asyncio.run(run())
+    assert order == ["busy", "old-low", "high", "medium", "low", "odd"]
+    priorities = admission.stats()["priorities"]
+    assert priorities["high"]["started"] == 1 and priorities["low"]["started"] == 4
+    assert priorities["low"]["wait_max_ms"] >= priorities["high"]["wait_max_ms"]
+
+def test_admission_fair_queues_heavy_user():
+    """A user's burst queues behind other users' tickets of the same severity"""
+    admission = AdmissionController(workers=1, queue_size=10, pool="async")
+    order = []
+
+    async def work(name, gate=None):
+        order.append(name)
+        if gate:
+            await gate.wait()
+
+    async def run():
+        gate = asyncio.Event()
+        busy = asyncio.ensure_future(admission.run(work, "busy", gate))
+        await asyncio.sleep(0)
+        heavy = [asyncio.ensure_future(admission.run(work, f"heavy{i}", user="heavy")) for i in range(3)]
+        light = asyncio.ensure_future(admission.run(work, "light", user="light"))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(busy, light, *heavy)
+
+    asyncio.run(run())
+    assert order == ["busy", "heavy0", "light", "heavy1", "heavy2"]
+    assert admission.stats()["users"] == 2
+
+def test_process_pool_spawns_and_parent_persists_memory(tmp_path):
+    """Workers are spawned with detached memory banks; only the parent writes the file"""
+    admission = AdmissionController(workers=1, pool="process")
+    assert admission._executor._mp_context.get_start_method() == "spawn"
+    admission.shutdown()
+
+    path = tmp_path / "memory.json"
+    worker, parent = MemoryBank(str(path)), MemoryBank(str(path))
+    worker.detach()
+    worker.add_ticket({"id": "t1", "category": "billing"})
+    worker.log_escalation("t1", "Severity high")
+    assert worker.get_similar_tickets("billing") == [{"id": "t1", "category": "billing"}]
+    assert json.loads(path.read_text())["tickets"] == []  # the worker never writes
+
+    changes = worker.drain()
+    assert [section for section, _ in changes] == ["tickets", "escalations"] and worker.drain() == []
+    parent.apply(changes)
+    saved = json.loads(path.read_text())
+    assert saved["tickets"] == [{"id": "t1", "category": "billing"}]
+    assert saved["escalations"][0]["reason"] == "Severity high"
+
+def test_process_worker_entry_point_picks_up_kb_changes(monkeypatch):
+    """/kb/reload only runs in the API process, so workers check the KB file per ticket"""
+    from agents import triage_agent as triage_module
+    calls = []
+    monkeypatch.setattr(triage_module.kb_tool, "reload_if_changed", lambda: calls.append("reload"))
+    monkeypatch.setattr(triage_module.triage_agent, "process_ticket",
+                        lambda ticket, analysis=None: calls.append("process") or {"status": "drafted"})
+    monkeypatch.setattr(triage_module.memory_bank, "_journal", None)
+    result, changes = triage_module.process_ticket_detached({"id": "t1", "description": "hi"})
+    assert calls == ["reload", "process"] and result == {"status": "drafted"} and changes == []
@@ -0,0 +1,74 @@
+"""
+Tests for single-flight request coalescing
+"""
+import asyncio
+import threading
+import time
+import pytest
+from utils.singleflight import SingleFlight
+
+def test_threads_share_one_call():
+    flight = SingleFlight("test_threads")
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def slow(x):
+        calls.append(x)
+        time.sleep(0.2)
+        return x * 2
+
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(flight.do("k", slow, 21))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [42] * 8 and calls == [21]
+    stats = flight.stats()
+    assert (stats["calls"], stats["executed"], stats["collapsed"], stats["in_flight"]) == (8, 1, 7, 0)
+    assert flight.do("k", slow, 1) == 2  # finished keys go upstream again
+
+def test_async_waiters_share_result_and_errors():
+    flight = SingleFlight("test_async")
+    calls = []
+
+    async def slow(x):
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        if x < 0:
+            raise ValueError("upstream failed")
+        return x
+
+    async def run():
+        ok = await asyncio.gather(*(flight.ado("a", slow, 1) for _ in range(5)))
+        failed = await asyncio.gather(*(flight.ado("b", slow, -1) for _ in range(3)), return_exceptions=True)
+        return ok, failed
+
+    ok, failed = asyncio.run(run())
+    assert ok == [1] * 5 and calls == [1, -1]
+    assert all(isinstance(e, ValueError) for e in failed)
+    assert flight.stats()["collapsed"] == 6
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = SingleFlight("test_cancel")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flight.ado("k", slow))
+        second = asyncio.ensure_future(flight.ado("k", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "done"
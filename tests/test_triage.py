@@ -48,3 +48,118 @@ def test_feature_request_drafted():
     
     result = triage_agent.process_ticket(ticket)
     assert result["status"] == "drafted"
+
+def test_process_tickets_batch(monkeypatch, tmp_path):
+    """Batches keep input order, write memory once and bound draft concurrency"""
+    import threading
+    import time
+    import core.memory
+    from agents import triage_agent as triage_module
+    from core.memory import memory_bank
+
+    monkeypatch.setattr(memory_bank, "filepath", str(tmp_path / "memory.json"))
+    writes = []
+    real_open = open
+    def counting_open(path, mode="r", *args, **kwargs):
+        if "w" in mode:
+            writes.append(path)
+        return real_open(path, mode, *args, **kwargs)
+    monkeypatch.setattr(core.memory, "open", counting_open, raising=False)
+
+    active, peak = [0], [0]
+    lock = threading.Lock()
+    def fake_draft(query, kb_results, history=None, triage_info=None):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return f"draft: {query}"
+    monkeypatch.setattr(triage_module.draft_agent, "generate_draft", fake_draft)
+
+    tickets = [{"id": f"b{i}", "description": d, "user_id": "u"} for i, d in enumerate([
+        "How do I enable dark mode?", "I was double charged", "help", "Where is the setting?",
+        "dark mode brightness", "Password reset not working",
+    ])]
+    results = triage_agent.process_tickets(tickets, max_workers=2)
+
+    assert [r["status"] for r in results] == ["drafted", "escalated", "drafted", "drafted", "drafted", "escalated"]
+    assert results[0]["reply"] == "draft: How do I enable dark mode?"
+    assert results[4]["kb_hits"] >= 1
+    assert peak[0] <= 2
+    assert len(writes) == 1
+
+def test_failed_escalation_fails_only_its_ticket(monkeypatch, tmp_path):
+    """process_tickets and aprocess_tickets both turn a failed escalation into an error status"""
+    import asyncio
+    from agents import triage_agent as triage_module
+    from core.memory import memory_bank
+
+    monkeypatch.setattr(memory_bank, "filepath", str(tmp_path / "memory.json"))
+    monkeypatch.setattr(triage_module.draft_agent, "generate_draft", lambda *args, **kwargs: "draft")
+    async def fake_adraft(*args, **kwargs):
+        return "draft"
+    monkeypatch.setattr(triage_module.draft_agent, "agenerate_draft", fake_adraft)
+    def broken_escalation(ticket_id, reason, ticket):
+        raise RuntimeError("escalation backend down")
+    monkeypatch.setattr(triage_module.escalation_agent, "handle_escalation", broken_escalation)
+
+    tickets = [{"id": "e0", "description": "How do I enable dark mode?", "user_id": "u"},
+               {"id": "e1", "description": "I was double charged", "user_id": "u"}]
+    results = triage_agent.process_tickets(tickets)
+    assert [r["status"] for r in results] == ["drafted", "error"]
+    assert "escalation backend down" in results[1]["error"]
+
+    async def run():
+        return {i: response["status"] async for i, _, response in triage_agent.aprocess_tickets(tickets)}
+    assert asyncio.run(run()) == {0: "drafted", 1: "error"}
+
+def test_aprocess_ticket_runs_concurrently(monkeypatch, tmp_path):
+    """Async drafts overlap instead of running one after another"""
+    import asyncio
+    import time
+    from agents.draft_agent import draft_agent
+    from core.llm import StubBackend
+    from core.memory import memory_bank
+
+    monkeypatch.setattr(memory_bank, "filepath", str(tmp_path / "memory.json"))
+    monkeypatch.setattr(draft_agent, "llm", StubBackend(latency="fixed:0.2"))
+
+    async def run():
+        tickets = [{"id": f"a{i}", "description": f"How do I enable dark mode? #{i}", "user_id": "u"}
+                   for i in range(10)]
+        return await asyncio.gather(*(triage_agent.aprocess_ticket(t) for t in tickets))
+
+    start = time.time()
+    results = asyncio.run(run())
+    assert time.time() - start < 1.0
+    assert all(r["status"] == "drafted" and f"#{i}" in r["reply"] for i, r in enumerate(results))
+    assert draft_agent.flight.stats()["collapsed"] == 0
+
+def test_aprocess_tickets_yields_as_completed(monkeypatch, tmp_path):
+    """Batch results stream out as each ticket finishes; escalations don't wait for drafts"""
+    import asyncio
+    from agents.draft_agent import draft_agent
+    from core.llm import StubBackend
+    from core.memory import memory_bank
+    from tools.web_search_tool import web_search_tool
+
+    monkeypatch.setattr(memory_bank, "filepath", str(tmp_path / "memory.json"))
+    monkeypatch.setattr(draft_agent, "llm", StubBackend(latency="fixed:0.1"))
+    monkeypatch.setattr(web_search_tool, "_search", lambda query, max_results: [])  # offline
+
+    tickets = [
+        {"id": "b0", "description": "How do I enable dark mode?", "user_id": "u"},
+        {"id": "b1", "description": "I was charged twice, refund please", "user_id": "u"},
+        {"id": "b2", "description": "How do I export my data?", "user_id": "u"},
+    ]
+
+    async def run():
+        return [(i, analysis["category"], response["status"])
+                async for i, analysis, response in triage_agent.aprocess_tickets(tickets, max_concurrency=2)]
+
+    results = asyncio.run(run())
+    assert results[0] == (1, "billing", "escalated")
+    assert sorted(i for i, _, _ in results) == [0, 1, 2]
+    assert all(status == "drafted" for i, _, status in results if i != 1)
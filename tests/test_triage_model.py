@@ -0,0 +1,67 @@
+"""
+Tests for the offline naive Bayes triage classifier
+"""
+import json
+import pytest
+
+pytest.importorskip("scipy")
+
+import agents.triage_agent as triage_agent_module
+import agents.triage_model as triage_model_module
+from agents.triage_agent import TriageAgent
+from agents.triage_model import TriageModel, hash_features, labeled_tickets
+
+EXAMPLES = [
+    ("I was charged twice for my subscription", "billing", "high"),
+    ("Refund my duplicate payment", "billing", "high"),
+    ("I cannot login to my account", "account_access", "high"),
+    ("Password reset email never arrives", "account_access", "high"),
+    ("How do I enable dark mode?", "feature_request", "low"),
+    ("Please add an export feature", "feature_request", "low"),
+]
+
+def test_model_batch_predictions():
+    """One batch call returns a calibrated category distribution per ticket"""
+    model = TriageModel().fit(EXAMPLES)
+    results = model.classify_many(["charged twice again", "cant login to my acount", "dark mode please"])
+    assert [r["category"] for r in results] == ["billing", "account_access", "feature_request"]
+    for r in results:
+        assert sum(r["probabilities"].values()) == pytest.approx(1.0, abs=1e-3)
+        assert r["confidence"] == max(r["probabilities"].values())
+    assert results[0]["severity"] == "high" and results[2]["severity"] == "low"
+
+def test_hash_features_counts_words_bigrams_and_char_grams():
+    """Identical tickets hash identically; texts are independent rows"""
+    x = hash_features(["dark mode", "Dark   MODE!", ""])
+    assert x.shape[0] == 3
+    assert (x[0] != x[1]).nnz == 0
+    assert x[2].nnz == 0
+    # 2 words + 1 bigram + 5 char trigrams of " dark " and " mode " each
+    assert x[0].sum() == 2 + 1 + 4 + 4
+
+def test_labeled_tickets_reads_both_formats(tmp_path):
+    """Memory bank and demo ticket files both provide labels, repeats count once"""
+    bank = tmp_path / "bank.json"
+    bank.write_text('{"tickets": [{"description": "refund", "category": "billing", "severity": "high"},'
+                    ' {"description": "refund", "category": "billing", "severity": "high"}]}')
+    demo = tmp_path / "demo.json"
+    demo.write_text('[{"description": "dark mode", "expected_category": "feature_request", "expected_severity": "low"}]')
+    assert labeled_tickets([str(bank), str(demo), str(tmp_path / "missing.json")]) == [
+        ("refund", "billing", "high"), ("dark mode", "feature_request", "low"),
+    ]
+
+def test_low_confidence_falls_back_to_rules(monkeypatch, tmp_path):
+    """Below the confidence threshold the keyword rules decide, and the model's guess is kept"""
+    bank = tmp_path / "bank.json"
+    bank.write_text(json.dumps({"tickets": [
+        {"description": d, "category": c, "severity": s} for d, c, s in EXAMPLES]}))
+    monkeypatch.setattr(triage_model_module, "_model", TriageModel().fit(labeled_tickets([str(bank)])))
+    agent = TriageAgent(classifier="model")
+    monkeypatch.setattr(triage_agent_module, "MIN_CONFIDENCE", 1.01)
+    result = agent._classify_ticket("I was double charged")
+    assert result["low_confidence"] and result["rule"] == "billing"
+    assert "model_category" in result and 0 < result["confidence"] <= 1
+
+def test_unknown_classifier_rejected():
+    with pytest.raises(ValueError):
+        TriageAgent(classifier="magic")
@@ -0,0 +1,80 @@
+"""
+Tests for the compiled triage rule matcher
+"""
+import json
+import pytest
+from agents.triage_rules import TriageRuleEngine, TriageRules, triage_rules
+
+def test_rules_keep_priority_order():
+    """The first matching rule wins regardless of where keywords appear"""
+    result = triage_rules.classify("How do I enable dark mode? Also my payment failed")
+    assert (result["category"], result["severity"]) == ("billing", "high")
+    assert (result["rule"], result["keyword"]) == ("billing", "payment")
+    assert triage_rules.classify("Video player is NOT WORKING")["category"] == "technical_issue"
+    assert triage_rules.classify("hello there") == {
+        "category": "other", "severity": "low", "reasoning": "General inquiry", "rule": None, "keyword": None,
+    }
+
+def test_overlapping_keywords_are_not_missed():
+    """A lower-priority keyword can't hide an overlapping or prefix keyword of a higher rule"""
+    rules = TriageRules([
+        {"name": "high", "category": "a", "severity": "high", "reasoning": "", "keywords": ["do", "cess"]},
+        {"name": "low", "category": "b", "severity": "low", "reasoning": "", "keywords": ["double", "access"]},
+    ])
+    assert rules.classify("double check")["rule"] == "high"
+    assert rules.classify("no access")["keyword"] == "cess"
+    assert [(rule, kw) for rule, kw, _ in rules.hits("access, double")] == [(1, "access"), (0, "cess"), (0, "do")]
+
+def test_long_ticket_single_pass():
+    """Keywords buried in a long pasted log are still found"""
+    log = "INFO request ok\n" * 20000 + "stack trace: ERROR NullPointerException\n"
+    result = triage_rules.classify(log)
+    assert (result["category"], result["keyword"]) == ("technical_issue", "error")
+
+def test_engine_reload_swaps_rules_and_counts_hits(tmp_path):
+    """Rules reload from file without a restart; hits are counted per rule"""
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([
+        {"name": "refunds", "category": "billing", "severity": "high", "keywords": ["refund"]},
+    ]))
+    engine = TriageRuleEngine(str(path))
+    assert engine.classify("I want a refund")["rule"] == "refunds"
+    assert engine.classify("dark mode please")["category"] == "other"
+    stats = engine.stats()
+    assert stats["hits"] == {"refunds": 1, "fallback": 1} and stats["matches"] == 2
+
+    path.write_text(json.dumps([
+        {"name": "ui", "category": "feature_request", "severity": "low", "keywords": ["dark mode"]},
+    ]))
+    assert engine.reload() == {"ok": True, "version": 1, "rules": 1}
+    assert engine.classify("dark mode please")["rule"] == "ui"
+    assert engine.stats()["hits"] == {"ui": 1, "fallback": 0}
+
+def test_engine_keeps_rules_on_invalid_file(tmp_path):
+    """A broken rules file doesn't replace the loaded table"""
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([{"name": "a", "category": "billing", "severity": "high", "keywords": ["refund"]}]))
+    engine = TriageRuleEngine(str(path))
+    path.write_text(json.dumps([{"name": "a", "keywords": ["refund"]}]))
+    result = engine.reload()
+    assert not result["ok"] and "missing category, severity" in result["error"]
+    assert engine.classify("refund")["category"] == "billing"
+
+@pytest.mark.parametrize("filename, content, error", [
+    ("rules.json", json.dumps([{"name": "a", "category": "billing", "severity": "high", "keywords": [1]}]),
+     "keywords must be strings"),
+    ("rules.yaml", "- name: a\n  keywords: [refund\n", "invalid YAML"),
+])
+def test_engine_rejects_malformed_rules(tmp_path, filename, content, error):
+    """Non-string keywords and YAML syntax errors fail the reload, not the engine"""
+    if filename.endswith(".yaml"):
+        pytest.importorskip("yaml")
+    path = tmp_path / filename
+    path.write_text("- name: a\n  category: billing\n  severity: high\n  keywords: [refund]\n"
+                    if filename.endswith(".yaml") else
+                    json.dumps([{"name": "a", "category": "billing", "severity": "high", "keywords": ["refund"]}]))
+    engine = TriageRuleEngine(str(path))
+    path.write_text(content)
+    result = engine.reload()
+    assert not result["ok"] and error in result["error"]
+    assert engine.classify("refund")["category"] == "billing"
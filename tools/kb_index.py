@@ -0,0 +1,338 @@
+"""
+Compiled on-disk KB index (".kbidx"), memory-mapped read-only at load time.
+
+`python scripts/kb.py compile` writes it from kb_data.json. Pointing
+KBSearchTool at a .kbidx file (KB_PATH=tools/kb_data.kbidx) skips json.load
+and index building entirely: startup only maps the file, and since the
+mapping is shared through the OS page cache every uvicorn worker reads the
+same physical pages instead of holding its own copy of the KB.
+
+Layout (little-endian), all sections 8-byte aligned:
+
+    header   magic, version, counts, avg_len, section offsets
+    docs     per article: body offset u64, body length u32, doc length f32,
+             parent doc id u32 (first passage of the same kb_ingest article)
+    bodies   each article as UTF-8 JSON
+    terms    per term, sorted by UTF-8 bytes: string offset u64, string
+             length u32, postings offset u64, postings count u32
+    strings  term string bytes
+    postings per term: doc ids u32[count], then title-boosted tfs f32[count]
+    grams    per trigram, sorted: string offset u64, string length u32,
+             term-ids offset u64, term-ids count u32
+    gstrings trigram string bytes
+    gterms   per trigram: term ids u32[count]
+    spans    per article, where its passages start: u32[docs + 1] into the
+             pairs that follow; then each passage as start, end u32 offsets
+             into content (the snippet passages, computed at compile time)
+"""
+import heapq
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from tools.kb_tool import _KeywordSearch, _doc_freqs, _grams, passage_spans
+
+MAGIC = b"KBIX"
+FORMAT_VERSION = 3
+SPILL_POSTINGS = 1 << 21  # buffered postings per sorted run written to disk
+
+_HEADER = struct.Struct("<4sIIIId8Q")
+_DOC = struct.Struct("<QIfI")
+_ENTRY = struct.Struct("<QIQI")  # shared by the terms and grams tables
+_RUN_TERM = struct.Struct("<II")  # spilled run record: term length, postings count
+
+
+class KBIndexWriter:
+    """
+    Streams articles into a compiled index. Article bodies go straight to a
+    temporary file, and postings are kept in memory only until
+    `spill_postings` of them have accumulated: then they are written out as
+    a run sorted by term. close() merges the runs term by term, writing
+    each section straight to the final file (atomically, via rename), so
+    peak memory is bounded by the spill size plus the vocabulary.
+    """
+
+    def __init__(self, path: str, spill_postings: int = SPILL_POSTINGS):
+        self.path = path
+        self.spill_postings = spill_postings
+        self._bodies = tempfile.TemporaryFile()
+        self._docs = array("Q")      # body offsets
+        self._body_lens = array("I")
+        self._doc_lens = array("f")
+        self._parents = array("I")   # first doc of the same article
+        self._spans = tempfile.TemporaryFile()  # passage offsets, u32 pairs
+        self._span_starts = array("I", [0])
+        self._article_docs: Dict[str, int] = {}
+        self._postings: Dict[str, tuple] = {}
+        self._buffered = 0
+        self._runs: List = []
+        self.n_docs = 0
+
+    def add(self, item: Dict):
+        _, freqs = _doc_freqs(item)
+        self.add_freqs(item, freqs)
+
+    def add_freqs(self, item: Dict, freqs: Dict[str, float], spans: Optional[List[Tuple[int, int]]] = None):
+        """Add an article whose term frequencies (and passage spans) were computed elsewhere."""
+        if spans is None:
+            spans = passage_spans(item.get("content", ""))
+        self._spans.write(array("I", [offset for span in spans for offset in span]).tobytes())
+        self._span_starts.append(self._span_starts[-1] + len(spans))
+        doc_id = self.n_docs
+        body = json.dumps(item, ensure_ascii=False).encode("utf-8")
+        self._docs.append(self._bodies.tell())
+        self._body_lens.append(len(body))
+        self._doc_lens.append(sum(freqs.values()))
+        article_id = item.get("article_id")
+        self._parents.append(doc_id if article_id is None else self._article_docs.setdefault(article_id, doc_id))
+        self._bodies.write(body)
+        for term, tf in freqs.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("f"))
+            postings[0].append(doc_id)
+            postings[1].append(tf)
+        self._buffered += len(freqs)
+        self.n_docs += 1
+        if self._buffered >= self.spill_postings:
+            self._spill()
+
+    def _spill(self):
+        """Write the buffered postings to a temporary run, sorted by term."""
+        run = tempfile.TemporaryFile()
+        for term in sorted(self._postings, key=lambda t: t.encode("utf-8")):
+            raw = term.encode("utf-8")
+            ids, tfs = self._postings[term]
+            run.write(_RUN_TERM.pack(len(raw), len(ids)))
+            run.write(raw)
+            run.write(ids.tobytes())
+            run.write(tfs.tobytes())
+        run.seek(0)
+        self._runs.append(run)
+        self._postings = {}
+        self._buffered = 0
+
+    def _merged(self) -> Iterator[Tuple[bytes, List[bytes], List[bytes]]]:
+        """(term, id chunks, tf chunks) over every run, terms in byte order."""
+        if self._postings or not self._runs:
+            self._spill()
+        # Runs hold consecutive doc ranges, so run order keeps ids ascending
+        streams = [((raw, i, ids, tfs) for raw, ids, tfs in _read_run(run)) for i, run in enumerate(self._runs)]
+        current, ids_parts, tfs_parts = None, [], []
+        for raw, _, ids, tfs in heapq.merge(*streams):
+            if raw != current:
+                if current is not None:
+                    yield current, ids_parts, tfs_parts
+                current, ids_parts, tfs_parts = raw, [], []
+            ids_parts.append(ids)
+            tfs_parts.append(tfs)
+        if current is not None:
+            yield current, ids_parts, tfs_parts
+
+    def close(self):
+        avg_len = (sum(self._doc_lens) / self.n_docs) if self.n_docs else 0.0
+        entries = array("Q")  # per term: string offset, length, postings offset, count
+        gram_terms: Dict[str, array] = {}
+        with tempfile.TemporaryFile() as strings, tempfile.TemporaryFile() as postings:
+            for term_id, (raw, ids_parts, tfs_parts) in enumerate(self._merged()):
+                count = sum(len(part) for part in ids_parts) // 4
+                entries.extend((strings.tell(), len(raw), postings.tell(), count))
+                strings.write(raw)
+                for part in ids_parts + tfs_parts:
+                    postings.write(part)
+                for gram in _grams(raw.decode("utf-8")):
+                    gram_terms.setdefault(gram, array("I")).append(term_id)
+            n_terms = len(entries) // 4
+            for run in self._runs:
+                run.close()
+            self._runs = []
+            grams = sorted(gram_terms, key=lambda g: g.encode("utf-8"))
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as out:
+                out.write(b"\0" * _HEADER.size)
+                offsets = []
+
+                # docs + bodies
+                offsets.append(_align(out))
+                body_base = offsets[0] + _DOC.size * self.n_docs
+                for off, length, doc_len, parent in zip(self._docs, self._body_lens, self._doc_lens, self._parents):
+                    out.write(_DOC.pack(body_base + off, length, doc_len, parent))
+                offsets.append(out.tell())
+                _copy(self._bodies, out)
+
+                # terms, strings, postings
+                offsets.append(_align(out))
+                strings_off = offsets[-1] + _ENTRY.size * n_terms
+                strings_off += -strings_off % 8
+                postings_off = strings_off + strings.tell()
+                postings_off += -postings_off % 8
+                for i in range(0, len(entries), 4):
+                    s_off, s_len, p_off, count = entries[i:i + 4]
+                    out.write(_ENTRY.pack(strings_off + s_off, s_len, postings_off + p_off, count))
+                offsets.append(_align(out))
+                _copy(strings, out)
+                offsets.append(_align(out))
+                _copy(postings, out)
+
+                # grams, gram strings, gram term lists
+                offsets.append(_align(out))
+                gstrings_off = offsets[-1] + _ENTRY.size * len(grams)
+                gstrings_off += -gstrings_off % 8
+                gterms_off = gstrings_off + sum(len(g.encode("utf-8")) for g in grams)
+                gterms_off += -gterms_off % 8
+                s_off = t_off = 0
+                for gram in grams:
+                    s_len, count = len(gram.encode("utf-8")), len(gram_terms[gram])
+                    out.write(_ENTRY.pack(gstrings_off + s_off, s_len, gterms_off + t_off, count))
+                    s_off += s_len
+                    t_off += 4 * count
+                _align(out)
+                for gram in grams:
+                    out.write(gram.encode("utf-8"))
+                _align(out)
+                for gram in grams:
+                    out.write(gram_terms[gram].tobytes())
+
+                # passage spans
+                offsets.append(_align(out))
+                out.write(self._span_starts.tobytes())
+                _copy(self._spans, out)
+
+                out.seek(0)
+                out.write(_HEADER.pack(MAGIC, FORMAT_VERSION, self.n_docs, n_terms, len(grams),
+                                       avg_len, *offsets, 0))
+        self._bodies.close()
+        self._spans.close()
+        os.replace(tmp_path, self.path)
+
+
+def _read_run(run) -> Iterator[Tuple[bytes, bytes, bytes]]:
+    while True:
+        head = run.read(_RUN_TERM.size)
+        if not head:
+            return
+        s_len, count = _RUN_TERM.unpack(head)
+        yield run.read(s_len), run.read(4 * count), run.read(4 * count)
+
+
+def _copy(src, dst):
+    src.seek(0)
+    while True:
+        chunk = src.read(1 << 20)
+        if not chunk:
+            break
+        dst.write(chunk)
+
+
+def compile_kb(kb: List[Dict], path: str) -> int:
+    """Write `kb` as a compiled index at `path`; returns the article count."""
+    writer = KBIndexWriter(path)
+    for item in kb:
+        writer.add(item)
+    writer.close()
+    return writer.n_docs
+
+
+class _CompiledDocs:
+    """Read-only sequence of articles, decoded from the mapping on access."""
+
+    def __init__(self, index: "MmapKBIndex"):
+        self._index = index
+
+    def __len__(self) -> int:
+        return self._index.n_docs
+
+    def __getitem__(self, doc_id: int) -> Dict:
+        if not 0 <= doc_id < self._index.n_docs:
+            raise IndexError(doc_id)
+        return json.loads(self._index._body(doc_id))
+
+    def __iter__(self) -> Iterator[Dict]:
+        return (self[i] for i in range(len(self)))
+
+
+class MmapKBIndex(_KeywordSearch):
+    """Keyword/BM25 search served straight from a memory-mapped .kbidx file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.n_docs, self.n_terms, self.n_grams, self.avg_len,
+         self._docs_off, _, self._terms_off, _, _, self._grams_off, self._spans_off, _) = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a compiled KB index (format v{FORMAT_VERSION})")
+        self.kb = _CompiledDocs(self)
+
+    def _body(self, doc_id: int) -> bytes:
+        off, length, _, _ = _DOC.unpack_from(self._mm, self._docs_off + _DOC.size * doc_id)
+        return self._mm[off:off + length]
+
+    def _entry_key(self, table_off: int, i: int) -> bytes:
+        s_off, s_len, _, _ = _ENTRY.unpack_from(self._mm, table_off + _ENTRY.size * i)
+        return self._mm[s_off:s_off + s_len]
+
+    def _find(self, table_off: int, n: int, key: bytes) -> Optional[tuple]:
+        """Binary search a sorted terms/grams table for `key`."""
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry_key(table_off, mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < n and self._entry_key(table_off, lo) == key:
+            return _ENTRY.unpack_from(self._mm, table_off + _ENTRY.size * lo)
+        return None
+
+    def _term(self, term_id: int) -> str:
+        return self._entry_key(self._terms_off, term_id).decode("utf-8")
+
+    def postings_of(self, term: str) -> Dict[int, float]:
+        entry = self._find(self._terms_off, self.n_terms, term.encode("utf-8"))
+        if entry is None:
+            return {}
+        _, _, off, count = entry
+        ids = struct.unpack_from(f"<{count}I", self._mm, off)
+        tfs = struct.unpack_from(f"<{count}f", self._mm, off + 4 * count)
+        return dict(zip(ids, tfs))
+
+    def gram_terms_of(self, gram: str) -> Set[str]:
+        entry = self._find(self._grams_off, self.n_grams, gram.encode("utf-8"))
+        if entry is None:
+            return set()
+        _, _, off, count = entry
+        return {self._term(term_id) for term_id in struct.unpack_from(f"<{count}I", self._mm, off)}
+
+    def vocabulary(self):
+        return (self._term(i) for i in range(self.n_terms))
+
+    def doc_ids(self):
+        return range(self.n_docs)
+
+    def doc_len(self, doc_id: int) -> float:
+        return _DOC.unpack_from(self._mm, self._docs_off + _DOC.size * doc_id)[2]
+
+    def article_of(self, doc_id: int) -> int:
+        return _DOC.unpack_from(self._mm, self._docs_off + _DOC.size * doc_id)[3]
+
+    def text(self, doc_id: int) -> str:
+        return _doc_freqs(self.kb[doc_id])[0]
+
+    def passages(self, doc_id: int) -> List[Tuple[int, int]]:
+        start, end = struct.unpack_from("<2I", self._mm, self._spans_off + 4 * doc_id)
+        pairs_off = self._spans_off + 4 * (self.n_docs + 1) + 8 * start
+        offsets = struct.unpack_from(f"<{2 * (end - start)}I", self._mm, pairs_off)
+        return list(zip(offsets[::2], offsets[1::2]))
+
+
+def _align(f) -> int:
+    pad = -f.tell() % 8
+    if pad:
+        f.write(b"\0" * pad)
+    return f.tell()
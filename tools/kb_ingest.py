@@ -0,0 +1,213 @@
+"""
+Streaming KB ingestion into a compiled index (tools/kb_index.py).
+
+Sources are read one article at a time:
+- .jsonl files: one article object per line
+- .json files: a KB array (parsed whole, like kb_data.json)
+- directories: every Markdown (.md/.markdown) and HTML (.html/.htm) file,
+  recursively; the id is the relative path, the title the first heading
+
+Long articles are split into passages of at most `chunk_chars` characters on
+paragraph boundaries; each passage is indexed as its own document
+("<id>#<n>", with "article_id" pointing back at the original), and search
+ranks an article by its best passage, so one article takes one result slot.
+
+Normalization and term counting run in a process pool over fixed-size
+batches, so only one batch of article text is in memory at a time; the
+writer streams bodies to disk and spills postings in sorted runs.
+"""
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tools.kb_index import KBIndexWriter
+from tools.kb_tool import _doc_freqs, passage_spans
+from utils.observability import logger
+
+CHUNK_CHARS = 2000
+BATCH_SIZE = 512
+MARKDOWN_EXTS = (".md", ".markdown")
+HTML_EXTS = (".html", ".htm")
+
+_MD_HEADING = re.compile(r"^[ \t]{0,3}#{1,6}[ \t]+(.*?)[ \t]*#*[ \t]*$", re.MULTILINE)
+_MD_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_MD_MARKUP = re.compile(r"(^[ \t]{0,3}(#{1,6}|>|[-*+]|\d+\.)[ \t]+|[*_`~]+)", re.MULTILINE)
+
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                logger.log_event("kb_ingest.error", {"path": path, "line": line_no, "error": str(e)})
+
+
+def _markdown_article(doc_id: str, text: str) -> Dict:
+    heading = _MD_HEADING.search(text)
+    title = heading.group(1) if heading else os.path.splitext(os.path.basename(doc_id))[0]
+    if heading:
+        text = text[:heading.start()] + text[heading.end():]
+    content = _MD_MARKUP.sub("", _MD_LINK.sub(r"\1", text))
+    content = re.sub(r"\n{3,}", "\n\n", content)
+    return {"id": doc_id, "title": title.strip(), "content": content.strip()}
+
+
+class _HTMLText(HTMLParser):
+    """Collects visible text, the <title> and the first <h1>."""
+
+    VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "wbr"}
+    BLOCK_TAGS = {"p", "div", "br", "li", "h1", "h2", "h3", "h4", "h5", "h6", "tr", "section", "article"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self.title = ""
+        self.h1 = ""
+        self._h1_done = False
+        self._stack: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.BLOCK_TAGS:
+            self.parts.append("\n\n")
+        if tag not in self.VOID_TAGS:
+            self._stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag == "h1" and self.h1:
+            self._h1_done = True
+        if tag in self._stack:
+            while self._stack.pop() != tag:
+                pass
+
+    def handle_data(self, data):
+        if "script" in self._stack or "style" in self._stack:
+            return
+        if "title" in self._stack:
+            self.title += data
+        elif "h1" in self._stack and not self._h1_done:
+            self.h1 += data
+        else:
+            self.parts.append(data)
+
+
+def _html_article(doc_id: str, text: str) -> Dict:
+    parser = _HTMLText()
+    parser.feed(text)
+    parser.close()
+    content = re.sub(r"[ \t]+", " ", "".join(parser.parts))
+    content = re.sub(r"\s*\n\s*\n\s*", "\n\n", content)
+    title = (parser.h1 or parser.title).strip() or os.path.splitext(os.path.basename(doc_id))[0]
+    return {"id": doc_id, "title": " ".join(title.split()), "content": content.strip()}
+
+
+def iter_docs_dir(root: str) -> Iterator[Dict]:
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            ext = os.path.splitext(name)[1].lower()
+            if ext not in MARKDOWN_EXTS + HTML_EXTS:
+                continue
+            path = os.path.join(dirpath, name)
+            doc_id = os.path.relpath(path, root).replace(os.sep, "/")
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            yield _markdown_article(doc_id, text) if ext in MARKDOWN_EXTS else _html_article(doc_id, text)
+
+
+def iter_articles(source: str) -> Iterator[Dict]:
+    """Articles from a .jsonl file, a .json KB array or a docs directory."""
+    if os.path.isdir(source):
+        yield from iter_docs_dir(source)
+    elif source.endswith(".jsonl"):
+        yield from iter_jsonl(source)
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+
+def chunk_article(item: Dict, chunk_chars: int = CHUNK_CHARS) -> List[Dict]:
+    """Split an article's content into passages of at most chunk_chars."""
+    content = item.get("content", "")
+    if len(content) <= chunk_chars:
+        return [item]
+
+    passages, current = [], ""
+    for para in re.split(r"\n\s*\n", content):
+        para = para.strip()
+        # Paragraphs longer than a whole passage get cut on word boundaries
+        while len(para) > chunk_chars:
+            cut = para.rfind(" ", 0, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(para[:cut].strip())
+            para = para[cut:].strip()
+        if current and len(current) + 2 + len(para) > chunk_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{para}" if current else para
+    if current:
+        passages.append(current)
+
+    article_id = item.get("id") or item.get("title", "")
+    return [
+        {**item, "id": f"{article_id}#{n}", "article_id": article_id, "part": n, "content": passage}
+        for n, passage in enumerate(passages, 1)
+    ]
+
+
+def _prepare(item: Dict) -> Tuple[Dict, Dict[str, float], List[Tuple[int, int]]]:
+    """Worker side: normalize, count terms and find snippet spans for one passage."""
+    item.setdefault("title", "")
+    item.setdefault("content", "")
+    return item, dict(_doc_freqs(item)[1]), passage_spans(item["content"])
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ingest(sources: List[str], output: str, workers: Optional[int] = None,
+           chunk_chars: int = CHUNK_CHARS, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """
+    Stream every source into a compiled index at `output`.
+    workers=0 or 1 runs in-process; None uses one worker per CPU.
+    Returns {"articles": ..., "passages": ...}.
+    """
+    writer = KBIndexWriter(output)
+    stats = {"articles": 0, "passages": 0}
+
+    def passages():
+        for source in sources:
+            for item in iter_articles(source):
+                stats["articles"] += 1
+                yield from chunk_article(item, chunk_chars)
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers is None or workers > 1 else None
+    try:
+        for batch in _batched(passages(), batch_size):
+            prepared = pool.map(_prepare, batch, chunksize=32) if pool else map(_prepare, batch)
+            for item, freqs, spans in prepared:
+                writer.add_freqs(item, freqs, spans)
+                stats["passages"] += 1
+    finally:
+        if pool:
+            pool.shutdown()
+    writer.close()
+
+    logger.log_event("kb_ingest.finish", {"sources": sources, "output": output, **stats})
+    return stats
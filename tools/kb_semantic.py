@@ -0,0 +1,203 @@
+"""
+Offline semantic retrieval backend for KBSearchTool (KB_BACKEND=semantic).
+
+Passages (tools/kb_tool.py:passage_spans, each prefixed with its article's
+title) are embedded locally: words and their character 3-5 grams are
+feature-hashed into a fixed-size sparse vector, IDF-weighted over the KB and
+projected to EMBED_DIM dimensions with a fixed, seeded Gaussian matrix. Shared
+word pieces ("log in" / "login", "crashes" / "crash") land close together
+without a model download, network access or a GPU.
+
+Passage vectors are kept in an IVF index: spherical k-means splits them into
+~sqrt(n) lists and a query only scores the passages in its KB_IVF_NPROBE
+closest lists. Raising nprobe trades latency for recall; nprobe >= the list
+count is an exact search. `python scripts/bench_semantic.py` reports recall
+against brute force for a range of nprobe values.
+
+An article scores as its best passage; articles below KB_SEMANTIC_MIN_SCORE
+are not returned, so unrelated tickets still fall through to web search.
+"""
+import os
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional dependency, only needed for this backend
+    np = None
+    sparse = None
+
+from tools.kb_tool import article_groups, passage_spans
+from utils.query_normalizer import normalize_query, normalize_text
+
+EMBED_DIM = 256
+HASH_FEATURES = 1 << 14
+NGRAM_SIZES = (3, 4, 5)
+EMBED_SEED = 13
+
+IVF_NPROBE = int(os.getenv("KB_IVF_NPROBE", "8"))
+KMEANS_ITERS = 10
+MIN_SCORE = float(os.getenv("KB_SEMANTIC_MIN_SCORE", "0.2"))
+
+# Queries are embedded in chunks so the dense block stays bounded
+QUERY_CHUNK = 256
+
+
+@lru_cache(maxsize=1 << 16)
+def _word_features(word: str, n_features: int):
+    """Hashed columns and signs of a word and the character n-grams of " word "."""
+    padded = f" {word} "
+    feats = ["w:" + word] + [padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)]
+    # crc32 rather than hash(): str hashes are salted per process
+    hashes = np.array([zlib.crc32(feat.encode("utf-8")) for feat in feats], dtype=np.uint32)
+    return (hashes % n_features).astype(np.int64), np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+
+
+class HashedEmbedder:
+    """Feature-hashed words + char n-grams, randomly projected to `dim`."""
+
+    def __init__(self, dim: int = EMBED_DIM, n_features: int = HASH_FEATURES, seed: int = EMBED_SEED):
+        if np is None:
+            raise ImportError("The semantic KB backend requires numpy and scipy (pip install numpy scipy)")
+        self.dim = dim
+        self.n_features = n_features
+        rng = np.random.default_rng(seed)
+        self.projection = (rng.standard_normal((n_features, dim)) / np.sqrt(dim)).astype(np.float32)
+
+    def hashed(self, texts: List[str]):
+        """Sparse (len(texts), n_features) matrix of signed, sublinear feature counts."""
+        cols, signs, lengths = [], [], []
+        for text in texts:
+            length = 0
+            for word in text.split():
+                word_cols, word_signs = _word_features(word, self.n_features)
+                cols.append(word_cols)
+                signs.append(word_signs)
+                length += len(word_cols)
+            lengths.append(length)
+        if not cols:
+            return sparse.csr_matrix((len(texts), self.n_features), dtype=np.float32)
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        # Duplicate (row, col) entries are summed on conversion
+        x = sparse.csr_matrix((np.concatenate(signs), (rows, np.concatenate(cols))),
+                              shape=(len(texts), self.n_features), dtype=np.float32)
+        x.eliminate_zeros()  # colliding features with opposite signs
+        x.data = np.sign(x.data) * (1.0 + np.log(np.abs(x.data)))
+        return x
+
+    def project(self, hashed, weights=None):
+        """L2-normalized (rows, dim) embeddings of a hashed() matrix; `weights` scales each feature."""
+        if weights is not None:
+            hashed = hashed @ sparse.diags(weights)
+        return _l2_normalize(np.asarray(hashed @ self.projection, dtype=np.float32))
+
+    def embed(self, texts: List[str], weights=None):
+        return self.project(self.hashed(texts), weights)
+
+
+class IVFIndex:
+    """Inverted-file ANN index over L2-normalized vectors (inner product)."""
+
+    def __init__(self, vectors, n_lists: Optional[int] = None, seed: int = EMBED_SEED):
+        self.vectors = vectors
+        n = len(vectors)
+        n_lists = n_lists or max(1, int(round(np.sqrt(n))))
+        self.n_lists = max(1, min(n_lists, n))
+        if n == 0:
+            self.centroids = np.zeros((1, vectors.shape[1]), dtype=np.float32)
+            self.lists = [np.zeros(0, dtype=np.int64)]
+            return
+
+        rng = np.random.default_rng(seed)
+        self.centroids = vectors[rng.choice(n, self.n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERS):
+            assign = np.argmax(vectors @ self.centroids.T, axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, vectors)
+            empty = ~np.bincount(assign, minlength=self.n_lists).astype(bool)
+            # Empty lists are reseeded from a random vector instead of dying
+            sums[empty] = vectors[rng.integers(n, size=int(empty.sum()))]
+            self.centroids = _l2_normalize(sums)
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+        self.lists = [np.flatnonzero(assign == c) for c in range(self.n_lists)]
+
+    def candidates(self, query, nprobe: int):
+        """Vector ids in the `nprobe` lists whose centroids are closest to `query`."""
+        if nprobe >= self.n_lists:
+            return np.arange(len(self.vectors))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.lists[c] for c in probe])
+
+    def scored(self, query, nprobe: int):
+        """(ids, inner products) of the candidate vectors for `query`, unordered."""
+        ids = self.candidates(query, nprobe)
+        return ids, self.vectors[ids] @ query
+
+
+class SemanticIndex:
+    def __init__(self, kb: List[Dict], nprobe: int = IVF_NPROBE, min_score: float = MIN_SCORE,
+                 embedder: Optional[HashedEmbedder] = None):
+        self.kb = kb
+        self.nprobe = nprobe
+        self.min_score = min_score
+        self.embedder = embedder or HashedEmbedder()
+        self.spans = [passage_spans(item["content"]) for item in kb]
+
+        texts, owners = [], []
+        for doc_id, (item, spans) in enumerate(zip(kb, self.spans)):
+            for start, end in spans or [(0, 0)]:
+                texts.append(normalize_text(item["title"] + " " + item["content"][start:end]))
+                owners.append(doc_id)
+        self.passage_doc = np.asarray(owners, dtype=np.int64)
+        # Chunks of one ingested article (tools/kb_ingest.py) rank as one result
+        groups, _ = article_groups(kb)
+        self.articles = np.asarray(groups, dtype=np.int64)
+        parts = np.bincount(self.articles[self.passage_doc], minlength=len(kb)) if owners else []
+        self.max_parts = int(max(parts, default=1)) or 1
+
+        # Smoothed IDF over passages, per hashed feature
+        hashed = self.embedder.hashed(texts)
+        df = np.bincount(hashed.indices, minlength=self.embedder.n_features)
+        self.idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+        self.ivf = IVFIndex(self.embedder.project(hashed, self.idf))
+
+    def passages(self, doc_id: int) -> List[Tuple[int, int]]:
+        return self.spans[doc_id]
+
+    def search(self, query: str, top_k: int) -> Tuple[List[Tuple[int, float]], int]:
+        """Returns ([(doc id, cosine score)], number of articles above min_score)."""
+        return self.search_many([query], top_k)[0]
+
+    def search_many(self, queries: List[str], top_k: int) -> List[Tuple[List[Tuple[int, float]], int]]:
+        results = []
+        for start in range(0, len(queries), QUERY_CHUNK):
+            chunk = [normalize_query(q) for q in queries[start:start + QUERY_CHUNK]]
+            vectors = self.embedder.embed(chunk, self.idf)
+            for text, vector in zip(chunk, vectors):
+                results.append(self._rank(vector, top_k) if text else ([], 0))
+        return results
+
+    def _rank(self, vector, top_k: int) -> Tuple[List[Tuple[int, float]], int]:
+        ids, scores = self.ivf.scored(vector, self.nprobe)
+        keep = scores >= self.min_score
+        ids, scores = ids[keep], scores[keep]
+        hits = len(np.unique(self.articles[self.passage_doc[ids]]))
+        # top_k articles are among the top_k * max_parts passages
+        k = top_k * self.max_parts
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        best: Dict[int, Tuple[int, float]] = {}
+        for passage in np.lexsort((ids, -scores)):
+            doc_id = int(self.passage_doc[ids[passage]])
+            best.setdefault(int(self.articles[doc_id]), (doc_id, float(scores[passage])))
+        ranked = [(doc_id, round(score, 4)) for doc_id, score in list(best.values())[:top_k]]
+        return ranked, hits
+
+
+def _l2_normalize(m):
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32)
@@ -0,0 +1,107 @@
+"""
+Vectorized TF-IDF retrieval backend for KBSearchTool (KB_BACKEND=tfidf).
+
+The KB is turned into one L2-normalized sparse document-term matrix at load
+time. A query is answered with a single sparse matrix-vector product and a
+batch of queries with a single sparse matrix-matrix product; top-k selection
+uses argpartition, so no per-article Python loop runs at query time.
+
+Unlike the keyword backend, terms must match exactly (no substring matching)
+and an article only needs to share one query term to be returned. Chunks of
+one ingested article (tools/kb_ingest.py) count as one result: its best.
+"""
+import math
+from collections import Counter
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional dependency, only needed for this backend
+    np = None
+    sparse = None
+
+from tools.kb_tool import MIN_TOKEN_LEN, _doc_freqs, article_groups, passage_spans
+from utils.query_normalizer import normalize_query
+
+# Queries are scored in chunks so the dense score block stays bounded
+QUERY_CHUNK = 256
+
+
+class TfidfIndex:
+    def __init__(self, kb: List[Dict]):
+        if np is None:
+            raise ImportError("The tfidf KB backend requires numpy and scipy (pip install numpy scipy)")
+        self.kb = kb
+        self.vocab: Dict[str, int] = {}
+        self.spans = [passage_spans(item["content"]) for item in kb]
+        groups, self.max_parts = article_groups(kb)
+        self.articles = np.asarray(groups, dtype=np.int64)
+
+        rows, cols, vals = [], [], []
+        for doc_id, item in enumerate(kb):
+            _, freqs = _doc_freqs(item)
+            for term, tf in freqs.items():
+                rows.append(doc_id)
+                cols.append(self.vocab.setdefault(term, len(self.vocab)))
+                vals.append(1.0 + math.log(tf))  # sublinear tf
+
+        n_docs, n_terms = len(kb), len(self.vocab)
+        tf = sparse.csr_matrix((vals, (rows, cols)), shape=(n_docs, n_terms), dtype=np.float32)
+        df = np.bincount(tf.indices, minlength=n_terms)
+        self.idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        self.matrix = _l2_normalize(tf @ sparse.diags(self.idf))
+
+    def passages(self, doc_id: int) -> List[Tuple[int, int]]:
+        return self.spans[doc_id]
+
+    def _query_matrix(self, queries: List[str]):
+        rows, cols, vals = [], [], []
+        for row, query in enumerate(queries):
+            tokens = [t for t in normalize_query(query).split() if len(t) >= MIN_TOKEN_LEN]
+            for term, tf in Counter(tokens).items():
+                col = self.vocab.get(term)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    vals.append((1.0 + math.log(tf)) * self.idf[col])
+        q = sparse.csr_matrix((vals, (rows, cols)), shape=(len(queries), len(self.vocab)), dtype=np.float32)
+        return _l2_normalize(q)
+
+    def search(self, query: str, top_k: int) -> Tuple[List[Tuple[int, float]], int]:
+        """Returns ([(doc id, cosine score)], number of articles scoring > 0)."""
+        q = self._query_matrix([query])
+        scores = (self.matrix @ q.T).toarray().ravel()
+        return _top_k(scores, top_k, self.articles, self.max_parts)
+
+    def search_many(self, queries: List[str], top_k: int) -> List[Tuple[List[Tuple[int, float]], int]]:
+        results = []
+        for start in range(0, len(queries), QUERY_CHUNK):
+            q = self._query_matrix(queries[start:start + QUERY_CHUNK])
+            scores = (q @ self.matrix.T).toarray()
+            results.extend(_top_k(row, top_k, self.articles, self.max_parts) for row in scores)
+        return results
+
+
+def _l2_normalize(m):
+    norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ m, dtype=np.float32)
+
+
+def _top_k(scores, top_k: int, articles=None, max_parts: int = 1) -> Tuple[List[Tuple[int, float]], int]:
+    matched = scores > 0
+    n_matched = int(np.count_nonzero(matched))
+    hits = len(np.unique(articles[matched])) if max_parts > 1 else n_matched
+    # The top_k articles are among the top_k * max_parts passages
+    k = min(top_k * max_parts, n_matched)
+    if k <= 0:
+        return [], hits
+    # argpartition picks the k best in O(n); only those k get sorted.
+    # Stable sort on the negated scores keeps file order on ties.
+    top = np.sort(np.argpartition(-scores, k - 1)[:k])
+    top = top[np.argsort(-scores[top], kind="stable")]
+    if max_parts > 1:
+        _, first = np.unique(articles[top], return_index=True)
+        top = top[np.sort(first)]
+    return [(int(doc_id), round(float(scores[doc_id]), 4)) for doc_id in top[:top_k]], hits
@@ -1,65 +1,660 @@
+import copy
+import heapq
 import json
+import math
 import os
 import re
-from typing import List, Dict
+import threading
+from collections import Counter
+from typing import List, Dict, Optional, Set, Tuple
+from utils.cache import LRUCache
 from utils.observability import logger, log_trace
+from utils.query_normalizer import normalize_query, normalize_text
 
 KB_FILE = "tools/kb_data.json"
+INDEX_SUFFIX = ".kbidx"  # compiled index, see tools/kb_index.py
+MAX_RESULTS = 3
 
-def normalize_query(q: str) -> str:
-    """Normalize query for better KB matching."""
-    q = q.lower().strip()
-    q = re.sub(r"[^\w\s]", " ", q)  # drop punctuation
-    q = re.sub(r"\s+", " ", q)       # collapse whitespace
-    # Synonyms
-    q = q.replace("theme", "mode")
-    q = q.replace("how do i enable", "enable")
-    q = q.replace("how to enable", "enable")
-    return q.strip()
+# Passage-level snippets: article content is split into passages of at most
+# PASSAGE_CHARS at index time, and search results carry the best one(s)
+PASSAGE_CHARS = 300
+SNIPPET_PASSAGES = int(os.getenv("KB_SNIPPET_PASSAGES", "1"))
+
+# Query-result cache, keyed on (KB version, normalized query, top_k)
+KB_CACHE_SIZE = int(os.getenv("KB_CACHE_SIZE", "1024"))
+KB_CACHE_TTL = float(os.getenv("KB_CACHE_TTL", "300"))  # seconds, 0 = no expiry
+MIN_TOKEN_LEN = 3  # shorter words are ignored as keywords
+GRAM_SIZE = 3
+
+# BM25 parameters; title terms count TITLE_BOOST times towards term frequency
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_BOOST = 2.0
+
+# Typo tolerance: when nothing matches exactly, query tokens that match no
+# term are corrected to vocabulary terms within a bounded edit distance
+FUZZY_MIN_COVERAGE = 0.5  # share of query tokens that must resolve
+
+# "keyword": substring/AND matching ranked by BM25 (default)
+# "tfidf": vectorized cosine similarity, see tools/kb_tfidf.py
+# "semantic": hashed n-gram embeddings in an ANN index, see tools/kb_semantic.py
+KB_BACKENDS = ("keyword", "tfidf", "semantic")
+
+def _grams(term: str) -> Set[str]:
+    return {term[i:i + GRAM_SIZE] for i in range(len(term) - GRAM_SIZE + 1)}
+
+def _max_edits(token: str) -> int:
+    """Edit budget for typo correction; short tokens are too ambiguous."""
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) == 4 else 2
+
+def _within_edits(a: str, b: str, max_edits: int) -> bool:
+    """Levenshtein distance <= max_edits, giving up as soon as a row exceeds it."""
+    if abs(len(a) - len(b)) > max_edits:
+        return False
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > max_edits:
+            return False
+        prev = cur
+    return prev[-1] <= max_edits
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+def article_groups(kb: List[Dict]) -> Tuple[List[int], int]:
+    """
+    Per doc id, the doc id of the first passage of its article (kb_ingest
+    splits long articles into chunks sharing an "article_id"), and the most
+    passages any article has.
+    """
+    first: Dict = {}
+    groups = [first.setdefault(item.get("article_id", ("doc", i)), i) for i, item in enumerate(kb)]
+    return groups, max(Counter(groups).values(), default=1)
+
+
+def passage_spans(content: str, max_chars: int = PASSAGE_CHARS) -> List[Tuple[int, int]]:
+    """
+    (start, end) offsets of the passages of `content`: whole sentences packed
+    greedily up to max_chars; a longer sentence is cut on word boundaries.
+    """
+    spans: List[Tuple[int, int]] = []
+    start = end = 0
+    pos = 0
+    for match in list(_SENTENCE_END.finditer(content)) + [None]:
+        s_end = match.start() if match else len(content)
+        s_next = match.end() if match else len(content)
+        if end > start and s_end - start > max_chars:
+            spans.append((start, end))
+            start = pos
+        while s_end - start > max_chars:
+            cut = content.rfind(" ", start, start + max_chars)
+            cut = cut if cut > start else start + max_chars
+            spans.append((start, cut))
+            start = cut + 1 if content[cut:cut + 1] == " " else cut
+        end, pos = s_end, s_next
+    if end > start:
+        spans.append((start, end))
+    return spans
+
+def best_passages(content: str, spans: List[Tuple[int, int]], query: str,
+                  limit: int = SNIPPET_PASSAGES) -> Optional[Tuple[str, List[int]]]:
+    """
+    The `limit` passages sharing the most query tokens (earliest on ties),
+    joined in document order, plus the offsets of the first one.
+    None when the article is a single passage.
+    """
+    if len(spans) <= 1:
+        return None
+    tokens = {t for t in normalize_query(query).split() if len(t) >= MIN_TOKEN_LEN}
+    scored = []
+    for i, (start, end) in enumerate(spans):
+        text = normalize_text(content[start:end])
+        scored.append((sum(1 for tok in tokens if tok in text), -i))
+    chosen = sorted(-neg_i for _, neg_i in sorted(scored, reverse=True)[:limit])
+    snippet = " ... ".join(content[spans[i][0]:spans[i][1]] for i in chosen)
+    return snippet, list(spans[chosen[0]])
+
+def _doc_freqs(item: Dict) -> Tuple[str, Counter]:
+    """Normalized title + content and its title-boosted term frequencies."""
+    text = normalize_text(item["title"] + " " + item["content"])
+    freqs = Counter(text.split())
+    for term in normalize_text(item["title"]).split():
+        freqs[term] += TITLE_BOOST - 1
+    return text, freqs
+
+def _keyed(kb: List[Dict]) -> Dict[str, Dict]:
+    """Articles by a stable key (their id, de-duplicated), in file order."""
+    keyed = {}
+    for item in kb:
+        base = str(item.get("id") or item.get("title", ""))
+        key, n = base, 1
+        while key in keyed:
+            n += 1
+            key = f"{base}#{n}"
+        keyed[key] = item
+    return keyed
+
+class _KeywordSearch:
+    """
+    Substring/AND keyword matching ranked by BM25, shared by the in-memory
+    index and the compiled on-disk one (tools/kb_index.py). Subclasses expose
+    n_docs, avg_len and the lookups: postings_of(term) -> {doc id: tf},
+    gram_terms_of(gram) -> terms, vocabulary(), doc_ids(), doc_len(doc id),
+    text(doc id) (the normalized title + content), passages(doc id) and
+    article_of(doc id).
+    """
+
+    def article_of(self, doc_id: int):
+        """Key shared by every passage of one article (chunks from kb_ingest)."""
+        return doc_id
+
+    def terms_containing(self, fragment: str) -> Set[str]:
+        """Vocabulary terms that contain `fragment` as a substring."""
+        if len(fragment) < GRAM_SIZE:
+            # Too short for the gram index; rare, so scan the vocabulary
+            return {term for term in self.vocabulary() if fragment in term}
+        candidates = None
+        for gram in _grams(fragment):
+            terms = self.gram_terms_of(gram)
+            if not terms:
+                return set()
+            candidates = set(terms) if candidates is None else candidates & terms
+        return {term for term in candidates if fragment in term}
+
+    def docs_containing(self, fragment: str) -> Dict[int, float]:
+        """
+        Doc ids whose normalized text contains `fragment` inside a word, with
+        the summed frequency of every matching term in that doc.
+        """
+        tfs: Dict[int, float] = {}
+        for term in self.terms_containing(fragment):
+            for doc_id, tf in self.postings_of(term).items():
+                tfs[doc_id] = tfs.get(doc_id, 0.0) + tf
+        return tfs
+
+    def similar_terms(self, token: str) -> Set[str]:
+        """
+        Vocabulary terms within _max_edits(token) edits of `token` that
+        start with the same letter (first letters are rarely mistyped, and
+        this keeps "what" from becoming "that").
+        Candidates come from the trigram table: a term within k edits shares
+        at least (grams in token - k * GRAM_SIZE) trigrams with it, so only
+        terms reaching that count are verified with edit distance.
+        """
+        max_edits = _max_edits(token)
+        if not max_edits:
+            return set()
+        grams = _grams(token)
+        min_shared = max(1, len(grams) - max_edits * GRAM_SIZE)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for term in self.gram_terms_of(gram):
+                shared[term] = shared.get(term, 0) + 1
+        return {term for term, count in shared.items()
+                if count >= min_shared and term[0] == token[0] and _within_edits(token, term, max_edits)}
+
+    def docs_similar_to(self, token: str) -> Dict[int, float]:
+        """Like docs_containing(), for the typo corrections of `token`."""
+        tfs: Dict[int, float] = {}
+        for term in self.similar_terms(token):
+            for doc_id, tf in self.postings_of(term).items():
+                tfs[doc_id] = tfs.get(doc_id, 0.0) + tf
+        return tfs
+
+    def bm25(self, df: int, tf: float, doc_id: int) -> float:
+        n = self.n_docs
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len(doc_id) / (self.avg_len or 1.0))
+        return idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    def search(self, query: str, top_k: int) -> Tuple[List[Tuple[int, float]], int]:
+        """
+        Token-based keyword matching with normalization for better recall:
+        an article matches if every query token appears in its title/content,
+        or (for queries without usable tokens) if the whole query does.
+        Queries with no match get a typo-tolerant second pass.
+        Matches are ranked with BM25 while keeping only a top_k heap.
+        Returns ([(doc id, score)], number of matching articles).
+        """
+        query_lower = normalize_query(query)
+
+        # Split query into meaningful tokens (filter out short words)
+        tokens = [t for t in query_lower.split() if len(t) >= MIN_TOKEN_LEN]
+        words = tokens or query_lower.split()
+
+        # Intersect postings, rarest-looking (longest) word first
+        matches = None
+        term_tfs = []
+        for word in sorted(set(words), key=len, reverse=True):
+            tfs = self.docs_containing(word)
+            term_tfs.append(tfs)
+            matches = set(tfs) if matches is None else matches & tfs.keys()
+            if not matches:
+                break
+        if matches is None:
+            # Empty query: the substring fallback matches every article
+            matches = set(self.doc_ids())
+        if not tokens:
+            # Fallback: substring match of the whole query
+            matches = {doc_id for doc_id in matches if query_lower in self.text(doc_id)}
+
+        if not matches and tokens:
+            return self._fuzzy_search(tokens, top_k)
+
+        return self._rank(matches, term_tfs, top_k)
+
+    def _fuzzy_search(self, tokens: List[str], top_k: int) -> Tuple[List[Tuple[int, float]], int]:
+        """
+        Typo-tolerant fallback for queries with no exact match. Tokens that
+        match no term are replaced by their close vocabulary terms; tokens
+        that still resolve to nothing (filler like "plz") are dropped. Only
+        applies if at least one token was corrected and FUZZY_MIN_COVERAGE of
+        the tokens resolved; the articles covering the most resolved tokens
+        match.
+        """
+        term_tfs = []
+        corrected = False
+        for tok in set(tokens):
+            tfs = self.docs_containing(tok)
+            if not tfs:
+                tfs = self.docs_similar_to(tok)
+                corrected = corrected or bool(tfs)
+            if tfs:
+                term_tfs.append(tfs)
+        if not corrected or len(term_tfs) < FUZZY_MIN_COVERAGE * len(set(tokens)):
+            return [], 0
+
+        counts = Counter(doc_id for tfs in term_tfs for doc_id in tfs)
+        best = max(counts.values())
+        matches = {doc_id for doc_id, count in counts.items() if count == best}
+        return self._rank(matches, term_tfs, top_k)
+
+    def _rank(self, matches: Set[int], term_tfs: List[Dict[int, float]],
+              top_k: int) -> Tuple[List[Tuple[int, float]], int]:
+        """
+        BM25-score `matches`, keep each article's best passage, then only a
+        top_k heap of articles. Returns (ranking, number of matching articles).
+        """
+        best: Dict = {}
+        for doc_id in matches:
+            score = sum(self.bm25(len(tfs), tfs[doc_id], doc_id) for tfs in term_tfs if doc_id in tfs)
+            # Ties keep file order: lower doc ids rank higher
+            entry = (score, -doc_id)
+            article = self.article_of(doc_id)
+            if entry > best.get(article, (-math.inf, 0)):
+                best[article] = entry
+
+        top = heapq.nlargest(top_k, best.values())
+        return [(-neg_id, round(score, 4)) for score, neg_id in top], len(best)
+
+    def search_many(self, queries: List[str], top_k: int) -> List[Tuple[List[Tuple[int, float]], int]]:
+        return [self.search(query, top_k) for query in queries]
+
+class _KBIndex(_KeywordSearch):
+    """
+    Inverted index over the normalized KB, built once per load.
+    - postings: term -> {doc id: title-boosted term frequency}
+    - gram_terms: character trigram -> vocabulary terms containing it, used to
+      resolve substring lookups without scanning the whole vocabulary
+    - doc_lens / avg_len: boosted document lengths for BM25 normalization
+
+    Doc ids are slots in `kb`; removed articles leave a None tombstone so the
+    remaining ids stay valid. A published index is never mutated: updated()
+    returns a copy-on-write snapshot that shares every untouched posting list.
+    """
+
+    def __init__(self, kb: List[Dict]):
+        self.kb: List[Optional[Dict]] = []
+        self.slots: Dict[str, int] = {}
+        self.texts: List[Optional[str]] = []
+        self.spans: List[Optional[List[Tuple[int, int]]]] = []
+        self.doc_lens: List[float] = []
+        self.total_len = 0.0
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.gram_terms: Dict[str, Set[str]] = {}
+        # Terms/grams whose containers this snapshot owns; None = owns everything
+        self._owned_terms: Optional[Set[str]] = None
+        self._owned_grams: Optional[Set[str]] = None
+
+        for key, item in _keyed(kb).items():
+            self.slots[key] = len(self.kb)
+            self.kb.append(None)
+            self.texts.append(None)
+            self.spans.append(None)
+            self.doc_lens.append(0.0)
+            self._add(self.slots[key], item)
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.slots)
+
+    @property
+    def avg_len(self) -> float:
+        return self.total_len / self.n_docs if self.n_docs else 0.0
+
+    def postings_of(self, term: str) -> Dict[int, float]:
+        return self.postings.get(term, {})
+
+    def gram_terms_of(self, gram: str) -> Set[str]:
+        return self.gram_terms.get(gram, set())
+
+    def vocabulary(self):
+        return self.postings.keys()
+
+    def doc_ids(self):
+        return self.slots.values()
+
+    def doc_len(self, doc_id: int) -> float:
+        return self.doc_lens[doc_id]
+
+    def text(self, doc_id: int) -> str:
+        return self.texts[doc_id]
+
+    def passages(self, doc_id: int) -> List[Tuple[int, int]]:
+        return self.spans[doc_id]
+
+    def article_of(self, doc_id: int):
+        # Unchunked docs get keys of their own, as in article_groups(): an
+        # integer article_id must not collide with a doc id
+        return self.kb[doc_id].get("article_id", ("doc", doc_id))
+
+    def updated(self, kb: List[Dict]) -> Tuple["_KBIndex", Dict[str, int]]:
+        """
+        Build the index for `kb` by applying only the added, changed and
+        removed articles to a copy-on-write snapshot of this one.
+        Returns (new index, {"added", "changed", "removed"} counts).
+        """
+        new_items = _keyed(kb)
+        removed = [key for key in self.slots if key not in new_items]
+        changed = [key for key, item in new_items.items()
+                   if key in self.slots and self.kb[self.slots[key]] != item]
+        added = [key for key in new_items if key not in self.slots]
+        stats = {"added": len(added), "changed": len(changed), "removed": len(removed)}
+
+        tombstones = len(self.kb) - self.n_docs + len(removed)
+        if tombstones > len(self.kb) // 2:
+            # Mostly holes: a fresh build is cheaper than carrying them around
+            return _KBIndex(kb), {**stats, "rebuilt": True}
+
+        snap = copy.copy(self)
+        snap.kb, snap.texts, snap.doc_lens = list(self.kb), list(self.texts), list(self.doc_lens)
+        snap.spans = list(self.spans)
+        snap.slots = dict(self.slots)
+        snap.postings, snap.gram_terms = dict(self.postings), dict(self.gram_terms)
+        snap._owned_terms, snap._owned_grams = set(), set()
+
+        for key in removed:
+            snap._remove(snap.slots.pop(key))
+        for key in changed:
+            # Re-index in place so the article keeps its position
+            snap._remove(snap.slots[key])
+            snap._add(snap.slots[key], new_items[key])
+        for key in added:
+            snap.slots[key] = len(snap.kb)
+            snap.kb.append(None)
+            snap.texts.append(None)
+            snap.spans.append(None)
+            snap.doc_lens.append(0.0)
+            snap._add(snap.slots[key], new_items[key])
+
+        snap._owned_terms = snap._owned_grams = None
+        return snap, stats
+
+    def _postings_for_write(self, term: str) -> Dict[int, float]:
+        postings = self.postings.get(term)
+        if postings is None:
+            postings = self.postings[term] = {}
+            for gram in _grams(term):
+                self._gram_terms_for_write(gram).add(term)
+        elif self._owned_terms is not None and term not in self._owned_terms:
+            postings = self.postings[term] = dict(postings)
+        if self._owned_terms is not None:
+            self._owned_terms.add(term)
+        return postings
+
+    def _gram_terms_for_write(self, gram: str) -> Set[str]:
+        terms = self.gram_terms.get(gram)
+        if terms is None:
+            terms = self.gram_terms[gram] = set()
+        elif self._owned_grams is not None and gram not in self._owned_grams:
+            terms = self.gram_terms[gram] = set(terms)
+        if self._owned_grams is not None:
+            self._owned_grams.add(gram)
+        return terms
+
+    def _add(self, doc_id: int, item: Dict):
+        text, freqs = _doc_freqs(item)
+        self.kb[doc_id] = item
+        self.texts[doc_id] = text
+        self.spans[doc_id] = passage_spans(item["content"])
+        self.doc_lens[doc_id] = sum(freqs.values())
+        self.total_len += self.doc_lens[doc_id]
+        for term, tf in freqs.items():
+            self._postings_for_write(term)[doc_id] = tf
+
+    def _remove(self, doc_id: int):
+        _, freqs = _doc_freqs(self.kb[doc_id])
+        for term in freqs:
+            postings = self._postings_for_write(term)
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+                for gram in _grams(term):
+                    terms = self._gram_terms_for_write(gram)
+                    terms.discard(term)
+                    if not terms:
+                        del self.gram_terms[gram]
+        self.total_len -= self.doc_lens[doc_id]
+        self.kb[doc_id] = None
+        self.texts[doc_id] = None
+        self.spans[doc_id] = None
+        self.doc_lens[doc_id] = 0.0
 
 class KBSearchTool:
-    def __init__(self, kb_path=KB_FILE):
-        self.kb_path = kb_path
+    def __init__(self, kb_path=None, backend=None):
+        self.kb_path = kb_path or os.getenv("KB_PATH", KB_FILE)
+        self.backend = backend or os.getenv("KB_BACKEND", "keyword")
+        if self.backend not in KB_BACKENDS:
+            raise ValueError(f"Unknown KB backend '{self.backend}', expected one of {KB_BACKENDS}")
+        self.version = 0
+        self.cache = LRUCache("kb_search", maxsize=KB_CACHE_SIZE, ttl=KB_CACHE_TTL)
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_stop = None
         self._load_kb()
 
     def _load_kb(self):
+        self._stamp = self._file_stamp()
+        if self._compiled:
+            # Memory-mapped: nothing to parse or build
+            self._index = self._build_index(None)
+            self.kb = self._index.kb
+            return
         if os.path.exists(self.kb_path):
             with open(self.kb_path, 'r') as f:
                 self.kb = json.load(f)
         else:
             self.kb = []
             logger.log_event("kb_tool.error", {"error": "KB file not found", "path": self.kb_path})
+        self._index = self._build_index(self.kb)
+
+    @property
+    def _compiled(self) -> bool:
+        return self.kb_path.endswith(INDEX_SUFFIX)
+
+    def _build_index(self, kb: Optional[List[Dict]]):
+        if self._compiled:
+            from tools.kb_index import MmapKBIndex
+            index = MmapKBIndex(self.kb_path)
+            if self.backend == "keyword":
+                return index
+            kb = list(index.kb)
+        if self.backend == "tfidf":
+            from tools.kb_tfidf import TfidfIndex
+            return TfidfIndex(kb)
+        if self.backend == "semantic":
+            from tools.kb_semantic import SemanticIndex
+            return SemanticIndex(kb)
+        return _KBIndex(kb)
+
+    def _file_stamp(self) -> Optional[Tuple[float, int]]:
+        try:
+            st = os.stat(self.kb_path)
+        except OSError:
+            return None
+        return (st.st_mtime, st.st_size)
+
+    def reload(self) -> Dict:
+        """
+        Re-read the KB file and bring the index up to date without a restart.
+        The keyword backend only re-indexes added/changed/removed articles;
+        the tfidf and semantic backends rebuild (IDF weights shift globally).
+        The new index is published with a single reference swap, so searches
+        already running keep using the snapshot they started with.
+        On a missing or invalid file the current index stays in place.
+        """
+        with self._reload_lock:
+            stamp = self._file_stamp()
+            try:
+                if self._compiled:
+                    # A recompiled file replaces the old one by rename, so the
+                    # previous mapping stays valid for in-flight searches
+                    kb = None
+                    index, stats = self._build_index(None), {"rebuilt": True}
+                else:
+                    with open(self.kb_path, 'r') as f:
+                        kb = json.load(f)
+            except (OSError, ValueError) as e:
+                # Remember the stamp anyway so the watcher doesn't retry a broken file in a loop
+                self._stamp = stamp
+                logger.log_event("kb_tool.reload.error", {"path": self.kb_path, "error": str(e)}, level="ERROR")
+                return {"ok": False, "version": self.version, "error": str(e)}
+
+            if kb is None:
+                kb = index.kb
+            elif isinstance(self._index, _KBIndex):
+                index, stats = self._index.updated(kb)
+            else:
+                index, stats = self._build_index(kb), {"rebuilt": True}
+
+            self._index = index
+            self.kb = kb
+            self._stamp = stamp
+            # Cached results are keyed on the version, so bumping it retires
+            # them; clearing just frees the memory right away
+            self.version += 1
+            self.cache.clear()
+
+        logger.log_event("kb_tool.reload", {"path": self.kb_path, "version": self.version, **stats})
+        return {"ok": True, "version": self.version, **stats}
+
+    def reload_if_changed(self) -> Optional[Dict]:
+        """reload() if the KB file's mtime/size changed since the last load, else None."""
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return None
+        return self.reload()
+
+    def start_watcher(self, interval: float = 2.0):
+        """Poll the KB file's mtime/size in a daemon thread and reload() on change."""
+        if self._watcher and self._watcher.is_alive():
+            return
+        stop = threading.Event()
+
+        def _watch():
+            while not stop.wait(interval):
+                self.reload_if_changed()
+
+        self._watcher_stop = stop
+        self._watcher = threading.Thread(target=_watch, name="kb-watcher", daemon=True)
+        self._watcher.start()
+        logger.log_event("kb_tool.watcher.start", {"path": self.kb_path, "interval_s": interval})
+
+    def stop_watcher(self):
+        if self._watcher_stop:
+            self._watcher_stop.set()
+        if self._watcher:
+            self._watcher.join()
+        self._watcher = self._watcher_stop = None
 
     @log_trace
-    def search(self, query: str) -> List[Dict]:
+    def search(self, query: str, top_k: int = MAX_RESULTS) -> List[Dict]:
         """
         Searches the knowledge base for relevant articles.
-        Token-based keyword matching with normalization for better recall.
+        Returns the top_k matches, best BM25 score first.
         """
-        # Normalize the query
-        normalized_query = normalize_query(query)
-        query_lower = normalized_query.lower()
-        
-        # Split query into meaningful tokens (filter out short words)
-        tokens = [t for t in query_lower.split() if len(t) > 2]
-        results = []
-        
-        for item in self.kb:
-            # Combine title and content for searching, normalize them too
-            combined = normalize_query(item["title"] + " " + item["content"]).lower()
-            
-            # Check if all tokens appear in the combined text
-            if tokens and all(tok in combined for tok in tokens):
-                results.append(item)
-            # Fallback: original substring match
-            elif query_lower in combined:
-                if item not in results:
-                    results.append(item)
-        
+        return [item for item, _ in self._retrieve(query, top_k)]
+
+    @log_trace
+    def search_scored(self, query: str, top_k: int = MAX_RESULTS) -> List[Tuple[Dict, float]]:
+        """Same as search(), but returns (article, score) pairs."""
+        return self._retrieve(query, top_k)
+
+    @log_trace
+    def search_many(self, queries: List[str], top_k: int = MAX_RESULTS) -> List[List[Dict]]:
+        """
+        Batch search: one result list per query, in input order. Cache misses
+        go to the index together; the tfidf backend answers them with a
+        single sparse matrix product.
+        """
+        # Read the version before the index: reload() swaps the index first,
+        # so results can never be cached under a newer version than their own
+        version = self.version
+        index = self._index
+        keys = [self._cache_key(version, query, top_k) for query in queries]
+        results = [self.cache.get(key) for key in keys]
+
+        misses = [i for i, cached in enumerate(results) if cached is None]
+        if misses:
+            batches = index.search_many([queries[i] for i in misses], top_k)
+            for i, (ranked, hits) in zip(misses, batches):
+                results[i] = ([(self._hit(index, doc_id, queries[i]), score) for doc_id, score in ranked], hits)
+                self.cache.set(keys[i], results[i])
+
+        logger.log_event("kb_tool.search_many", {
+            "queries": len(queries),
+            "backend": self.backend,
+            "hits": sum(hits for _, hits in results),
+            "cache_hits": len(queries) - len(misses),
+        })
+        return [[item for item, _ in scored] for scored, _ in results]
+
+    def _hit(self, index, doc_id: int, query: str) -> Dict:
+        """
+        The article for a result. Multi-passage articles come back as a copy
+        with "snippet" set to the passage(s) that best match the query and
+        "passage" to its [start, end) offsets in content.
+        """
+        item = index.kb[doc_id]
+        best = best_passages(item["content"], index.passages(doc_id), query)
+        if best is None:
+            return item
+        snippet, span = best
+        return {**item, "snippet": snippet, "passage": span}
+
+    def _cache_key(self, version: int, query: str, top_k: int) -> tuple:
+        return (version, normalize_query(query), top_k)
+
+    def _retrieve(self, query: str, top_k: int) -> List[Tuple[Dict, float]]:
+        version = self.version  # before the index, see search_many()
+        index = self._index
+        key = self._cache_key(version, query, top_k)
+        cached = self.cache.get(key)
+        cache_hit = cached is not None
+        if not cache_hit:
+            ranked, hits = index.search(query, top_k)
+            cached = ([(self._hit(index, doc_id, query), score) for doc_id, score in ranked], hits)
+            self.cache.set(key, cached)
+        scored, hits = cached
+
         # Log the search results count
-        logger.log_event("kb_tool.search", {"query": query, "hits": len(results)})
-        
-        return results[:3] # Return top 3
+        logger.log_event("kb_tool.search", {"query": query, "hits": hits, "cache": "hit" if cache_hit else "miss"})
+
+        return list(scored)
 
 # Global instance
 kb_tool = KBSearchTool()
@@ -1,16 +1,24 @@
+import asyncio
 from duckduckgo_search import DDGS
 from utils.observability import logger, log_trace
+from utils.query_normalizer import normalize_query
+from utils.singleflight import SingleFlight
 
 class WebSearchTool:
     def __init__(self):
         self.ddgs = DDGS()
+        # Concurrent searches for the same (normalized) query share one request
+        self.flight = SingleFlight("web_search")
 
     @log_trace
     def search(self, query: str, max_results: int = 5) -> list:
         """
         Search the web using DuckDuckGo.
-        Returns a list of dicts: {"title": str, "href": str, "body": str}
+        Returns a list of dicts: {"title": str, "url": str, "snippet": str, "source": "web"}
         """
+        return self.flight.do((normalize_query(query), max_results), self._search, query, max_results)
+
+    def _search(self, query: str, max_results: int) -> list:
         try:
             try:
                 # Try 'api' backend first (smarter, better ranking)
@@ -43,5 +51,12 @@ class WebSearchTool:
         print("-----------------------------------\n")
         return normalized_results
 
+    async def asearch(self, query: str, max_results: int = 5) -> list:
+        """
+        search() for async callers. DDGS only ships a blocking client, so it
+        runs in a worker thread (and is coalesced with the other threads).
+        """
+        return await asyncio.to_thread(self.search, query, max_results)
+
 # Global instance
 web_search_tool = WebSearchTool()
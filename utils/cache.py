@@ -0,0 +1,206 @@
+"""
+Caches shared by the KB search and agent layers: an in-process LRU, an
+SQLite-backed LRU that survives restarts, and a two-tier combination.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from utils.observability import logger
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with an optional TTL (seconds).
+    Hits, misses, evictions and expirations are kept on the instance
+    (stats()) and mirrored into the observability counters as
+    "cache.<name>.<event>".
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _count(self, event: str):
+        self._stats[event] += 1
+        logger.incr(f"cache.{self.name}.{event}")
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                self._count("expired")
+                entry = None
+            if entry is None:
+                self._count("misses")
+                return default
+            self._data.move_to_end(key)
+            self._count("hits")
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._count("evictions")
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+class DiskCache:
+    """
+    Size-bounded LRU with an optional TTL, persisted in an SQLite file.
+    Keys are strings, values anything JSON-serializable. Expiry uses wall
+    clock time so entries stay valid (or expire) across restarts. Stats are
+    mirrored into the observability counters like LRUCache's.
+
+    A hit doesn't write: access times are kept in memory and written in one
+    batch by the next set() (before it evicts), or once `touch_batch` keys
+    have piled up, so the LRU order on disk is current whenever it's used.
+    """
+
+    def __init__(self, name: str, path: str, maxsize: int = 10000, ttl: Optional[float] = None,
+                 touch_batch: int = 256):
+        self.name = name
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries "
+                         "(key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}  # key -> access time not yet written
+        self.touch_batch = touch_batch
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _count(self, event: str, n: int = 1):
+        self._stats[event] += n
+        logger.incr(f"cache.{self.name}.{event}", n)
+
+    def _flush_touched(self):
+        """Write buffered access times (caller holds the lock and commits)."""
+        if self._touched:
+            self._db.executemany("UPDATE entries SET accessed = ? WHERE key = ?",
+                                 [(accessed, key) for key, accessed in self._touched.items()])
+            self._touched.clear()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                self._touched.pop(key, None)
+                self._count("expired")
+                row = None
+            if row is None:
+                self._count("misses")
+                return default
+            self._touched[key] = now
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched()
+                self._db.commit()
+            self._count("hits")
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        if self.maxsize <= 0:
+            return
+        now = time.time()
+        expires = now + self.ttl if self.ttl else None
+        with self._lock:
+            self._flush_touched()
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                             (key, json.dumps(value), expires, now))
+            evicted = self._db.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.maxsize,)).rowcount
+            self._db.commit()
+            if evicted > 0:
+                self._count("evictions", evicted)
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        size = len(self)
+        with self._lock:
+            stats = dict(self._stats)
+        stats["size"] = size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+class TieredCache:
+    """
+    LRUCache in front of an optional DiskCache: memory misses fall through
+    to disk and disk hits are promoted back into memory; sets write both.
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return default if value is None else value
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        memory = self.memory.stats()
+        disk = self.disk.stats() if self.disk is not None else None
+        lookups = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + (disk["hits"] if disk else 0)
+        return {"memory": memory, "disk": disk,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
@@ -3,6 +3,7 @@ from logging.handlers import RotatingFileHandler
 import json
 import os
 import re
+import threading
 import time
 from datetime import datetime, timezone
 from colorama import Fore, Style, init
@@ -68,6 +69,20 @@ class EventLogger:
             ch.setFormatter(logging.Formatter('%(message)s'))
             self.logger.addHandler(ch)
 
+        # Named counters (cache hits, rule hits, ...), reported by /metrics
+        self._counters = {}
+        self._counters_lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1):
+        """Add `value` to the named counter."""
+        with self._counters_lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def counters(self, prefix: str = "") -> dict:
+        """Snapshot of the counters whose name starts with `prefix`."""
+        with self._counters_lock:
+            return {k: v for k, v in self._counters.items() if k.startswith(prefix)}
+
     def _now_iso(self):
         return datetime.now(timezone.utc).isoformat()
 
@@ -1,21 +1,69 @@
+"""
+Query normalization shared by KB indexing and search.
+- Lowercase
+- Punctuation and whitespace runs collapse to one space (one regex pass)
+- Synonyms/phrases rewritten in one pass of a single compiled alternation
+- Results for queries are memoized; indexing uses the uncached variant so
+  article text doesn't push hot queries out of the memo
+
+Synonyms default to DEFAULT_SYNONYMS and can be replaced with a JSON object
+of {"phrase": "replacement"} pointed to by QUERY_SYNONYMS_FILE. Rewrites are
+substring based ("themes" -> "modes"), longest phrase first. The KB index
+stores normalized terms, so rebuild it after changing the table.
+"""
+import json
+import os
 import re
+from functools import lru_cache
+from typing import Dict, Optional
+
+DEFAULT_SYNONYMS = {
+    "theme": "mode",
+    "how do i enable": "enable",
+    "how to enable": "enable",
+    "how can i": "",
+}
+
+NORMALIZER_CACHE_SIZE = int(os.getenv("QUERY_NORMALIZER_CACHE", "4096"))
+
+_NON_WORD = re.compile(r"\W+")  # punctuation and whitespace
+
+class QueryNormalizer:
+    def __init__(self, synonyms: Optional[Dict[str, str]] = None, cache_size: int = NORMALIZER_CACHE_SIZE):
+        synonyms = DEFAULT_SYNONYMS if synonyms is None else synonyms
+        # Keys are matched against normalized text, so normalize them too
+        self.synonyms = {" ".join(_NON_WORD.sub(" ", k.lower()).split()): v for k, v in synonyms.items()}
+        self.synonyms.pop("", None)
+        phrases = sorted(self.synonyms, key=len, reverse=True)
+        self._pattern = re.compile("|".join(map(re.escape, phrases))) if phrases else None
+        self.normalize = lru_cache(maxsize=cache_size)(self.normalize_text)
+
+    def normalize_text(self, text: str) -> str:
+        """Normalize without memoization (for article text)."""
+        text = _NON_WORD.sub(" ", text.lower())
+        if self._pattern is not None:
+            text = self._pattern.sub(lambda m: self.synonyms[m.group()], text)
+        return " ".join(text.split())
+
+def load_synonyms(path: str) -> Dict[str, str]:
+    with open(path, "r") as f:
+        synonyms = json.load(f)
+    if not isinstance(synonyms, dict):
+        raise ValueError(f"{path} must contain a JSON object of phrase -> replacement")
+    return {str(k): str(v) for k, v in synonyms.items()}
+
+def set_synonyms(synonyms: Dict[str, str]):
+    """Replace the shared synonym table (and drop memoized results)."""
+    global _normalizer
+    _normalizer = QueryNormalizer(synonyms)
+
+_SYNONYMS_FILE = os.getenv("QUERY_SYNONYMS_FILE")
+_normalizer = QueryNormalizer(load_synonyms(_SYNONYMS_FILE) if _SYNONYMS_FILE else None)
 
 def normalize_query(q: str) -> str:
-    """
-    Normalize query for better KB matching.
-    - Lowercase
-    - Remove punctuation
-    - Apply synonyms
-    - Collapse whitespace
-    """
-    q = q.lower().strip()
-    q = re.sub(r"[^\w\s]", " ", q)  # drop punctuation
-    q = re.sub(r"\s+", " ", q)       # collapse whitespace
-    
-    # Synonyms
-    q = q.replace("theme", "mode")
-    q = q.replace("how do i enable", "enable")
-    q = q.replace("how to enable", "enable")
-    q = q.replace("how can i", "")
-    
-    return q.strip()
+    """Normalize a query for KB matching (memoized)."""
+    return _normalizer.normalize(q)
+
+def normalize_text(text: str) -> str:
+    """Normalize KB article text the same way as queries, without memoization."""
+    return _normalizer.normalize_text(text)
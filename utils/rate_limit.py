@@ -0,0 +1,182 @@
+"""
+Per-user token-bucket rate limiting for the API.
+
+Each user_id gets a bucket of `burst` tokens refilled at `rate` tokens per
+second; a request takes one token or is refused with the number of seconds
+until one is available (HTTP 429 + Retry-After). Buckets live in a store:
+
+- MemoryBucketStore: in-process dict, the default; limits are per worker
+- RedisBucketStore:  one bucket per user shared by every worker/host, updated
+                     atomically by a Lua script (needs the redis package)
+
+Fair sharing of the slots that remain is done by the admission queue
+(app/scheduler.py); this module only caps how fast any one user can submit.
+"""
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from utils.observability import logger
+
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))  # 0 = off
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_STORES = ("memory", "redis")
+MAX_IDLE_BUCKETS = 10000  # memory store: full buckets beyond this are dropped
+
+
+class MemoryBucketStore:
+    """Token buckets in a dict; thread-safe, per process."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Take `cost` tokens; 0.0 if allowed, else seconds until they'd be available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (cost - tokens) / rate
+            if len(self._buckets) > MAX_IDLE_BUCKETS:
+                self._prune(now, rate, burst)
+        return wait
+
+    def refund(self, key: str, burst: float, cost: float = 1.0):
+        """Give back `cost` tokens a take() allowed but the caller didn't use."""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(burst, tokens + cost), updated)
+
+    def _prune(self, now: float, rate: float, burst: float):
+        # A bucket that has refilled completely is the same as no bucket
+        self._buckets = {k: v for k, v in self._buckets.items() if v[0] + (now - v[1]) * rate < burst}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# KEYS[1] = bucket, ARGV = rate, burst, cost. Uses the server clock so
+# every worker sees the same refill. Returns the wait in milliseconds.
+_TAKE_SCRIPT = """
+local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return math.ceil(wait * 1000)
+"""
+
+
+# KEYS[1] = bucket, ARGV = burst, cost. Gives back tokens a take() allowed;
+# a bucket that has already expired is full anyway.
+_REFUND_SCRIPT = """
+local burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+  redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(burst, tokens + cost)))
+end
+return 0
+"""
+
+
+class RedisBucketStore:
+    """Token buckets in Redis, shared by every API worker."""
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = "ratelimit:"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis rate-limit store requires redis (pip install redis)")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self._refund = self._client.register_script(_REFUND_SCRIPT)
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        return int(self._take(keys=[self.prefix + key], args=[rate, burst, cost])) / 1000
+
+    def refund(self, key: str, burst: float, cost: float = 1.0):
+        self._refund(keys=[self.prefix + key], args=[burst, cost])
+
+
+def make_store(kind: str = RATE_LIMIT_STORE):
+    if kind not in RATE_LIMIT_STORES:
+        raise ValueError(f"Unknown rate-limit store '{kind}', expected one of {RATE_LIMIT_STORES}")
+    return RedisBucketStore() if kind == "redis" else MemoryBucketStore()
+
+
+class RateLimiter:
+    """
+    Per-key request limit: `per_minute` sustained, `burst` at once.
+    Disabled (everything allowed) when per_minute is 0. If the store fails
+    (e.g. Redis is down) requests are let through rather than refused.
+    """
+
+    def __init__(self, per_minute: float = RATE_LIMIT_PER_MINUTE, burst: int = RATE_LIMIT_BURST,
+                 store: Optional[Any] = None):
+        self.per_minute = per_minute
+        self.burst = max(1, burst)
+        self.enabled = per_minute > 0
+        self.store = store if store is not None else (make_store() if self.enabled else None)
+        self._lock = threading.Lock()
+        self._stats = {"allowed": 0, "limited": 0, "errors": 0}
+
+    def _count(self, event: str):
+        with self._lock:
+            self._stats[event] += 1
+        logger.incr(f"rate_limit.{event}")
+
+    def acquire(self, key: str, cost: int = 1) -> Tuple[bool, int]:
+        """
+        (allowed, retry_after seconds) for a request from `key` worth `cost`
+        tickets (a batch). A cost above `burst` can never be allowed.
+        """
+        if not self.enabled:
+            return True, 0
+        try:
+            wait = self.store.take(key, self.per_minute / 60.0, self.burst, cost)
+        except Exception as e:
+            self._count("errors")
+            logger.log_event("rate_limit.error", {"error": str(e)}, level="ERROR")
+            return True, 0
+        if wait > 0:
+            self._count("limited")
+            return False, max(1, math.ceil(wait))
+        self._count("allowed")
+        return True, 0
+
+    def refund(self, key: str, cost: int = 1):
+        """Give back tokens acquire() took for work that was then rejected."""
+        if not self.enabled:
+            return
+        try:
+            self.store.refund(key, self.burst, cost)
+        except Exception as e:
+            self._count("errors")
+            logger.log_event("rate_limit.error", {"error": str(e)}, level="ERROR")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        return {"enabled": self.enabled, "per_minute": self.per_minute, "burst": self.burst,
+                "store": type(self.store).__name__ if self.store is not None else None, **stats}
@@ -0,0 +1,100 @@
+"""
+Request coalescing ("single flight") for slow upstream calls.
+
+While a call for a key is in flight, further calls with the same key don't
+start their own: they wait for the first one and all get its result (or
+its exception). Once it finishes the key is forgotten, so later calls go
+upstream again; pair with a cache to reuse results beyond that.
+
+    flight = SingleFlight("web_search")
+    results = flight.do(key, search, query)            # threads
+    draft = await flight.ado(key, generate, prompt)    # asyncio
+
+Thread and asyncio callers are coalesced separately. Calls, upstream
+executions and collapsed calls are kept in stats() and mirrored into the
+observability counters as "singleflight.<name>.<event>".
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from utils.observability import logger
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executed": 0, "collapsed": 0}
+
+    def _count(self, event: str):
+        self._stats[event] += 1  # under self._lock
+        logger.incr(f"singleflight.{self.name}.{event}")
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        """fn(*args), shared with every thread calling do() with `key` meanwhile."""
+        with self._lock:
+            self._count("calls")
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._count("executed")
+            else:
+                self._count("collapsed")
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn(*args)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def ado(self, key: Hashable, fn: Callable[..., Awaitable], *args) -> Any:
+        """
+        await fn(*args), shared with every coroutine calling ado() with `key`
+        meanwhile. The call runs as its own task, so cancelling one waiter
+        doesn't cancel it for the others.
+        """
+        with self._lock:
+            self._count("calls")
+            task = self._tasks.get(key)
+            if task is None:
+                task = self._tasks[key] = asyncio.ensure_future(fn(*args))
+                task.add_done_callback(lambda _: self._forget(key, task))
+                self._count("executed")
+            else:
+                self._count("collapsed")
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, so a failure nobody awaited isn't logged as lost
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls) + len(self._tasks)
+        stats["collapse_rate"] = round(stats["collapsed"] / stats["calls"], 4) if stats["calls"] else 0.0
+        return stats
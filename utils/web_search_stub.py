@@ -38,7 +38,8 @@ def web_search_stub(query: str, max_results: int = 3) -> Dict[str, Any]:
     normalized: List[Dict[str, Any]] = []
     for item in (kb_results or [])[:max_results]:
         title = item.get("title", "") if isinstance(item, dict) else ""
-        content = item.get("content", "") if isinstance(item, dict) else ""
+        # Prefer the passage KBSearchTool picked for this query over the article head
+        content = (item.get("snippet") or item.get("content", "")) if isinstance(item, dict) else ""
         url = item.get("url", "") if isinstance(item, dict) else ""
         snippet = content.strip().replace("\n", " ")
         if len(snippet) > MAX_SNIPPET_LEN: